@@ -1,10 +1,26 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import Device, DeviceLog, Data, ExtendUser, ProcessedData, Graph, New
+from .models import Anomaly, ConsumptionCube, Device, DeviceLog, Data, ExtendUser, ProcessedData, Graph, New
+from .db_router import reporting_reads
 
 # Register your models here.
 
 
+class ReplicaChangeListMixin:
+    """Read the changelist pages from the read replica, when configured."""
+
+    def changelist_view(self, request, extra_context=None):
+        if request.method != 'GET':
+            return super().changelist_view(request, extra_context)
+
+        with reporting_reads():
+            response = super().changelist_view(request, extra_context)
+            # O TemplateResponse avalia as querysets só ao renderizar
+            if hasattr(response, 'render'):
+                response.render()
+        return response
+
+
 class CustomUserAdmin(UserAdmin):
     fieldsets = (
         *UserAdmin.fieldsets,  # original form fieldsets, expanded
@@ -23,24 +39,34 @@ class CustomUserAdmin(UserAdmin):
     )
 
 
-class DevicesAdmin(admin.ModelAdmin):
+class DevicesAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = ['name', 'type',
                     'section', 'location', 'mac_address', 'ip_address', 'api_token', 'is_authorized']
     
-class DeviceLogsAdmin(admin.ModelAdmin):
+class DeviceLogsAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = ['device', 'mac_address', 'ip_address', 'api_token', 'is_authorized', 'created_at']
 
 
-class DataAdmin(admin.ModelAdmin):
+class DataAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = ['id', 'device', 'type', 'last_collection', 'total', 'collect_date']
 
-class ProcessedDataAdmin(admin.ModelAdmin):
+class ProcessedDataAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = ['id', 'device', 'interval', 'mean', 'median', 'std', 'cv', 'max', 'min', 'fq', 'tq', 'created_at']
 
-class GraphsAdmin(admin.ModelAdmin):
+class GraphsAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = ['id', 'device', 'type', 'file_path']
 
 
+class ConsumptionCubesAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
+    list_display = ['period_start', 'interval', 'device_type', 'section', 'location', 'total', 'samples']
+    list_filter = ['interval', 'device_type']
+
+
+class AnomaliesAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
+    list_display = ['detected_at', 'device', 'type', 'value', 'expected', 'z_score']
+    list_filter = ['type']
+
+
 class NewsAdmin(admin.ModelAdmin):
     list_display = ['id', 'user', 'message', 'created_at']
 
@@ -51,4 +77,6 @@ admin.site.register(DeviceLog, DeviceLogsAdmin)
 admin.site.register(Data, DataAdmin)
 admin.site.register(ProcessedData, ProcessedDataAdmin)
 admin.site.register(Graph, GraphsAdmin)
+admin.site.register(ConsumptionCube, ConsumptionCubesAdmin)
+admin.site.register(Anomaly, AnomaliesAdmin)
 admin.site.register(New, NewsAdmin)
@@ -0,0 +1,143 @@
+"""
+Time-bucketed aggregates computed by the database.
+
+`bucket_rows` groups readings by device and local hour or day
+(TruncHour/TruncDay in the current time zone) and returns count, sum, avg,
+min and max of `last_collection` per bucket from one GROUP BY query, so a
+bucket costs one row over the wire instead of every reading in it.
+
+`device_statistics` adds what SQL cannot compute portably (median,
+standard deviation, quartiles) with NumPy, over the values of a single
+query for all devices.
+
+Shared by the graph cron (aggregated GraphSpecs), the device charts, the
+rollup jobs, the consumption cubes, the exports and /api/aggregate.
+"""
+
+from itertools import groupby
+from operator import itemgetter
+
+import numpy
+from django.db.models import Avg, Count, Max, Min, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from .models import Data
+
+BUCKETS = {
+    'hour': TruncHour,
+    'day': TruncDay,
+}
+
+METRICS = ('count', 'sum', 'avg', 'min', 'max')
+
+# Linhas lidas por ida ao banco ao calcular quantis
+VALUES_CHUNK_SIZE = 5000
+
+
+def readings(device_ids=None, date_from=None, date_to=None, data_type=None):
+    """Data rows with a value, filtered by devices, [date_from, date_to) and type."""
+    queryset = Data.objects.filter(last_collection__isnull=False)
+    if device_ids is not None:
+        queryset = queryset.filter(device_id__in=device_ids)
+    if date_from is not None:
+        queryset = queryset.filter(collect_date__gte=date_from)
+    if date_to is not None:
+        queryset = queryset.filter(collect_date__lt=date_to)
+    if data_type is not None:
+        queryset = queryset.filter(type=data_type)
+    return queryset
+
+
+def bucket_rows(queryset, bucket, **dimensions):
+    """Aggregate a Data queryset per device and `bucket` ('hour' or 'day').
+
+    Returns a values queryset of {device_id, bucket, count, sum, avg, min,
+    max} ordered by device and bucket; `bucket` is an aware local datetime.
+    With `dimensions` (name=expression, e.g. section=F('device__section'))
+    rows are grouped by those instead of by device.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f"Unknown bucket '{bucket}'")
+
+    group = list(dimensions) or ['device_id']
+    trunc = BUCKETS[bucket]('collect_date', tzinfo=timezone.get_current_timezone())
+    return (
+        queryset.filter(last_collection__isnull=False)
+        .annotate(bucket=trunc, **dimensions)
+        .values(*group, 'bucket')
+        .annotate(
+            count=Count('id'),
+            sum=Sum('last_collection'),
+            avg=Avg('last_collection'),
+            min=Min('last_collection'),
+            max=Max('last_collection'),
+        )
+        .order_by(*group, 'bucket')
+    )
+
+
+def bucket_series(labels, queryset, bucket, metric='sum'):
+    """Chart series {label: (naive local datetime64, float64)} of one bucket metric.
+
+    `labels` maps device ids to trace names, as in app/graphs.py; devices
+    without readings get empty series.
+    """
+    points = {device_id: ([], []) for device_id in labels}
+    for device_id, start, value in bucket_rows(queryset.filter(device_id__in=list(labels)), bucket).values_list(
+        'device_id', 'bucket', metric,
+    ):
+        times, values = points[device_id]
+        times.append(timezone.localtime(start).replace(tzinfo=None))
+        values.append(value)
+
+    return {
+        labels[device_id]: (numpy.array(times, dtype='datetime64[us]'), numpy.array(values, dtype=numpy.float64))
+        for device_id, (times, values) in points.items()
+    }
+
+
+def summary_rows(queryset):
+    """Count, mean, min and max of `last_collection` per device, from one GROUP BY."""
+    return queryset.filter(last_collection__isnull=False).values('device_id').annotate(
+        count=Count('id'),
+        mean=Avg('last_collection'),
+        min=Min('last_collection'),
+        max=Max('last_collection'),
+    ).order_by()
+
+
+def value_rows(queryset):
+    """(device_id, last_collection) pairs ordered by device, for the quantiles."""
+    return queryset.filter(last_collection__isnull=False).order_by('device_id').values_list(
+        'device_id', 'last_collection',
+    )
+
+
+def device_statistics(queryset):
+    """Summary statistics of the values of a Data queryset, per device.
+
+    Returns {device_id: {count, mean, min, max, median, std, cv, fq, tq}}.
+    Count, mean, min and max come from a GROUP BY; median, standard
+    deviation (population, as numpy.std) and quartiles from NumPy.
+    """
+    statistics = {row['device_id']: row for row in summary_rows(queryset)}
+
+    values = value_rows(queryset).iterator(chunk_size=VALUES_CHUNK_SIZE)
+    for device_id, rows in groupby(values, key=itemgetter(0)):
+        # Dispositivo cuja primeira leitura chegou entre as duas consultas
+        if device_id not in statistics:
+            continue
+        array = numpy.fromiter((value for _, value in rows), dtype=numpy.float64)
+        fq, median, tq = (float(quantile) for quantile in numpy.quantile(array, [0.25, 0.5, 0.75]))
+        std = float(numpy.std(array))
+        mean = statistics[device_id]['mean']
+        statistics[device_id].update(
+            median=median,
+            std=std,
+            cv=std / mean if mean else None,
+            fq=fq,
+            tq=tq,
+        )
+
+    return statistics
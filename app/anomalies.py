@@ -0,0 +1,96 @@
+"""
+Online anomaly detection of the readings received by `storeData`.
+
+Each (device, data type) series keeps an exponentially weighted mean and
+variance (weight ANOMALY_ALPHA) in one `DetectorState` row, three numbers
+per series. A reading whose z-score against the state before it exceeds
+ANOMALY_Z_THRESHOLD, once the series has ANOMALY_WARMUP_SAMPLES readings,
+is stored as an `Anomaly` and counted in `morea_anomalies_total`, instead
+of showing up hours later in `ProcessedData`.
+
+`storeData` calls `observe` once its transaction commits, so rolled-back
+readings never move the baseline. The rows of the request are read with
+SELECT ... FOR UPDATE and written back in the same short transaction:
+every worker updates the same state, in order, at a constant cost per
+reading, and the state survives restarts.
+"""
+
+import math
+
+from django.conf import settings
+from django.db import transaction
+
+from .metrics import track_anomaly
+from .models import Anomaly, DetectorState, DeviceTypes
+
+
+def ewma_update(state, value, alpha):
+    """Feed `value` to a [mean, variance, samples] state, in place.
+
+    Returns the z-score of `value` against the state before the update.
+    """
+    mean, variance, samples = state
+    if not samples:
+        state[:] = [value, 0.0, 1]
+        return 0.0
+
+    diff = value - mean
+    # Séries constantes têm variância zero; o piso evita z infinito
+    z_score = diff / max(math.sqrt(variance), settings.ANOMALY_MIN_STD)
+    increment = alpha * diff
+    state[:] = [mean + increment, (1 - alpha) * (variance + diff * increment), samples + 1]
+    return z_score
+
+
+def _locked_states(device_id, data_types):
+    """{type: DetectorState} of the device, locked until the transaction ends."""
+    states = {
+        state.type: state
+        for state in DetectorState.objects.select_for_update().filter(device_id=device_id, type__in=data_types)
+    }
+    missing = set(data_types) - states.keys()
+    if missing:
+        # Primeira leitura da série; outro worker pode ter criado a linha ao mesmo tempo
+        for data_type in missing:
+            DetectorState.objects.get_or_create(device_id=device_id, type=data_type)
+        states.update(
+            (state.type, state)
+            for state in DetectorState.objects.select_for_update().filter(device_id=device_id, type__in=missing)
+        )
+    return states
+
+
+def observe(device_id, device_type, readings):
+    """Update the series of committed readings [(type, collect_date, value)].
+
+    Returns the anomalies stored.
+    """
+    readings = [(data_type, collected_at, value) for data_type, collected_at, value in readings if value is not None]
+    if not settings.ANOMALY_DETECTION or not readings:
+        return []
+
+    detected = []
+    with transaction.atomic():
+        states = _locked_states(device_id, {data_type for data_type, _, _ in readings})
+        for data_type, collected_at, value in readings:
+            state = states[data_type]
+            values = [state.mean, state.variance, state.samples]
+            warmed_up = state.samples >= settings.ANOMALY_WARMUP_SAMPLES
+            z_score = ewma_update(values, float(value), settings.ANOMALY_ALPHA)
+            if warmed_up and abs(z_score) >= settings.ANOMALY_Z_THRESHOLD:
+                detected.append(Anomaly(
+                    device_id=device_id,
+                    type=data_type,
+                    value=value,
+                    expected=state.mean,
+                    z_score=z_score,
+                    detected_at=collected_at,
+                ))
+            state.mean, state.variance, state.samples = values
+
+        DetectorState.objects.bulk_update(states.values(), ['mean', 'variance', 'samples'])
+        Anomaly.objects.bulk_create(detected)
+
+    for anomaly in detected:
+        track_anomaly(DeviceTypes(device_type).name, str(anomaly.type))
+    return detected
@@ -0,0 +1,248 @@
+"""
+Read API for downstream tools.
+
+    GET /api/devices
+    GET /api/readings?device=&type=&from=&to=&resolution=raw|hourly|daily
+    GET /api/aggregate?device=&type=&from=&to=&bucket=hour|day
+    GET /api/consumption?type=&section=&location=&from=&to=&interval=hourly|daily&group=
+
+Readings use the filters of the exports (app/exports.py); `hourly` and
+`daily` are served from the ProcessedData rollups. Pages are cursor-based
+and ordered by id, so any page costs one indexed range query. Aggregates
+of the raw readings are grouped by the database (app/aggregation.py);
+consumption per section and location is read from the cube only
+(app/consumption.py).
+
+Every response has a strong ETag built from the request and the id range
+of the matching rows. Readings and rollups are append-only, so a poll
+without new rows is answered with 304 after a single aggregate over the
+index, without reading the page.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.db.models import Count, Max, Min, Sum
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
+from rest_framework.pagination import CursorPagination
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .aggregation import BUCKETS, bucket_rows
+from .caching import cache_version
+from .db_router import reporting
+from .consumption import CUBE_DIMENSIONS
+from .exports import DATASETS, ExportError, column_name, dataset_queryset, date_range
+from .models import ConsumptionCube, Device, DeviceTypes, IntervalTypes
+
+# resolução: (dataset, intervalos dos rollups)
+RESOLUTIONS = {
+    'raw': ('data', ()),
+    'hourly': ('processed', (IntervalTypes.hourly,)),
+    'daily': ('processed', (IntervalTypes.daily,)),
+}
+
+CUBE_INTERVALS = {
+    'hourly': IntervalTypes.hourly,
+    'daily': IntervalTypes.daily,
+}
+
+CUBE_FIELDS = ('id', 'period_start', *CUBE_DIMENSIONS, 'total', 'samples')
+
+# Colunas aceitas em ?group= do consumo
+CUBE_GROUPS = ('period_start', *CUBE_DIMENSIONS)
+
+DEVICE_FIELDS = ('id', 'name', 'type', 'is_authorized', 'section', 'location', 'last_seen_at', 'last_value')
+
+
+class IdCursorPagination(CursorPagination):
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+
+    def get_page_size(self, request):
+        self.page_size = settings.API_PAGE_SIZE
+        self.max_page_size = settings.API_MAX_PAGE_SIZE
+        return super().get_page_size(request)
+
+
+class CubeCursorPagination(IdCursorPagination):
+    ordering = ('period_start', 'id')
+
+
+def _etag(request, *parts):
+    key = '|'.join(str(part) for part in (request.get_full_path(), *parts))
+    return quote_etag(hashlib.sha256(key.encode('utf-8')).hexdigest()[:32])
+
+
+def _not_modified(request, etag):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    return bool(if_none_match) and etag in parse_etags(if_none_match)
+
+
+def _with_etag(response, etag):
+    response.headers['ETag'] = etag
+    # Clientes e proxies revalidam sempre; sem dados novos a resposta é um 304
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _paginated_response(request, queryset, etag, serialize, pagination=IdCursorPagination):
+    if _not_modified(request, etag):
+        return _with_etag(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+
+    paginator = pagination()
+    page = paginator.paginate_queryset(queryset, request)
+    return _with_etag(paginator.get_paginated_response([serialize(row) for row in page]), etag)
+
+
+@api_view(['GET'])
+@renderer_classes([JSONRenderer])
+@permission_classes([IsAuthenticated])
+@reporting
+def devices(request):
+    queryset = Device.objects.all()
+    device_type = request.query_params.get('type', '')
+    if device_type:
+        if not device_type.isdigit() or int(device_type) not in DeviceTypes.values:
+            return Response({'message': 'invalid type.'}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = queryset.filter(type=int(device_type))
+
+    # Dispositivos mudam por save() (versão 'devices') ou por leituras (last_seen_at)
+    state = queryset.aggregate(count=Count('id'), last=Max('id'), seen=Max('last_seen_at'))
+    etag = _etag(request, cache_version('devices'), state['count'], state['last'], state['seen'])
+    return _paginated_response(request, queryset.values(*DEVICE_FIELDS), etag, dict)
+
+
+@api_view(['GET'])
+@renderer_classes([JSONRenderer])
+@permission_classes([IsAuthenticated])
+@reporting
+def readings(request):
+    resolution = request.query_params.get('resolution', 'raw')
+    if resolution not in RESOLUTIONS:
+        return Response({'message': 'invalid resolution.'}, status=status.HTTP_400_BAD_REQUEST)
+    dataset, intervals = RESOLUTIONS[resolution]
+
+    types = request.query_params.getlist('type')
+    if types and dataset != 'data':
+        # Os rollups agregam todas as leituras do dispositivo, sem distinção de tipo
+        return Response({'message': 'type only applies to raw readings.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        queryset = dataset_queryset(
+            dataset,
+            devices=request.query_params.getlist('device'),
+            types=types,
+            intervals=intervals,
+            date_from=request.query_params.get('from'),
+            date_to=request.query_params.get('to'),
+        )
+    except ExportError as error:
+        return Response({'message': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+    bounds = queryset.aggregate(first=Min('id'), last=Max('id'))
+    etag = _etag(request, bounds['first'], bounds['last'])
+
+    fields = DATASETS[dataset][2]
+    columns = {field: column_name(field) for field in fields}
+    return _paginated_response(
+        request,
+        queryset.values(*fields),
+        etag,
+        lambda row: {columns[field]: value for field, value in row.items()},
+    )
+
+
+@api_view(['GET'])
+@renderer_classes([JSONRenderer])
+@permission_classes([IsAuthenticated])
+@reporting
+def aggregate(request):
+    bucket = request.query_params.get('bucket', 'hour')
+    if bucket not in BUCKETS:
+        return Response({'message': 'invalid bucket.'}, status=status.HTTP_400_BAD_REQUEST)
+    if not request.query_params.get('from'):
+        return Response({'message': 'from is required.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        queryset = dataset_queryset(
+            'data',
+            devices=request.query_params.getlist('device'),
+            types=request.query_params.getlist('type'),
+            date_from=request.query_params.get('from'),
+            date_to=request.query_params.get('to'),
+        )
+    except ExportError as error:
+        return Response({'message': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+    bounds = queryset.aggregate(first=Min('id'), last=Max('id'))
+    etag = _etag(request, bounds['first'], bounds['last'])
+    if _not_modified(request, etag):
+        return _with_etag(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+
+    limit = settings.API_MAX_PAGE_SIZE
+    rows = list(bucket_rows(queryset, bucket)[:limit + 1])
+    if len(rows) > limit:
+        return Response(
+            {'message': f'more than {limit} buckets; narrow the range or the devices.'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    return _with_etag(Response({'bucket': bucket, 'results': rows}), etag)
+
+
+@api_view(['GET'])
+@renderer_classes([JSONRenderer])
+@permission_classes([IsAuthenticated])
+@reporting
+def consumption(request):
+    interval = request.query_params.get('interval', 'daily')
+    if interval not in CUBE_INTERVALS:
+        return Response({'message': 'invalid interval.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    group = [column for column in request.query_params.get('group', '').split(',') if column]
+    if any(column not in CUBE_GROUPS for column in group):
+        return Response({'message': 'invalid group.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    queryset = ConsumptionCube.objects.filter(interval=CUBE_INTERVALS[interval])
+    device_type = request.query_params.get('type', '')
+    if device_type:
+        if not device_type.isdigit() or int(device_type) not in DeviceTypes.values:
+            return Response({'message': 'invalid type.'}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = queryset.filter(device_type=int(device_type))
+    for dimension in ('section', 'location'):
+        if dimension in request.query_params:
+            queryset = queryset.filter(**{dimension: request.query_params[dimension]})
+    try:
+        queryset = queryset.filter(**date_range(
+            'period_start', request.query_params.get('from'), request.query_params.get('to'),
+        ))
+    except ExportError as error:
+        return Response({'message': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Células recalculadas são regravadas com ids novos
+    state = queryset.aggregate(count=Count('id'), last=Max('id'))
+    etag = _etag(request, state['count'], state['last'])
+
+    if not group:
+        return _paginated_response(request, queryset.values(*CUBE_FIELDS), etag, dict, CubeCursorPagination)
+
+    if _not_modified(request, etag):
+        return _with_etag(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+
+    limit = settings.API_MAX_PAGE_SIZE
+    rows = list(
+        queryset.values(*group)
+        .annotate(consumption=Sum('total'), readings=Sum('samples'))
+        .order_by(*group)[:limit + 1]
+    )
+    if len(rows) > limit:
+        return Response(
+            {'message': f'more than {limit} groups; narrow the range or the group.'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    return _with_etag(Response({'interval': interval, 'group': group, 'results': rows}), etag)
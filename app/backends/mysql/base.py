@@ -0,0 +1,42 @@
+"""
+MySQL backend whose connections come from a per-worker pool.
+
+Selected with DBTYPE=MySQL and DB_POOL_SIZE > 0 (see settings.py).
+"""
+
+from django.db.backends.mysql import base
+
+from app.backends.pool import get_pool
+
+
+def _is_healthy(conn):
+    try:
+        conn.ping()
+        return True
+    except Exception:
+        return False
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def _pool(self):
+        options = self.settings_dict.get('POOL', {})
+        return get_pool(self.alias, options.get('SIZE', 4), options.get('TIMEOUT', 10))
+
+    def get_new_connection(self, conn_params):
+        connect = super().get_new_connection
+        return self._pool().acquire(lambda: connect(conn_params), _is_healthy)
+
+    def _close(self):
+        if self.connection is None:
+            return
+
+        # Uma transação aberta ou conexão quebrada não pode voltar ao pool;
+        # fechada dentro de um atomic, a referência continua com o Django
+        reusable = not self.in_atomic_block
+        if reusable:
+            try:
+                self.connection.rollback()
+            except Exception:
+                reusable = False
+
+        self._pool().release(self.connection, reusable)
@@ -0,0 +1,87 @@
+"""
+Per-worker pool of raw database connections.
+
+Django keeps one connection per thread; the pool lets a gunicorn worker
+reuse the authenticated connections between requests and caps how many it
+opens at the same time, so a swarm of workers cannot exhaust the server.
+"""
+
+import queue
+import threading
+import time
+
+from app.metrics import track_pool_checkout, update_pool_stats
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, alias, size, timeout):
+        self.alias = alias
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._in_use = 0
+        self._lock = threading.Lock()
+
+    def _update_stats(self, delta):
+        with self._lock:
+            self._in_use += delta
+            update_pool_stats(self.alias, self._in_use, self._idle.qsize())
+
+    def acquire(self, connect, is_healthy):
+        """Return an idle healthy connection or open a new one with `connect`."""
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            track_pool_checkout(self.alias, time.monotonic() - started, 'timeout')
+            raise PoolExhausted(
+                f"no free connection in the '{self.alias}' pool after {self.timeout}s (size {self.size})"
+            )
+
+        try:
+            conn = None
+            while conn is None:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    conn = connect()
+                    break
+                if not is_healthy(conn):
+                    self._discard(conn)
+                    conn = None
+        except BaseException:
+            self._slots.release()
+            raise
+
+        track_pool_checkout(self.alias, time.monotonic() - started, 'ok')
+        self._update_stats(1)
+        return conn
+
+    def release(self, conn, reusable):
+        """Give `conn` back to the pool, or close it when it is not reusable."""
+        if reusable:
+            self._idle.put(conn)
+        else:
+            self._discard(conn)
+        self._slots.release()
+        self._update_stats(-1)
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, size, timeout):
+    with _pools_lock:
+        if alias not in _pools:
+            _pools[alias] = ConnectionPool(alias, size, timeout)
+        return _pools[alias]
@@ -0,0 +1,35 @@
+"""
+SQLite backend tuned for several gunicorn workers writing to one file.
+
+Selected with DBTYPE=SQLite3 and SQLITE_TUNED=True (see settings.py).
+"""
+
+from django.db.backends.sqlite3 import base
+
+# Aplicados em toda conexão nova; podem ser sobrescritos por DATABASES['default']['PRAGMAS']
+DEFAULT_PRAGMAS = {
+    # Leitores não bloqueiam o escritor e vice-versa
+    'journal_mode': 'WAL',
+    # Em WAL, NORMAL só sincroniza no checkpoint e continua consistente após queda
+    'synchronous': 'NORMAL',
+    # Espera o lock em vez de falhar com "database is locked"
+    'busy_timeout': 5000,
+    'mmap_size': 64 * 1024 * 1024,
+    # Negativo = tamanho em KiB
+    'cache_size': -16000,
+}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        pragmas = {**DEFAULT_PRAGMAS, **self.settings_dict.get('PRAGMAS', {})}
+        for name, value in pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        # Um BEGIN adiado pega o lock de escrita só no primeiro INSERT; se
+        # outro worker escreveu no meio, a transação falha sem esperar o
+        # busy_timeout. BEGIN IMMEDIATE reserva o lock já no início.
+        self.cursor().execute("BEGIN IMMEDIATE")
@@ -0,0 +1,93 @@
+"""
+Caching of the public pages.
+
+Cached pages and template fragments are keyed by the version of the data
+they show ('members', 'news', 'graphs', 'devices', 'consumption').
+app/signals.py bumps a version whenever one of the models behind it is
+saved or deleted (the consumption cubes bump theirs after each update), so
+stale entries are never read again and simply expire.
+
+Whole pages are cached for anonymous visitors only. Logged-in users get the
+page rendered for them, with the expensive fragments cached by version
+through `{% cache page_cache_seconds <name> cache_version %}`.
+
+With the default locmem backend each process has its own cache, so saves
+made by another process (cron, other gunicorn workers) only show up when the
+entry expires; use a file, redis or memcached backend (CACHE_BACKEND) for
+invalidation across workers and nodes.
+"""
+
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+def _version_key(namespace):
+    return f"cache-version:{namespace}"
+
+
+def cache_version(*namespaces):
+    """Token identifying the current version of the given namespaces."""
+    keys = [_version_key(namespace) for namespace in namespaces]
+    versions = cache.get_many(keys)
+    if len(versions) < len(keys):
+        for key in keys:
+            if key not in versions:
+                # add: entre processos concorrentes, o primeiro valor vence
+                cache.add(key, time.time_ns(), None)
+        versions = cache.get_many(keys)
+    return '.'.join(str(versions.get(key, 0)) for key in keys)
+
+
+def bump_versions(*namespaces):
+    """Invalidate everything cached for the given namespaces."""
+    version = time.time_ns()
+    cache.set_many({_version_key(namespace): version for namespace in namespaces}, None)
+
+
+def _is_cacheable_request(request):
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    # Mensagens pendentes (ex.: após logout) são exibidas uma única vez
+    if 'messages' in request.COOKIES:
+        return False
+    return not request.user.is_authenticated
+
+
+def cache_public_page(*namespaces):
+    """Cache the response of a view for anonymous visitors.
+
+    The key combines the full path, the active language and the version of
+    `namespaces`, the data the page shows.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not _is_cacheable_request(request):
+                return view(request, *args, **kwargs)
+
+            path_hash = hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest()
+            language = getattr(request, 'LANGUAGE_CODE', '')
+            key = f"page:{view.__name__}:{path_hash}:{language}:{cache_version(*namespaces)}"
+
+            response = cache.get(key)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code == 200 and not response.streaming and not response.cookies:
+                    cache.set(key, response, settings.PAGE_CACHE_SECONDS)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def fragment_context(*namespaces):
+    """Template variables used by the `{% cache %}` fragments of a page."""
+    return {
+        'cache_version': cache_version(*namespaces),
+        'page_cache_seconds': settings.PAGE_CACHE_SECONDS,
+    }
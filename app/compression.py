@@ -0,0 +1,79 @@
+"""
+Pre-compressed variants of the files served by the application.
+
+Graph files are compressed when they are written and static files at
+collectstatic time (app/storage.py), so requests never compress anything:
+`app.file_serving` picks `name.br` or `name.gz` next to the file according
+to Accept-Encoding.
+
+Brotli is optional: without the `brotli` package only gzip variants are
+written.
+"""
+
+import gzip
+import os
+import tempfile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Imagens e fontes já são comprimidas; não vale a pena gerar variantes
+COMPRESSIBLE_EXTENSIONS = {'.html', '.css', '.js', '.json', '.map', '.svg', '.txt', '.xml', '.csv'}
+
+# Abaixo disso o cabeçalho gzip anula o ganho
+MIN_COMPRESS_SIZE = 256
+
+# Sufixo de cada codificação, na ordem de preferência do servidor
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def atomic_write(path, data):
+    """Write `data` to `path` through a temporary file and a rename.
+
+    Readers see either the old or the new file, never a partial one.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(descriptor, 'wb') as temp_file:
+            temp_file.write(data)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def is_compressible(path):
+    return os.path.splitext(path)[1].lower() in COMPRESSIBLE_EXTENSIONS
+
+
+def compress_variants(data):
+    """Return {suffix: compressed bytes} for the available encodings."""
+    variants = {}
+    # mtime=0: o mesmo conteúdo gera sempre o mesmo .gz
+    variants['.gz'] = gzip.compress(data, compresslevel=9, mtime=0)
+    if brotli is not None:
+        variants['.br'] = brotli.compress(data, quality=11)
+    return variants
+
+
+def write_compressed(path, data=None):
+    """Write the compressed variants of `path`, or remove stale ones.
+
+    Variants that would not be smaller than the file are not kept.
+    """
+    if data is None:
+        with open(path, 'rb') as source:
+            data = source.read()
+
+    variants = compress_variants(data) if is_compressible(path) and len(data) >= MIN_COMPRESS_SIZE else {}
+    for _, suffix in ENCODINGS:
+        compressed = variants.get(suffix)
+        if compressed is not None and len(compressed) < len(data):
+            atomic_write(path + suffix, compressed)
+        elif os.path.exists(path + suffix):
+            os.unlink(path + suffix)
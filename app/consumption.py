@@ -0,0 +1,147 @@
+"""
+Consumption cubes: totals per device type, section and location for every
+local hour and day (ConsumptionCube).
+
+`updateConsumptionCubes` runs after the hourly rollups. It only recomputes
+the hours since the newest hourly cell (minus CONSUMPTION_CUBE_LATE_HOURS,
+for readings that arrive late), with one GROUP BY over those readings, and
+derives the daily cells of the touched days from the hourly cells. The
+dashboard panels and /api/consumption read only the cube, so "water per
+floor" costs a scan of a few cells instead of every reading.
+
+Only cumulative measures (volume, kWh) are consumption; power and current
+readings are left out.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max, Sum, Value
+from django.db.models.functions import Coalesce, TruncDay
+from django.utils import timezone
+
+from .aggregation import bucket_rows, readings
+from .caching import bump_versions
+from .db_router import pinned_to_primary, reporting
+from .models import ConsumptionCube, DataTypes, DeviceTypes, IntervalTypes
+
+CONSUMPTION_DATA_TYPES = (DataTypes.volume, DataTypes.kwh)
+
+# Painéis do dashboard: título e unidade do consumo de cada tipo de dispositivo
+CONSUMPTION_PANELS = {
+    DeviceTypes.water: ('Água', 'L'),
+    DeviceTypes.energy: ('Energia', 'kWh'),
+    DeviceTypes.gas: ('Gás', 'm³'),
+}
+
+CUBE_DIMENSIONS = ('device_type', 'section', 'location')
+
+
+def _hour_start(moment):
+    return timezone.localtime(moment).replace(minute=0, second=0, microsecond=0)
+
+
+def _day_start(moment):
+    return timezone.localtime(moment).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _recompute_from(now):
+    """Start of the first hour to recompute."""
+    with pinned_to_primary():
+        newest = ConsumptionCube.objects.filter(interval=IntervalTypes.hourly).aggregate(
+            newest=Max('period_start'),
+        )['newest']
+
+    if newest is None:
+        return _hour_start(now - timedelta(days=settings.CONSUMPTION_CUBE_BACKFILL_DAYS))
+    return _hour_start(newest - timedelta(hours=settings.CONSUMPTION_CUBE_LATE_HOURS))
+
+
+def _hourly_cells(date_from):
+    rows = bucket_rows(
+        # Leituras sem dispositivo não têm tipo; device_type da célula é obrigatório
+        readings(date_from=date_from).filter(device__isnull=False, type__in=CONSUMPTION_DATA_TYPES),
+        'hour',
+        device_type=F('device__type'),
+        section=Coalesce('device__section', Value('')),
+        location=Coalesce('device__location', Value('')),
+    )
+    return [
+        ConsumptionCube(
+            interval=IntervalTypes.hourly,
+            period_start=row['bucket'],
+            total=row['sum'],
+            samples=row['count'],
+            **{dimension: row[dimension] for dimension in CUBE_DIMENSIONS},
+        )
+        for row in rows
+    ]
+
+
+def _daily_cells(date_from):
+    rows = (
+        ConsumptionCube.objects.filter(interval=IntervalTypes.hourly, period_start__gte=date_from)
+        .annotate(day=TruncDay('period_start', tzinfo=timezone.get_current_timezone()))
+        .values('day', *CUBE_DIMENSIONS)
+        .annotate(day_total=Sum('total'), day_samples=Sum('samples'))
+        .order_by()
+    )
+    return [
+        ConsumptionCube(
+            interval=IntervalTypes.daily,
+            period_start=row['day'],
+            total=row['day_total'],
+            samples=row['day_samples'],
+            **{dimension: row[dimension] for dimension in CUBE_DIMENSIONS},
+        )
+        for row in rows
+    ]
+
+
+def _replace_cells(interval, date_from, cells):
+    # Células recalculadas substituem as antigas; um dispositivo que mudou de
+    # seção deixa de contar na célula anterior
+    ConsumptionCube.objects.filter(interval=interval, period_start__gte=date_from).delete()
+    ConsumptionCube.objects.bulk_create(cells)
+
+
+@reporting
+def updateConsumptionCubes(now=None):
+    """Recompute the hourly cells since the last run and the daily cells of their days."""
+    now = now or timezone.now()
+    hours_from = _recompute_from(now)
+    days_from = _day_start(hours_from)
+
+    hourly = _hourly_cells(hours_from)
+    with pinned_to_primary(), transaction.atomic():
+        _replace_cells(IntervalTypes.hourly, hours_from, hourly)
+        # Lido no primário: inclui as células por hora recém-gravadas
+        _replace_cells(IntervalTypes.daily, days_from, _daily_cells(days_from))
+
+    bump_versions('consumption')
+    return len(hourly)
+
+
+def consumption_by_place(since, interval=IntervalTypes.hourly, **filters):
+    """Totals per (device type, section, location) since `since`, read from the cube."""
+    return (
+        ConsumptionCube.objects.filter(interval=interval, period_start__gte=since, **filters)
+        .values(*CUBE_DIMENSIONS)
+        .annotate(consumption=Sum('total'), readings=Sum('samples'))
+        .order_by('device_type', '-consumption', 'section', 'location')
+    )
+
+
+def consumption_panels(now=None):
+    """Dashboard panels: consumption per section and location in the last 24 hours."""
+    since = _hour_start(now or timezone.now()) - timedelta(hours=23)
+    rows = {device_type: [] for device_type in CONSUMPTION_PANELS}
+    for row in consumption_by_place(since):
+        if row['device_type'] in rows:
+            rows[row['device_type']].append(row)
+
+    return [
+        {'title': title, 'unit': unit, 'rows': rows[device_type]}
+        for device_type, (title, unit) in CONSUMPTION_PANELS.items()
+    ]
@@ -1,37 +1,41 @@
-from app.models import Device, Data, ProcessedData
+from app.models import Device, IntervalTypes, ProcessedData
+from app.aggregation import device_statistics, readings
+from app.consumption import updateConsumptionCubes
+from app.db_router import reporting
 from django.utils import timezone
 from datetime import timedelta
-import numpy
 
 def run():
     processData(1)
 
-def processData(time):
+def hourlyDataProcessing():
+    processData(1, IntervalTypes.hourly)
+    updateConsumptionCubes()
+
+def dailyDataProcessing():
+    processData(24, IntervalTypes.daily)
+
+@reporting
+def processData(time, interval=IntervalTypes.notSelected):
     timeCounter = timezone.now() - timedelta(hours=time)
-    devices = Device.objects.all().filter(is_authorized=2)
+    devices = list(Device.objects.all().filter(is_authorized=2).values_list('id', flat=True))
 
-    for device in devices:
-        try:
-            deviceData = list(Data.objects.values_list('last_collection', flat=True).filter(
-                device=device, collect_date__gte=timeCounter))
-            # Função __gte = greater than or equal, compara a data.
-            
-            if len(deviceData) != 0:
-                mean = numpy.mean(deviceData)
-                median = numpy.median(deviceData)
-                std = numpy.std(deviceData)
-                cv = std / mean
-                max = numpy.amax(deviceData)
-                min = numpy.amin(deviceData)
-                fq = numpy.quantile(deviceData, 0.25)
-                tq = numpy.quantile(deviceData, 0.75)
+    # Contagem, média, mínimo e máximo agrupados no banco; mediana, desvio e quartis com NumPy
+    statistics = device_statistics(readings(device_ids=devices, date_from=timeCounter))
 
-                processedData = ProcessedData(device=device, mean=mean, median=median, std=std, cv=cv, max=max, min=min, fq=fq, tq=tq)
-                processedData.save()
-            else:
-                processedData = ProcessedData(device=device, mean=None, median=None, std=None, cv=None, max=None, min=None, fq=None, tq=None)
-                processedData.save()
-                
-        except:
-            print('data processing error')
-            pass
\ No newline at end of file
+    processedData = []
+    for device_id in devices:
+        stats = statistics.get(device_id, {})
+        processedData.append(ProcessedData(
+            device_id=device_id,
+            interval=interval,
+            mean=stats.get('mean'),
+            median=stats.get('median'),
+            std=stats.get('std'),
+            cv=stats.get('cv'),
+            max=stats.get('max'),
+            min=stats.get('min'),
+            fq=stats.get('fq'),
+            tq=stats.get('tq'),
+        ))
+    ProcessedData.objects.bulk_create(processedData)
@@ -0,0 +1,12 @@
+from django.db import connection
+
+
+def sqliteMaintenance():
+    """Checkpoint the WAL file and refresh the query planner statistics."""
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        # TRUNCATE devolve o -wal ao tamanho zero depois de copiar as páginas
+        cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        cursor.execute("PRAGMA optimize")
@@ -0,0 +1,68 @@
+"""
+Database router for the optional read replica.
+
+Only reads explicitly marked as reporting (dashboards, device listing,
+admin changelists and cron jobs) go to the replica; ingest, auth and every
+write stay on the primary. A request that follows a write from the same
+browser is pinned to the primary (see ReplicaRoutingMiddleware) so admins
+see their own edits even when the replica lags.
+"""
+
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+
+REPLICA = 'replica'
+
+# Tabelas lidas pelo login e pela sessão nunca vão para a réplica
+PRIMARY_ONLY_APPS = ('auth', 'sessions', 'contenttypes', 'admin')
+
+_reporting = contextvars.ContextVar('morea_reporting_reads', default=False)
+_pinned = contextvars.ContextVar('morea_pinned_to_primary', default=False)
+
+
+@contextmanager
+def reporting_reads():
+    """Send the reads made inside the block to the replica, when configured."""
+    token = _reporting.set(True)
+    try:
+        yield
+    finally:
+        _reporting.reset(token)
+
+
+def reporting(func):
+    """Decorator version of `reporting_reads` for views and cron jobs."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with reporting_reads():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def pinned_to_primary():
+    """Ignore `reporting_reads` inside the block (read-your-writes)."""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if REPLICA not in settings.DATABASES or not _reporting.get() or _pinned.get():
+            return 'default'
+        if model._meta.label == settings.AUTH_USER_MODEL or model._meta.app_label in PRIMARY_ONLY_APPS:
+            return 'default'
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Réplica e primário têm os mesmos dados
+        return True
@@ -0,0 +1,142 @@
+"""
+Per-device charts shown on device_detail.
+
+Charts are rendered on the first request for a (device, range) and kept in
+the cache under a key that includes the device's data version, so a new
+reading or rollup invalidates them without any explicit delete. While one
+request renders, concurrent requests get the previous chart of the same
+range (or wait for the new one), so a popular device does not trigger a
+render per request.
+"""
+
+from datetime import timedelta
+import time
+
+import numpy
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .aggregation import bucket_series, readings
+from .graph_specs import COLLECTION_UNITS
+from .graphs import _device_windows, _line_chart_figure, _local_datetimes, _local_series
+from .models import Data, IntervalTypes, ProcessedData
+
+# Janela e fonte preferida de cada intervalo; sem rollups recentes o gráfico usa as
+# médias por hora/dia calculadas no banco (ou as leituras brutas, nos intervalos curtos)
+DEVICE_CHART_RANGES = {
+    '1h': (timedelta(hours=1), None),
+    '24h': (timedelta(days=1), None),
+    '7d': (timedelta(days=7), IntervalTypes.hourly),
+    '30d': (timedelta(days=30), IntervalTypes.daily),
+}
+
+DEFAULT_DEVICE_CHART_RANGE = '24h'
+
+# Rollups mais antigos que dois períodos indicam que o cron parou: usa as leituras brutas
+ROLLUP_PERIODS = {
+    IntervalTypes.hourly: timedelta(hours=1),
+    IntervalTypes.daily: timedelta(days=1),
+}
+
+ROLLUP_BUCKETS = {
+    IntervalTypes.hourly: 'hour',
+    IntervalTypes.daily: 'day',
+}
+
+# Intervalo entre consultas ao cache enquanto outra requisição renderiza
+_WAIT_STEP_SECONDS = 0.05
+
+
+def _chart_source(device_id, range_key):
+    """Return (rollup interval or None, data version) for a device chart.
+
+    The version is the id of the newest row of the chosen source, read
+    through the (device, collect_date) and (device, created_at) indexes.
+    """
+    _, interval = DEVICE_CHART_RANGES[range_key]
+    if interval is not None:
+        rollups = ProcessedData.objects.filter(device_id=device_id, interval=interval)
+        last_rollup = rollups.order_by('-created_at').values_list('id', 'created_at').first()
+        if last_rollup and last_rollup[1] >= timezone.now() - 2 * ROLLUP_PERIODS[interval]:
+            return interval, f"p{last_rollup[0]}"
+
+    last_reading = Data.objects.filter(device_id=device_id).order_by('-collect_date').values_list('id', flat=True).first()
+    return None, f"d{last_reading or 0}"
+
+
+def _device_series(device, window, interval, averaged=None):
+    """Series of a device from its `interval` rollups or, without one, from
+    its readings averaged per `averaged` period by the database or raw."""
+    date_from = timezone.now() - window
+    label = device.name or f"Dispositivo {device.id}"
+
+    if interval is None and averaged is not None:
+        return bucket_series(
+            {device.id: f"{label} ({IntervalTypes(averaged).label.lower()})"},
+            readings(date_from=date_from),
+            ROLLUP_BUCKETS[averaged],
+            'avg',
+        )
+
+    if interval is None:
+        return _local_series({device.id: label}, _device_windows([device.id], date_from), date_from)
+
+    rollups = list(
+        ProcessedData.objects.filter(device=device, interval=interval, created_at__gte=date_from)
+        .order_by('created_at')
+        .values_list('created_at', 'mean')
+    )
+    epochs = numpy.asarray([created_at.timestamp() for created_at, _ in rollups], dtype=numpy.float64)
+    means = numpy.asarray([mean for _, mean in rollups], dtype=numpy.float64)
+    return {f"{label} ({IntervalTypes(interval).label.lower()})": (_local_datetimes(epochs), means)}
+
+
+def _render_device_chart(device, range_key, interval):
+    window, preferred = DEVICE_CHART_RANGES[range_key]
+    fig = _line_chart_figure(
+        _device_series(device, window, interval, preferred),
+        COLLECTION_UNITS.get(device.type, ''),
+        window,
+    )
+    # Fragmento: a página de detalhes carrega o plotly.js uma única vez
+    return fig.to_html(
+        full_html=False,
+        include_plotlyjs=False,
+        config={'displayModeBar': False, 'responsive': True},
+    )
+
+
+def device_chart(device, range_key=DEFAULT_DEVICE_CHART_RANGE):
+    """Return the chart HTML fragment of a device for one of DEVICE_CHART_RANGES."""
+    interval, version = _chart_source(device.id, range_key)
+    cache_key = f"device-chart:{device.id}:{range_key}:{version}"
+    latest_key = f"device-chart:{device.id}:{range_key}:latest"
+
+    html = cache.get(cache_key)
+    if html is not None:
+        return html
+
+    lock_key = f"{cache_key}:lock"
+    if cache.add(lock_key, 1, settings.DEVICE_CHART_LOCK_SECONDS):
+        try:
+            html = _render_device_chart(device, range_key, interval)
+            cache.set_many({cache_key: html, latest_key: html}, settings.DEVICE_CHART_CACHE_SECONDS)
+        finally:
+            cache.delete(lock_key)
+        return html
+
+    # Outra requisição já está renderizando: serve a versão anterior, se houver
+    stale = cache.get(latest_key)
+    if stale is not None:
+        return stale
+
+    deadline = time.monotonic() + settings.DEVICE_CHART_LOCK_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(_WAIT_STEP_SECONDS)
+        html = cache.get(cache_key)
+        if html is not None:
+            return html
+
+    # Quem tinha o lock falhou ou demorou demais
+    return _render_device_chart(device, range_key, interval)
@@ -0,0 +1,242 @@
+"""
+Streaming exports of `Data`, `ProcessedData` and of hourly/daily aggregates
+of `Data` (CSV or NDJSON).
+
+Rows are read in batches of EXPORT_BATCH_SIZE by primary key (id > last id
+of the previous batch) and written out as soon as each batch is formatted,
+so memory stays constant however many rows are exported. Each batch is a
+short indexed query: no server-side cursor is kept open while the client
+downloads, and MySQL drivers, which buffer the whole result of a query
+client-side, never see more than one batch. Aggregates are grouped by the
+database (app/aggregation.py), one row per device and hour or day.
+
+Used by the /api/export view and by the `export_data` command; the read
+API (app/api.py) shares the filters.
+"""
+
+import csv
+import io
+import json
+import zlib
+from itertools import islice
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .aggregation import METRICS, bucket_rows
+from .db_router import reporting_reads
+from .models import Data, DataTypes, IntervalTypes, ProcessedData
+
+# dataset: (modelo, coluna de data, colunas exportadas)
+DATASETS = {
+    'data': (Data, 'collect_date', (
+        'id', 'device_id', 'device__name', 'type', 'last_collection', 'total', 'collect_date',
+    )),
+    'processed': (ProcessedData, 'created_at', (
+        'id', 'device_id', 'device__name', 'interval',
+        'mean', 'median', 'std', 'cv', 'max', 'min', 'fq', 'tq', 'created_at',
+    )),
+}
+
+# dataset agregado: intervalo de app/aggregation.py; aceita os filtros de 'data'
+BUCKET_DATASETS = {
+    'hourly': 'hour',
+    'daily': 'day',
+}
+BUCKET_COLUMNS = ('device_id', 'bucket', *METRICS)
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+
+class ExportError(ValueError):
+    """Invalid export parameters."""
+
+
+def column_name(field):
+    return field.replace('__', '_')
+
+
+def _is_date(value):
+    return len(value) == len('YYYY-MM-DD')
+
+
+def _parse_bound(value, end=False):
+    """Aware datetime for a date or datetime parameter, or None.
+
+    A date `end` becomes the start of the next day, to be compared with `<`.
+    """
+    if not value:
+        return None
+
+    try:
+        # parse_datetime também aceita uma data sem hora (meia-noite)
+        day = parse_date(value) if _is_date(value) else None
+        moment = None if day else parse_datetime(value)
+    except ValueError:
+        day = moment = None
+
+    if day is not None:
+        moment = datetime.combine(day + timedelta(days=1) if end else day, time.min)
+    elif moment is None:
+        raise ExportError(f"invalid date '{value}'.")
+
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def date_range(field, date_from=None, date_to=None):
+    """Lookups selecting `field` between ISO date or datetime bounds; a date `date_to` is inclusive."""
+    lookups = {}
+    start = _parse_bound(date_from)
+    if start is not None:
+        lookups[f"{field}__gte"] = start
+    end = _parse_bound(date_to, end=True)
+    if end is not None:
+        # Data sem hora: até o fim do dia; com hora: até o instante informado
+        lookups[f"{field}__{'lt' if _is_date(date_to) else 'lte'}"] = end
+    return lookups
+
+
+def _parse_ids(values, name):
+    try:
+        return [int(value) for value in values]
+    except (TypeError, ValueError):
+        raise ExportError(f"invalid {name}.")
+
+
+def dataset_queryset(dataset, devices=(), types=(), intervals=(), date_from=None, date_to=None):
+    """Rows of `dataset` matching the filters, as a model queryset.
+
+    `date_from`/`date_to` are ISO dates or datetimes; a date `date_to` is
+    inclusive. `types` applies to raw data and `intervals` to processed data.
+    """
+    if dataset not in DATASETS:
+        raise ExportError(f"invalid dataset '{dataset}'.")
+    model, date_field, _ = DATASETS[dataset]
+
+    queryset = model.objects.all()
+    device_ids = _parse_ids(devices, 'device')
+    if device_ids:
+        queryset = queryset.filter(device_id__in=device_ids)
+
+    if dataset == 'data':
+        data_types = _parse_ids(types, 'type')
+        if any(data_type not in DataTypes.values for data_type in data_types):
+            raise ExportError("invalid type.")
+        if data_types:
+            queryset = queryset.filter(type__in=data_types)
+    else:
+        interval_types = _parse_ids(intervals, 'interval')
+        if any(interval not in IntervalTypes.values for interval in interval_types):
+            raise ExportError("invalid interval.")
+        if interval_types:
+            queryset = queryset.filter(interval__in=interval_types)
+
+    return queryset.filter(**date_range(date_field, date_from, date_to))
+
+
+def export_columns(dataset):
+    if dataset in BUCKET_DATASETS:
+        return BUCKET_COLUMNS
+    return tuple(column_name(field) for field in DATASETS[dataset][2])
+
+
+def export_queryset(dataset, **filters):
+    """Rows of an export dataset as a values_list of `export_columns(dataset)`.
+
+    Model datasets are ordered by id; aggregates by device and bucket.
+    """
+    if dataset in BUCKET_DATASETS:
+        filters.pop('intervals', None)
+        readings = dataset_queryset('data', **filters)
+        return bucket_rows(readings, BUCKET_DATASETS[dataset]).values_list(*BUCKET_COLUMNS)
+    return dataset_queryset(dataset, **filters).order_by('id').values_list(*DATASETS[dataset][2])
+
+
+def _batches(queryset, batch_size):
+    """Rows of `queryset` (ordered by id, id first) in keyset batches."""
+    last_id = None
+    while True:
+        page = queryset if last_id is None else queryset.filter(id__gt=last_id)
+        with reporting_reads():
+            rows = list(page[:batch_size])
+        if not rows:
+            return
+        yield rows
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1][0]
+
+
+def _grouped_batches(queryset, batch_size):
+    """Rows of a GROUP BY queryset, fetched `batch_size` at a time from one query."""
+    rows = queryset.iterator(chunk_size=batch_size)
+    while True:
+        with reporting_reads():
+            batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _csv_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _format_csv(columns, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in batches:
+        writer.writerows([_csv_value(value) for value in row] for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _format_ndjson(columns, batches):
+    for rows in batches:
+        yield ''.join(
+            json.dumps(dict(zip(columns, (_csv_value(value) for value in row)))) + '\n'
+            for row in rows
+        )
+
+
+def export_stream(dataset, queryset, file_format, compress=False, batch_size=None):
+    """Iterator of byte chunks with the rows of `export_queryset(dataset, ...)`."""
+    if file_format not in FORMATS:
+        raise ExportError(f"invalid format '{file_format}'.")
+
+    batch_size = batch_size or settings.EXPORT_BATCH_SIZE
+    if dataset in BUCKET_DATASETS:
+        batches = _grouped_batches(queryset, batch_size)
+    else:
+        batches = _batches(queryset, batch_size)
+    columns = export_columns(dataset)
+    formatter = _format_csv if file_format == 'csv' else _format_ndjson
+    chunks = (chunk.encode('utf-8') for chunk in formatter(columns, batches))
+    return _gzip_chunks(chunks) if compress else chunks
+
+
+def _gzip_chunks(chunks):
+    # wbits=31: cabeçalho gzip, o arquivo abre com gunzip/zcat
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_filename(dataset, file_format, compress=False):
+    extension = FORMATS[file_format][1]
+    stamp = timezone.localtime().strftime('%Y%m%d-%H%M')
+    return f"morea-{dataset}-{stamp}.{extension}{'.gz' if compress else ''}"
@@ -0,0 +1,310 @@
+"""
+Views that serve static and media files.
+
+A client that accepts br or gzip gets the pre-compressed variant written
+next to the file (app/compression.py). Every representation has its own
+strong ETag, conditional requests are answered with 304, and
+content-hashed static names are cached by browsers for a year.
+
+FILE_SERVING_MODE selects who sends the bytes:
+    'django'    the worker streams the file (FileResponse, single Range)
+    'x-accel'   nginx, through X-Accel-Redirect to an internal location
+                (config/morea.conf); nginx also negotiates gzip_static,
+                ETags and ranges
+    'sendfile'  Apache mod_xsendfile / lighttpd, through X-Sendfile
+
+Static paths are resolved through an index of every static file built
+once per process, and file stats are cached for FILE_STAT_CACHE_SECONDS,
+so a request costs no directory walk and at most a few stat calls.
+"""
+
+import functools
+import hashlib
+import mimetypes
+import os
+import re
+import stat as stat_module
+import time
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+
+from .compression import ENCODINGS, is_compressible
+
+# nome.<hash de 12 hex>.ext, gerado por app.storage.CompressedManifestStaticFilesStorage
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^/.]+$')
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+# Apenas um intervalo por requisição (sem multipart/byteranges)
+BYTE_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Mesmos padrões ignorados por padrão pelo collectstatic
+_IGNORE_PATTERNS = ['CVS', '.*', '*~']
+
+_MAX_CACHED_STATS = 4096
+
+_stats = {}
+_static_index = None
+
+
+@receiver(setting_changed)
+def _reset_caches(setting, **kwargs):
+    global _static_index
+
+    if setting in ('STATIC_ROOT', 'STATICFILES_DIRS', 'STATICFILES_FINDERS', 'MEDIA_ROOT'):
+        _static_index = None
+        _stats.clear()
+
+
+def _cached_stat(path):
+    """os.stat of a regular file, or None; cached for FILE_STAT_CACHE_SECONDS."""
+    now = time.monotonic()
+    entry = _stats.get(path)
+    if entry is not None and entry[0] > now:
+        return entry[1]
+
+    try:
+        result = os.stat(path)
+        if not stat_module.S_ISREG(result.st_mode):
+            result = None
+    except OSError:
+        result = None
+
+    if len(_stats) >= _MAX_CACHED_STATS:
+        _stats.clear()
+    _stats[path] = (now + settings.FILE_STAT_CACHE_SECONDS, result)
+    return result
+
+
+def _build_static_index():
+    """Map every static path to its file: STATIC_ROOT first, then the finders."""
+    index = {}
+    for finder in finders.get_finders():
+        for path, storage in finder.list(_IGNORE_PATTERNS):
+            prefix = getattr(storage, 'prefix', None)
+            url_path = os.path.join(prefix, path) if prefix else path
+            index.setdefault(url_path.replace(os.sep, '/'), storage.path(path))
+
+    static_root = settings.STATIC_ROOT
+    if static_root and os.path.isdir(static_root):
+        for directory, _, files in os.walk(static_root):
+            for name in files:
+                absolute = os.path.join(directory, name)
+                index[os.path.relpath(absolute, static_root).replace(os.sep, '/')] = absolute
+
+    return index
+
+
+def _find_static(path):
+    global _static_index
+
+    if _static_index is None:
+        _static_index = _build_static_index()
+
+    found = _static_index.get(path)
+    if found is None and settings.DEBUG:
+        # Em desenvolvimento arquivos novos aparecem sem reiniciar o servidor
+        found = finders.find(path)
+    return found
+
+
+def _find_in(root, path):
+    try:
+        candidate = safe_join(root, path)
+    except SuspiciousFileOperation:
+        raise Http404('Invalid path')
+    return candidate if _cached_stat(candidate) else None
+
+
+@functools.lru_cache(maxsize=2048)
+def _file_digest(path, mtime_ns, size):
+    """Content digest used as ETag; recomputed only when the file changes."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(STREAM_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:32]
+
+
+def _accepted_encodings(request):
+    accepted = set()
+    for coding in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        name, _, parameters = coding.partition(';')
+        quality = parameters.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+def _select_variant(request, path, stat):
+    """Return (encoding or None, path, stat) of the representation to send."""
+    accepted = _accepted_encodings(request)
+    for encoding, suffix in ENCODINGS:
+        if encoding not in accepted:
+            continue
+        variant_stat = _cached_stat(path + suffix)
+        # Variante mais antiga que o arquivo foi gerada para outro conteúdo
+        if variant_stat is not None and variant_stat.st_mtime_ns >= stat.st_mtime_ns:
+            return encoding, path + suffix, variant_stat
+    return None, path, stat
+
+
+def _not_modified(request, etag, mtime):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        etags = parse_etags(if_none_match)
+        return '*' in etags or etag in etags
+
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return if_modified_since is not None and int(mtime) <= if_modified_since
+
+
+def _byte_range(request, etag, size):
+    """Return (start, end) of the requested range, None for the whole file
+    or False when the range cannot be satisfied."""
+    header = request.META.get('HTTP_RANGE')
+    if not header:
+        return None
+
+    # If-Range com outra versão (ou com data): envia o arquivo inteiro
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range is not None and if_range != etag:
+        return None
+
+    match = BYTE_RANGE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+
+    first, last = match.groups()
+    if not first:
+        suffix_length = int(last)
+        if not suffix_length or not size:
+            return False
+        return max(size - suffix_length, 0), size - 1
+
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size:
+        return False
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as source:
+        source.seek(start)
+        while length > 0:
+            chunk = source.read(min(STREAM_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _content_type(path):
+    content_type, _ = mimetypes.guess_type(path)
+    return content_type or 'application/octet-stream'
+
+
+def _accel_response(path, accel_location, cache_control):
+    """Hand the file to nginx, which negotiates gzip_static, ETag and ranges."""
+    response = HttpResponse(content_type=_content_type(path))
+    response.headers['X-Accel-Redirect'] = accel_location
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def serve_file(request, path, cache_control=REVALIDATE_CACHE_CONTROL, accel_location=None):
+    """Serve the file at the absolute `path`, which must exist.
+
+    `accel_location` is the URI of the file under the nginx internal
+    location; without it the file is sent by Django even in x-accel mode.
+    """
+    stat = _cached_stat(path)
+    if stat is None:
+        raise Http404(f"'{path}' could not be found")
+
+    if settings.FILE_SERVING_MODE == 'x-accel' and accel_location:
+        return _accel_response(path, accel_location, cache_control)
+
+    encoding, served_path, served_stat = _select_variant(request, path, stat)
+    digest = _file_digest(path, stat.st_mtime_ns, stat.st_size)
+    etag = quote_etag(f"{digest}-{encoding}" if encoding else digest)
+    content_type = _content_type(path)
+
+    if _not_modified(request, etag, stat.st_mtime):
+        response = HttpResponseNotModified()
+    elif settings.FILE_SERVING_MODE == 'sendfile':
+        response = HttpResponse(content_type=content_type)
+        response.headers['X-Sendfile'] = served_path
+    else:
+        byte_range = _byte_range(request, etag, served_stat.st_size)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response.headers['Content-Range'] = f"bytes */{served_stat.st_size}"
+        elif byte_range:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                _read_range(served_path, start, end - start + 1),
+                status=206,
+                content_type=content_type,
+            )
+            response.headers['Content-Range'] = f"bytes {start}-{end}/{served_stat.st_size}"
+            response.headers['Content-Length'] = str(end - start + 1)
+        else:
+            # FileResponse usa o wsgi.file_wrapper do gunicorn (sendfile do kernel)
+            response = FileResponse(open(served_path, 'rb'), content_type=content_type)
+        response.headers['Accept-Ranges'] = 'bytes'
+
+    if encoding and response.status_code != 416:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(stat.st_mtime)
+    response.headers['Cache-Control'] = cache_control
+    if is_compressible(path):
+        patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def _accel_location(kind, root, found):
+    """Internal nginx URI of `found`, when it lives under `root`."""
+    if not root:
+        return None
+    relative = os.path.relpath(found, root)
+    if relative.startswith('..'):
+        return None
+    return f"{settings.FILE_SERVING_ACCEL_PREFIX.rstrip('/')}/{kind}/{relative.replace(os.sep, '/')}"
+
+
+def serve_static(request, path):
+    """Serve a collected static file, or one published by the finders before collectstatic."""
+    found = _find_static(path)
+    if not found:
+        raise Http404(f"'{path}' could not be found")
+
+    cache_control = IMMUTABLE_CACHE_CONTROL if HASHED_NAME.search(path) else REVALIDATE_CACHE_CONTROL
+    return serve_file(request, found, cache_control, _accel_location('static', settings.STATIC_ROOT, found))
+
+
+def serve_media(request, path):
+    found = _find_in(settings.MEDIA_ROOT, path)
+    if not found:
+        raise Http404(f"'{path}' could not be found")
+    return serve_file(request, found, accel_location=_accel_location('media', settings.MEDIA_ROOT, found))
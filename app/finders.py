@@ -0,0 +1,39 @@
+"""
+Static files finder that publishes the plotly.js bundle of the installed
+plotly package under a versioned name.
+
+`collectstatic` copies it to STATIC_ROOT with the other assets, and every
+graph file points to that single long-cached copy instead of embedding it.
+"""
+
+import os
+
+import plotly
+from django.contrib.staticfiles.finders import BaseFinder
+from django.core.files.storage import FileSystemStorage
+from plotly.offline import get_plotlyjs_version
+
+PLOTLY_SOURCE = os.path.join(os.path.dirname(plotly.__file__), 'package_data', 'plotly.min.js')
+
+
+def plotly_bundle_path():
+    """Static path of the bundle, versioned so it can be cached forever."""
+    return f"js/plotly-{get_plotlyjs_version()}.min.js"
+
+
+class _PlotlyPackageStorage(FileSystemStorage):
+    def __init__(self):
+        super().__init__(location=os.path.dirname(PLOTLY_SOURCE))
+
+    def path(self, name):
+        return PLOTLY_SOURCE
+
+
+class PlotlyBundleFinder(BaseFinder):
+    def find(self, path, all=False):
+        if path != plotly_bundle_path():
+            return []
+        return [PLOTLY_SOURCE] if all else PLOTLY_SOURCE
+
+    def list(self, ignore_patterns):
+        yield plotly_bundle_path(), _PlotlyPackageStorage()
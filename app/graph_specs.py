@@ -0,0 +1,99 @@
+"""
+Registry of the charts written by the graph cron job.
+
+Each GraphSpec describes one HTML file: which devices and data type it
+plots, over which window, how readings are aggregated and where the file
+goes. `app.graphs.generateGraphs` renders every registered spec, reading
+the data of specs over the same devices only once.
+
+New charts are added with `register`, e.g. a 7-day hourly water chart:
+
+    register(GraphSpec(
+        key='allWMoteDevices7dHourly',
+        device_filter={'type': DeviceTypes.water},
+        unit=COLLECTION_UNITS[DeviceTypes.water],
+        file_path='graphs/allWMoteDevices7dHourly.html',
+        window=timedelta(days=7),
+        aggregation='hour',
+    ))
+"""
+
+from dataclasses import dataclass
+from datetime import timedelta
+
+from .aggregation import BUCKETS
+from .models import DeviceTypes, GraphsTypes
+
+COLLECTION_UNITS = {
+    DeviceTypes.water: 'Consumo(L)',
+    DeviceTypes.energy: 'Consumo(Watts)',
+    DeviceTypes.gas: 'Consumo(m³)',
+}
+
+# Agregações aceitas: leituras brutas ou somadas por hora/dia no banco (app/aggregation.py)
+AGGREGATIONS = ('raw', *BUCKETS)
+
+
+@dataclass(frozen=True)
+class GraphSpec:
+    """One generated chart.
+
+    `device_filter` holds Device lookups (only authorized devices are
+    plotted), `data_type` restricts the readings to one DataTypes value and
+    `graph_type` is the legacy GraphsTypes value stored on Graph.
+    """
+
+    key: str
+    device_filter: dict
+    unit: str
+    file_path: str
+    window: timedelta = timedelta(days=1)
+    data_type: int | None = None
+    aggregation: str = 'raw'
+    graph_type: int = GraphsTypes.none
+    title: str = ''
+
+    def __post_init__(self):
+        if self.aggregation not in AGGREGATIONS:
+            raise ValueError(f"Unknown aggregation {self.aggregation!r} for graph {self.key}")
+
+
+GRAPH_SPECS = []
+
+
+def register(spec):
+    """Add a spec to the registry; keys name the Graph rows and must be unique."""
+    if any(existing.key == spec.key for existing in GRAPH_SPECS):
+        raise ValueError(f"Graph {spec.key} is already registered")
+    GRAPH_SPECS.append(spec)
+    return spec
+
+
+def get_spec(key):
+    return next((spec for spec in GRAPH_SPECS if spec.key == key), None)
+
+
+register(GraphSpec(
+    key='allWMoteDevices24hRaw',
+    device_filter={'type': DeviceTypes.water},
+    unit=COLLECTION_UNITS[DeviceTypes.water],
+    file_path='graphs/allWMoteDevices24hRaw.html',
+    graph_type=GraphsTypes.allWMoteDevices24hRaw,
+    title='Consumo de Água',
+))
+register(GraphSpec(
+    key='allEMoteDevices24hRaw',
+    device_filter={'type': DeviceTypes.energy},
+    unit=COLLECTION_UNITS[DeviceTypes.energy],
+    file_path='graphs/allEMoteDevices24hRaw.html',
+    graph_type=GraphsTypes.allEMoteDevices24hRaw,
+    title='Consumo de Energia',
+))
+register(GraphSpec(
+    key='allGMoteDevices24hRaw',
+    device_filter={'type': DeviceTypes.gas},
+    unit=COLLECTION_UNITS[DeviceTypes.gas],
+    file_path='graphs/allGMoteDevices24hRaw.html',
+    graph_type=GraphsTypes.allGMoteDevices24hRaw,
+    title='Consumo de Gás',
+))
@@ -1,96 +1,234 @@
-from datetime import timedelta
-from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import groupby
+from operator import itemgetter
+import hashlib
+import multiprocessing
 import os
+import time
 
+import numpy
 import plotly.graph_objects as go
 from django.conf import settings
+from django.db.models import Count, Max
+from django.templatetags.static import static
 from django.utils import timezone
 
+from . import ring_buffer
+from .compression import atomic_write, write_compressed
+from .db_router import pinned_to_primary, reporting
+from .finders import plotly_bundle_path
+from .aggregation import bucket_series, readings
+from .graph_specs import COLLECTION_UNITS, GRAPH_SPECS
 from .models import AuthTypes, Device, Data, Graph
 
+# Linhas lidas por ida ao banco ao montar as séries
+SERIES_CHUNK_SIZE = 5000
 
-def _series_by_device(device_ids, date_from):
-    """Return timeseries values for each device keyed by device name."""
-    device_series = defaultdict(list)
+# Janelas aceitas por /api/chart-data
+CHART_RANGES = {
+    '1h': timedelta(hours=1),
+    '6h': timedelta(hours=6),
+    '24h': timedelta(days=1),
+}
 
-    devices = Device.objects.filter(id__in=device_ids).values('id', 'name')
 
-    for device in devices:
-        label = device['name'] or f"Dispositivo {device['id']}"
-        if label in device_series:
-            label = f"{label} ({device['id']})"
+def _local_datetimes(epochs):
+    """Convert UTC epoch seconds to naive local datetime64 values.
 
-        samples = list(
-            Data.objects.filter(
-                device=device['id'],
-                collect_date__gte=date_from,
-            )
-            .order_by('collect_date')
-            .values_list('collect_date', 'last_collection')
-        )
+    The whole series is shifted by the offset of its first sample, instead
+    of localizing every timestamp on its own.
+    """
+    times = numpy.round(epochs * 1e6).astype('int64').astype('datetime64[us]')
+    if not len(epochs):
+        return times
+
+    first = datetime.fromtimestamp(epochs[0], tz=dt_timezone.utc)
+    offset = timezone.localtime(first).utcoffset()
+    return times + numpy.timedelta64(int(offset.total_seconds()), 's')
+
+
+def _device_labels(devices):
+    """Map (id, name) pairs to unique trace names."""
+    labels = {}
+    for device_id, name in devices:
+        label = name or f"Dispositivo {device_id}"
+        if label in labels.values():
+            label = f"{label} ({device_id})"
+        labels[device_id] = label
+    return labels
+
+
+def series_queryset(device_ids, date_from, data_type=None):
+    """(device_id, collect_date, last_collection) rows of the devices since `date_from`."""
+    samples = Data.objects.filter(device__in=device_ids, collect_date__gte=date_from)
+    if data_type is not None:
+        samples = samples.filter(type=data_type)
+    return samples.order_by('device', 'collect_date').values_list('device_id', 'collect_date', 'last_collection')
+
+
+def _device_windows(device_ids, date_from, data_type=None):
+    """Return {device_id: (epochs, values)} of readings since `date_from`.
+
+    Devices not covered by the ring buffer are read with one query for all
+    of them, streamed in (device, collect_date) order.
+    """
+    windows = {}
+    recent = ring_buffer.get_buffer()
+    if recent:
+        for device_id in device_ids:
+            window = recent.device_window(device_id, date_from, data_type)
+            if window is not None:
+                windows[device_id] = window
+
+    missing = [device_id for device_id in device_ids if device_id not in windows]
+    if missing:
+        samples = series_queryset(missing, date_from, data_type).iterator(chunk_size=SERIES_CHUNK_SIZE)
+        for device_id, rows in groupby(samples, key=itemgetter(0)):
+            _, dates, values = zip(*rows)
+            epochs = numpy.fromiter((date.timestamp() for date in dates), dtype=numpy.float64, count=len(dates))
+            windows[device_id] = (epochs, values)
+
+    return windows
 
-        for collected_at, value in samples:
-            if timezone.is_naive(collected_at):
-                collected_at = timezone.make_aware(
-                    collected_at, timezone.get_default_timezone()
-                )
-            localized = timezone.localtime(collected_at)
-            device_series[label].append((localized, value))
 
-        device_series.setdefault(label, [])
+def _local_series(labels, windows, date_from=None):
+    """Build {label: (local datetime64 times, float64 values)} from `_device_windows`.
+
+    With `date_from`, readings before it are dropped, so a window fetched
+    for a longer chart can be reused by a shorter one.
+    """
+    since = date_from.timestamp() if date_from is not None else None
+    device_series = {}
+    for device_id, label in labels.items():
+        epochs, values = windows.get(device_id, ((), ()))
+        epochs = numpy.asarray(epochs, dtype=numpy.float64)
+        values = numpy.asarray(values, dtype=numpy.float64)
+        if since is not None:
+            start = numpy.searchsorted(epochs, since)
+            epochs, values = epochs[start:], values[start:]
+        device_series[label] = (_local_datetimes(epochs), values)
 
     return device_series
 
 
-def _write_line_chart(series_by_device, collection_unit, media_path):
-    """Create an interactive line chart styled to mirror Grafana's dark dashboards."""
-    fig = go.Figure()
-    # Paleta de cores Grafana moderna
-    grafana_palette = [
-        "#73BF69",  # Verde
-        "#F2704F",  # Laranja
-        "#B877D9",  # Roxo
-        "#5794F2",  # Azul
-        "#F2C962",  # Amarelo
-        "#00A0EB",  # Azul claro
-        "#FF6B5B",  # Vermelho
-        "#1F4788",  # Azul escuro
-        "#8AB4B4",  # Teal
-        "#E67C73",  # Rosa
-        "#2C6E49",  # Verde escuro
-        "#D63031",  # Vermelho intenso
-    ]
-
-    for index, (device_name, samples) in enumerate(sorted(series_by_device.items())):
-        if not samples:
-            continue
+def _series_by_device(device_ids, date_from, data_type=None):
+    """Return (times, values) arrays for each device keyed by device name."""
+    labels = _device_labels(Device.objects.filter(id__in=device_ids).values_list('id', 'name'))
+    return _local_series(labels, _device_windows(list(labels), date_from, data_type))
 
-        times, values = zip(*samples)
-        fig.add_trace(
-            go.Scatter(
-                x=list(times),
-                y=list(values),
-                mode="lines",
-                name=device_name,
-                line=dict(
-                    color=grafana_palette[index % len(grafana_palette)],
-                    width=2.5,
-                    shape="linear",
-                ),
-                fill="tozeroy",
-                fillcolor=grafana_palette[index % len(grafana_palette)],
-                opacity=0.7,
-                hovertemplate=(
-                    "<b>%{fullData.name}</b><br>"
-                    "Horário: %{x|%H:%M}<br>"
-                    f"Consumo: %{{y:.2f}} {collection_unit}"
-                    "<extra></extra>"
-                ),
-            )
+
+def lttb_indices(x, y, threshold):
+    """Indices kept by Largest-Triangle-Three-Buckets downsampling.
+
+    The first and last points are always kept; each of the `threshold - 2`
+    buckets in between keeps the point forming the largest triangle with
+    the previously kept point and the average of the next bucket. Bucket
+    averages and areas are computed with NumPy; only the walk over the
+    buckets is a Python loop.
+    """
+    size = len(x)
+    if threshold is None or threshold < 3 or size <= threshold:
+        return numpy.arange(size)
+
+    x = numpy.asarray(x).astype(numpy.float64)
+    y = numpy.asarray(y, dtype=numpy.float64)
+
+    edges = numpy.linspace(1, size - 1, threshold - 1).astype(numpy.int64)
+    starts, ends = edges[:-1], edges[1:]
+    counts = ends - starts
+
+    x_sums = numpy.concatenate(([0.0], numpy.cumsum(x)))
+    y_sums = numpy.concatenate(([0.0], numpy.cumsum(y)))
+    next_x = numpy.append(((x_sums[ends] - x_sums[starts]) / counts)[1:], x[-1])
+    next_y = numpy.append(((y_sums[ends] - y_sums[starts]) / counts)[1:], y[-1])
+
+    selected = numpy.empty(threshold, dtype=numpy.int64)
+    selected[0] = previous = 0
+    selected[-1] = size - 1
+    for bucket, (start, end) in enumerate(zip(starts, ends)):
+        area = numpy.abs(
+            (x[previous] - next_x[bucket]) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y[bucket] - y[previous])
         )
+        previous = start + int(numpy.argmax(area))
+        selected[bucket + 1] = previous
+
+    return selected
+
+
+def _downsample(times, values, threshold):
+    """Drop missing readings and reduce a series to `threshold` points."""
+    present = ~numpy.isnan(values)
+    times, values = times[present], values[present]
+    kept = lttb_indices(times.astype('int64'), values, threshold)
+    return times[kept], values[kept]
+
+
+def _downsample_series(series_by_device):
+    return {
+        device_name: _downsample(times, values, settings.GRAPH_TARGET_POINTS)
+        for device_name, (times, values) in series_by_device.items()
+    }
+
+
+def _use_webgl(series_by_device):
+    """Large charts are drawn with WebGL (Scattergl) instead of SVG."""
+    points = sum(len(times) for times, _ in series_by_device.values())
+    return points > settings.GRAPH_WEBGL_THRESHOLD
+
+
+# Paleta de cores Grafana moderna
+GRAFANA_PALETTE = [
+    "#73BF69",  # Verde
+    "#F2704F",  # Laranja
+    "#B877D9",  # Roxo
+    "#5794F2",  # Azul
+    "#F2C962",  # Amarelo
+    "#00A0EB",  # Azul claro
+    "#FF6B5B",  # Vermelho
+    "#1F4788",  # Azul escuro
+    "#8AB4B4",  # Teal
+    "#E67C73",  # Rosa
+    "#2C6E49",  # Verde escuro
+    "#D63031",  # Vermelho intenso
+]
+
 
-    has_data = any(samples for samples in series_by_device.values())
+def _time_formats(window):
+    """Tick format, hover format and empty-chart message for a chart window."""
+    if window <= timedelta(days=1):
+        hours = round(window.total_seconds() / 3600)
+        return "%H:%M", "%H:%M", f"Nenhum registro coletado nas últimas {hours}h"
+    return "%d/%m", "%d/%m %H:%M", f"Nenhum registro coletado nos últimos {window.days} dias"
 
+
+def _trace_style(index, collection_unit, window=timedelta(days=1)):
+    """Scatter attributes of the index-th device of a chart."""
+    _, hover_format, _ = _time_formats(window)
+    color = GRAFANA_PALETTE[index % len(GRAFANA_PALETTE)]
+    return dict(
+        mode="lines",
+        line=dict(
+            color=color,
+            width=2.5,
+            shape="linear",
+        ),
+        fill="tozeroy",
+        fillcolor=color,
+        opacity=0.7,
+        hovertemplate=(
+            "<b>%{fullData.name}</b><br>"
+            f"Horário: %{{x|{hover_format}}}<br>"
+            f"Consumo: %{{y:.2f}} {collection_unit}"
+            "<extra></extra>"
+        ),
+    )
+
+
+def _style_figure(fig, has_data, window=timedelta(days=1)):
+    """Apply the Grafana-like dark layout shared by every chart."""
+    tick_format, _, empty_message = _time_formats(window)
     fig.update_layout(
         template=None,
         dragmode="zoom",
@@ -121,7 +259,7 @@ def _write_line_chart(series_by_device, collection_unit, media_path):
 
     fig.update_xaxes(
         title="",
-        tickformat="%H:%M",
+        tickformat=tick_format,
         showgrid=True,
         gridwidth=1,
         gridcolor="rgba(75, 85, 99, 0.2)",
@@ -154,7 +292,7 @@ def _write_line_chart(series_by_device, collection_unit, media_path):
 
     if not has_data:
         fig.add_annotation(
-            text="Nenhum registro coletado nas últimas 24h",
+            text=empty_message,
             showarrow=False,
             font=dict(size=14, color="#CBD5E1"),
             xref="paper",
@@ -164,37 +302,236 @@ def _write_line_chart(series_by_device, collection_unit, media_path):
         )
         fig.update_layout(hovermode=False)
 
-    os.makedirs(os.path.dirname(media_path), exist_ok=True)
-    fig.write_html(
-        media_path,
+
+    return fig
+
+
+def _line_chart_figure(series_by_device, collection_unit, window=timedelta(days=1)):
+    """Create an interactive line chart styled to mirror Grafana's dark dashboards."""
+    fig = go.Figure()
+    series_by_device = _downsample_series(series_by_device)
+    trace_class = go.Scattergl if _use_webgl(series_by_device) else go.Scatter
+
+    for index, (device_name, (times, values)) in enumerate(sorted(series_by_device.items())):
+        if not len(times):
+            continue
+
+        fig.add_trace(
+            trace_class(
+                x=times,
+                y=values,
+                name=device_name,
+                **_trace_style(index, collection_unit, window),
+            )
+        )
+
+    has_data = any(len(times) for times, _ in series_by_device.values())
+    return _style_figure(fig, has_data, window)
+
+
+def chart_style(collection_unit):
+    """Trace and layout attributes used by the dashboard to draw in the browser."""
+    return {
+        'traces': [_trace_style(index, collection_unit) for index in range(len(GRAFANA_PALETTE))],
+        'layout': _style_figure(go.Figure(), True).layout.to_plotly_json(),
+        'emptyLayout': _style_figure(go.Figure(), False).layout.to_plotly_json(),
+    }
+
+
+def _write_line_chart(series_by_device, collection_unit, media_path, window=timedelta(days=1)):
+    """Write the chart and its compressed variants, returning the SHA-256 of the HTML.
+
+    Files are written through a temporary file and a rename, so readers
+    never see a half-written chart.
+    """
+    fig = _line_chart_figure(series_by_device, collection_unit, window)
+    html = fig.to_html(
         config={'displayModeBar': False, 'responsive': True},
+        # Só o JSON da figura vai no arquivo; o plotly.js vem do bundle estático
+        include_plotlyjs=static(plotly_bundle_path()),
+    ).encode('utf-8')
+
+    # Variantes depois do HTML: uma variante mais antiga que o arquivo não é servida
+    atomic_write(media_path, html)
+    write_compressed(media_path, html)
+
+    return hashlib.sha256(html).hexdigest()
+
+
+def _render_chart(series_by_device, collection_unit, media_path, window):
+    """Pool task: write one chart and return (content hash, seconds taken)."""
+    started = time.perf_counter()
+    content_hash = _write_line_chart(series_by_device, collection_unit, media_path, window)
+    return content_hash, time.perf_counter() - started
+
+
+def _render_charts(tasks):
+    """Render {key: (series, unit, path, window)} on up to GRAPH_WORKERS processes.
+
+    The series are fetched by the caller and sent to the workers as NumPy
+    arrays, so the workers never touch the database. Returns
+    {key: (content hash, seconds)}.
+    """
+    workers = min(settings.GRAPH_WORKERS, len(tasks))
+    if workers <= 1:
+        return {key: _render_chart(*arguments) for key, arguments in tasks.items()}
+
+    # fork: os workers herdam o Django já configurado (spawn exigiria django.setup())
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as pool:
+        futures = {key: pool.submit(_render_chart, *arguments) for key, arguments in tasks.items()}
+        return {key: future.result() for key, future in futures.items()}
+
+
+def _graph_fingerprint(spec, devices, date_from):
+    """Digest of everything a chart is drawn from.
+
+    New readings raise the max `Data.id`, readings leaving the window lower
+    the count, and the device list covers renamed, added and deauthorized
+    devices. The spec and render settings are included so changing either,
+    or a new plotly bundle, also regenerates the file.
+    """
+    window = Data.objects.filter(
+        device__in=[device_id for device_id, _ in devices],
+        collect_date__gte=date_from,
     )
+    if spec.data_type is not None:
+        window = window.filter(type=spec.data_type)
+    window = window.aggregate(last_id=Max('id'), samples=Count('id'))
 
+    digest = hashlib.sha256()
+    for part in (
+        spec,
+        devices,
+        window['last_id'],
+        window['samples'],
+        plotly_bundle_path(),
+        settings.GRAPH_TARGET_POINTS,
+        settings.GRAPH_WEBGL_THRESHOLD,
+    ):
+        digest.update(repr(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
 
-def generateAllMotes24hRaw():
-    media_root = settings.MEDIA_ROOT
 
-    for device_type in range(1, 4):
-        device_ids = list(
-            Device.objects.filter(
-                type=device_type,
-                is_authorized=AuthTypes.Authorized,
-            ).values_list('id', flat=True)
-        )
+def chart_payload(device_type, range_key):
+    """Compact columnar series of the authorized devices of a type.
+
+    Times are local wall-clock milliseconds, the same values the static
+    charts plot, so Plotly shows them without any browser timezone shift.
+    """
+    labels = _device_labels(
+        Device.objects.filter(
+            type=device_type,
+            is_authorized=AuthTypes.Authorized,
+        ).values_list('id', 'name')
+    )
+    timeseries = _downsample_series(
+        _local_series(labels, _device_windows(list(labels), timezone.now() - CHART_RANGES[range_key]))
+    )
+
+    # Os eventos de /api/live identificam as séries pelo id do dispositivo
+    device_ids = {label: device_id for device_id, label in labels.items()}
+    series = []
+    for device_name, (times, values) in sorted(timeseries.items()):
+        series.append({
+            'id': device_ids[device_name],
+            'name': device_name,
+            't': times.astype('datetime64[ms]').astype('int64').tolist(),
+            'v': numpy.round(values, 3).tolist(),
+        })
+
+    return {
+        'type': device_type,
+        'range': range_key,
+        'unit': COLLECTION_UNITS[device_type],
+        'webgl': _use_webgl(timeseries),
+        'series': series,
+    }
+
+
+@reporting
+def generateGraphs(specs=None, force=False):
+    """Regenerate the registered charts whose input changed since the last run.
+
+    Windows end at the top of the hour, so within an hour the same readings
+    produce the same fingerprint and the chart is skipped. Stale raw specs
+    over the same devices and data type share one read covering the longest
+    of their windows; hourly and daily specs are summed by the database
+    (app/aggregation.py). The charts are then rendered in parallel by
+    `_render_charts`. Returns the keys of the rewritten graphs.
+    """
+    specs = GRAPH_SPECS if specs is None else specs
+    window_end = timezone.now().replace(minute=0, second=0, microsecond=0)
+    device_sets = {}
+    stale = []
+
+    for spec in specs:
+        filter_key = repr(sorted(spec.device_filter.items()))
+        if filter_key not in device_sets:
+            device_sets[filter_key] = tuple(
+                Device.objects.filter(
+                    is_authorized=AuthTypes.Authorized,
+                    **spec.device_filter,
+                ).order_by('id').values_list('id', 'name')
+            )
+        devices = device_sets[filter_key]
+
+        date_from = window_end - spec.window
+        absolute_path = os.path.join(settings.MEDIA_ROOT, spec.file_path)
+        fingerprint = _graph_fingerprint(spec, devices, date_from)
+
+        # Lido no primário: a réplica pode ainda não ter o Graph recém-gravado
+        with pinned_to_primary():
+            graph = Graph.objects.filter(key=spec.key).first()
+
+        if (
+            not force
+            and graph is not None
+            and graph.fingerprint == fingerprint
+            and graph.file_path == spec.file_path
+            and os.path.isfile(absolute_path)
+        ):
+            continue
+
+        stale.append((spec, devices, date_from, absolute_path, graph or Graph(key=spec.key), fingerprint))
 
-        if device_type == 1:
-            relative_path = 'graphs/allWMoteDevices24hRaw.html'
-            collection_unit = 'Consumo(L)'
-        elif device_type == 2:
-            relative_path = 'graphs/allEMoteDevices24hRaw.html'
-            collection_unit = 'Consumo(Watts)'
+    # Gráficos brutos: uma leitura por conjunto de dispositivos e tipo de dado, na maior janela pedida
+    sources = {}
+    for spec, devices, date_from, *_ in stale:
+        if spec.aggregation == 'raw':
+            source = (devices, spec.data_type)
+            sources[source] = min(date_from, sources.get(source, date_from))
+    windows = {
+        (devices, data_type): _device_windows([device_id for device_id, _ in devices], date_from, data_type)
+        for (devices, data_type), date_from in sources.items()
+    }
+
+    tasks = {}
+    for spec, devices, date_from, absolute_path, _, _ in stale:
+        labels = _device_labels(devices)
+        if spec.aggregation == 'raw':
+            timeseries = _local_series(labels, windows[(devices, spec.data_type)], date_from)
         else:
-            relative_path = 'graphs/allGMoteDevices24hRaw.html'
-            collection_unit = 'Consumo(m³)'
+            # Somas por hora/dia calculadas no banco, uma linha por intervalo
+            timeseries = bucket_series(
+                labels, readings(date_from=date_from, data_type=spec.data_type), spec.aggregation,
+            )
+        tasks[spec.key] = (timeseries, spec.unit, absolute_path, spec.window)
+
+    rendered = _render_charts(tasks)
+
+    with pinned_to_primary():
+        for spec, _, _, _, graph, fingerprint in stale:
+            graph.type = spec.graph_type
+            graph.file_path = spec.file_path
+            graph.fingerprint = fingerprint
+            graph.content_hash, graph.render_seconds = rendered[spec.key]
+            graph.generated_at = timezone.now()
+            graph.save()
+
+    return [spec.key for spec, *_ in stale]
 
-        absolute_path = os.path.join(media_root, relative_path)
-        timeseries = _series_by_device(device_ids, timezone.now() - timedelta(days=1))
-        _write_line_chart(timeseries, collection_unit, absolute_path)
 
-        if not Graph.objects.filter(type=device_type).exists():
-            Graph.objects.create(type=device_type, file_path=relative_path)
+def generateAllMotes24hRaw(force=False):
+    """Kept for the crontabs and scripts that still call it by name."""
+    return generateGraphs(force=force)
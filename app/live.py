@@ -0,0 +1,177 @@
+"""
+Live reading deltas for the dashboard, over Server-Sent Events (/api/live).
+
+One `Broadcaster` per process collects the readings stored by ingest and,
+every LIVE_UPDATE_SECONDS, encodes one event per device type with the new
+points of each device, then hands the same bytes to every subscriber. A
+tick costs the same with one open dashboard or a hundred, and connections
+never query the database.
+
+With the ring buffer enabled (app/ring_buffer.py) the broadcaster reads
+the readings appended by every worker of the node from the shared segment;
+otherwise it receives the readings stored by its own process, published by
+`storeData`. Streaming needs the ASGI app (morea_ds/asgi.py): under WSGI
+each connection would hold a worker.
+
+    event: readings
+    data: {"type": 1, "series": [{"id": 3, "t": [...], "v": [...]}]}
+
+Times are local wall-clock milliseconds and ids match the series of
+/api/chart-data, so the dashboard appends the points to its traces.
+"""
+
+import asyncio
+import json
+import threading
+from collections import deque
+
+import numpy
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import ring_buffer
+from .graphs import _local_datetimes
+from .models import Device
+
+# Comentário enviado quando não há eventos, para proxies não fecharem a conexão
+HEARTBEAT_SECONDS = 15
+RETRY_MILLISECONDS = 5000
+
+
+class Subscriber:
+    """Bounded queue of encoded events of one connection."""
+
+    def __init__(self, device_types=None):
+        self.device_types = device_types
+        self.queue = asyncio.Queue(maxsize=settings.LIVE_QUEUE_SIZE)
+
+    def wants(self, device_type):
+        return not self.device_types or device_type in self.device_types
+
+    def put(self, message):
+        if self.queue.full():
+            # Cliente lento: perde o evento mais antigo; a próxima leitura
+            # completa de /api/chart-data repõe os pontos
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+
+class Broadcaster:
+    """Coalesces readings per device type and fans them out once per tick."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # device_type: {device_id: deque of (epoch, value)}
+        self._pending = {}
+        self._subscribers = set()
+        self._task = None
+        self._position = None
+        self._device_types = {}
+
+    @property
+    def subscribers(self):
+        return len(self._subscribers)
+
+    def _points(self, device_type, device_id):
+        devices = self._pending.setdefault(device_type, {})
+        if device_id not in devices:
+            devices[device_id] = deque(maxlen=settings.LIVE_MAX_POINTS)
+        return devices[device_id]
+
+    def publish(self, device_id, device_type, collected_at, value):
+        """Queue a stored reading; a no-op while nobody in this process listens."""
+        if not self._subscribers or value is None or settings.RING_BUFFER_ENABLED:
+            return
+        with self._lock:
+            self._points(device_type, device_id).append((collected_at.timestamp(), float(value)))
+
+    def subscribe(self, device_types=None):
+        """Register a connection and start the flush loop on the running event loop."""
+        subscriber = Subscriber(device_types)
+        self._subscribers.add(subscriber)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self._subscribers.discard(subscriber)
+
+    async def _run(self):
+        while self._subscribers:
+            await asyncio.sleep(settings.LIVE_UPDATE_SECONDS)
+            await self.flush()
+
+        # Sem ouvintes: nada é acumulado até a próxima conexão
+        with self._lock:
+            self._pending = {}
+        self._position = None
+
+    def _collect_shared(self):
+        buffer = ring_buffer.get_buffer()
+        if buffer is None:
+            return
+        self._position, samples = buffer.samples_since(self._position)
+
+        missing = {device_id for device_id, *_ in samples} - self._device_types.keys()
+        if missing:
+            self._device_types.update(Device.objects.filter(id__in=missing).values_list('id', 'type'))
+
+        with self._lock:
+            for device_id, _, epochs, values in samples:
+                device_type = self._device_types.get(device_id)
+                if device_type is not None:
+                    self._points(device_type, device_id).extend(zip(epochs.tolist(), values.tolist()))
+
+    async def flush(self):
+        """Send the readings collected since the last flush; returns the number of events."""
+        if settings.RING_BUFFER_ENABLED:
+            # Abrir o segmento pode recarregá-lo do banco
+            await sync_to_async(self._collect_shared)()
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        for device_type, devices in pending.items():
+            message = encode_event(device_type, devices)
+            for subscriber in list(self._subscribers):
+                if subscriber.wants(device_type):
+                    subscriber.put(message)
+        return len(pending)
+
+
+def encode_event(device_type, devices):
+    """One `readings` event with the points of {device_id: [(epoch, value), ...]}."""
+    series = []
+    for device_id, points in sorted(devices.items()):
+        epochs = numpy.array([epoch for epoch, _ in points], dtype=numpy.float64)
+        order = numpy.argsort(epochs, kind='stable')
+        values = numpy.array([value for _, value in points], dtype=numpy.float64)[order]
+        series.append({
+            'id': device_id,
+            't': _local_datetimes(epochs[order]).astype('datetime64[ms]').astype('int64').tolist(),
+            'v': numpy.round(values, 3).tolist(),
+        })
+
+    data = json.dumps({'type': device_type, 'series': series}, separators=(',', ':'))
+    return f"event: readings\ndata: {data}\n\n".encode('utf-8')
+
+
+async def event_stream(device_types=None):
+    """Body of a /api/live response; unsubscribes when the client disconnects."""
+    subscriber = broadcaster.subscribe(device_types)
+    try:
+        yield f"retry: {RETRY_MILLISECONDS}\n\n".encode('utf-8')
+        while True:
+            try:
+                yield await asyncio.wait_for(subscriber.queue.get(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield b": ping\n\n"
+    finally:
+        broadcaster.unsubscribe(subscriber)
+
+
+broadcaster = Broadcaster()
+
+
+def publish(device_id, device_type, collected_at, value):
+    broadcaster.publish(device_id, device_type, collected_at, value)
@@ -0,0 +1,99 @@
+"""
+Last-seen tracking and offline detection of the devices.
+
+`storeData` calls `touch` with the newest reading of each request. The
+value is kept in memory, per worker, and every LIVENESS_FLUSH_SECONDS the
+devices that reported meanwhile are written with one `bulk_update`
+(Device.last_seen_at/last_value) instead of one UPDATE per request. The
+flush runs on the first request after the interval and when the worker
+exits; a value older than the one already stored (flushed by another
+worker) is skipped.
+
+A device is offline when its last reading is older than
+LIVENESS_OFFLINE_MINUTES, so the device list and the metrics read only the
+`Device` table, never `Data`.
+"""
+
+import atexit
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .db_router import pinned_to_primary
+from .models import AuthTypes, Device, DeviceTypes
+
+_lock = threading.Lock()
+# device_id: (collect_date, last_collection)
+_pending = {}
+_last_flush = time.monotonic()
+
+
+def touch(device_id, collected_at, value):
+    """Record a reading of `device_id`; flushes when LIVENESS_FLUSH_SECONDS have passed."""
+    with _lock:
+        current = _pending.get(device_id)
+        if current is None or collected_at >= current[0]:
+            _pending[device_id] = (collected_at, value)
+        due = time.monotonic() - _last_flush >= settings.LIVENESS_FLUSH_SECONDS
+
+    if due:
+        flush()
+
+
+def flush():
+    """Write the pending last-seen values; returns the number of devices updated."""
+    global _last_flush
+
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _last_flush = time.monotonic()
+
+    if not pending:
+        return 0
+
+    with pinned_to_primary():
+        stored = dict(Device.objects.filter(id__in=pending).values_list('id', 'last_seen_at'))
+        devices = [
+            Device(id=device_id, last_seen_at=collected_at, last_value=value)
+            for device_id, (collected_at, value) in pending.items()
+            # Dispositivos removidos ficam de fora; valores já superados por outro worker também
+            if device_id in stored and (stored[device_id] is None or stored[device_id] < collected_at)
+        ]
+        Device.objects.bulk_update(devices, ['last_seen_at', 'last_value'])
+
+    return len(devices)
+
+
+atexit.register(flush)
+
+
+def offline_cutoff(now=None):
+    """Devices without readings since this moment are offline."""
+    return (now or timezone.now()) - timedelta(minutes=settings.LIVENESS_OFFLINE_MINUTES)
+
+
+def online_q(now=None):
+    return Q(last_seen_at__gte=offline_cutoff(now))
+
+
+def is_online(device, now=None):
+    return device.last_seen_at is not None and device.last_seen_at >= offline_cutoff(now)
+
+
+def liveness_counts(now=None):
+    """{device type: (online, offline)} of the authorized devices, from one GROUP BY."""
+    counts = {device_type: (0, 0) for device_type in DeviceTypes.values}
+    rows = (
+        Device.objects.filter(is_authorized=AuthTypes.Authorized)
+        .values('type')
+        .annotate(devices=Count('id'), online=Count('id', filter=online_q(now)))
+        .order_by()
+    )
+    for row in rows:
+        counts[row['type']] = (row['online'], row['devices'] - row['online'])
+    return counts
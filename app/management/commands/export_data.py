@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.exports import BUCKET_DATASETS, DATASETS, FORMATS, ExportError, export_queryset, export_stream
+
+
+class Command(BaseCommand):
+    help = "Exporta leituras (Data), estatísticas (ProcessedData) ou somas por hora/dia em CSV ou NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dataset', choices=sorted([*DATASETS, *BUCKET_DATASETS]), default='data')
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument(
+            '--device', action='append', default=[],
+            help="Id do dispositivo; pode ser repetido.",
+        )
+        parser.add_argument(
+            '--type', action='append', default=[],
+            help="Tipo de dado (DataTypes) das leituras; pode ser repetido.",
+        )
+        parser.add_argument(
+            '--interval', action='append', default=[],
+            help="Intervalo (IntervalTypes) das estatísticas; pode ser repetido.",
+        )
+        parser.add_argument('--from', dest='date_from', help="Data ou data/hora ISO inicial.")
+        parser.add_argument('--to', dest='date_to', help="Data (inclusiva) ou data/hora ISO final.")
+        parser.add_argument('--gzip', action='store_true', help="Comprime a saída com gzip (exige --output).")
+        parser.add_argument('--output', '-o', help="Arquivo de saída; sem ele, escreve na saída padrão.")
+
+    def handle(self, *args, **options):
+        if options['gzip'] and not options['output']:
+            raise CommandError("--gzip exige --output.")
+
+        try:
+            queryset = export_queryset(
+                options['dataset'],
+                devices=options['device'],
+                types=options['type'],
+                intervals=options['interval'],
+                date_from=options['date_from'],
+                date_to=options['date_to'],
+            )
+            chunks = export_stream(options['dataset'], queryset, options['format'], options['gzip'])
+        except ExportError as error:
+            raise CommandError(str(error))
+
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk.decode('utf-8'), ending='')
@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from app import partitioning
+
+
+class Command(BaseCommand):
+    help = "Cria e remove as partições mensais da tabela Data (somente MySQL)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--setup', action='store_true',
+            help="Converte a tabela Data em uma tabela particionada por mês.",
+        )
+        parser.add_argument(
+            '--ahead', type=int, default=settings.DATA_PARTITION_AHEAD_MONTHS,
+            help="Quantidade de meses futuros com partição criada antecipadamente.",
+        )
+        parser.add_argument(
+            '--retention', type=int, default=settings.DATA_RETENTION_MONTHS,
+            help="Meses completos mantidos antes do mês atual (0 mantém tudo).",
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Apenas mostra o SQL que seria executado.",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'mysql':
+            raise CommandError("O particionamento da tabela Data só é suportado com DBTYPE=MySQL.")
+
+        today = timezone.localdate()
+        existing = partitioning.existing_partitions()
+
+        if options['setup']:
+            if existing:
+                raise CommandError("A tabela Data já está particionada.")
+            statements = partitioning.setup_statements(today, options['ahead'])
+        elif not existing:
+            raise CommandError("A tabela Data não está particionada; execute com --setup primeiro.")
+        else:
+            statements = partitioning.maintenance_statements(
+                existing, today, options['ahead'], options['retention'])
+
+        with connection.cursor() as cursor:
+            for statement in statements:
+                self.stdout.write(statement)
+                if not options['dry_run']:
+                    cursor.execute(statement)
+
+        if not statements:
+            self.stdout.write("Nenhuma alteração de partição necessária.")
@@ -52,6 +52,37 @@ total_energy_consumed = Gauge(
     ['device_type']
 )
 
+db_pool_wait_duration = Histogram(
+    'morea_db_pool_wait_seconds',
+    'Time spent waiting for a pooled database connection',
+    ['alias', 'result'],  # 'ok' ou 'timeout'
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+)
+
+db_pool_connections = Gauge(
+    'morea_db_pool_connections',
+    'Pooled database connections of this worker',
+    ['alias', 'state']  # 'in_use' ou 'idle'
+)
+
+graph_render_duration = Gauge(
+    'morea_graph_render_seconds',
+    'Time taken by the last render of each graph',
+    ['graph']
+)
+
+device_liveness = Gauge(
+    'morea_devices_liveness',
+    'Authorized devices by time since their last reading',
+    ['device_type', 'state']  # 'online' ou 'offline'
+)
+
+anomalies_detected = Counter(
+    'morea_anomalies_total',
+    'Readings flagged as anomalous by the online detector',
+    ['device_type', 'measure_type']
+)
+
 # Erros
 data_store_errors = Counter(
     'morea_data_store_errors_total',
@@ -102,3 +133,33 @@ def update_volume_stats(device_type, volume):
 def update_energy_stats(device_type, energy):
     """Update total energy consumed"""
     total_energy_consumed.labels(device_type=device_type).set(energy)
+
+
+def track_pool_checkout(alias, duration, result):
+    """Record time waited for a pooled database connection"""
+    db_pool_wait_duration.labels(alias=alias, result=result).observe(duration)
+
+
+def update_pool_stats(alias, in_use, idle):
+    """Update pooled connections gauge"""
+    db_pool_connections.labels(alias=alias, state='in_use').set(in_use)
+    db_pool_connections.labels(alias=alias, state='idle').set(idle)
+
+
+def update_graph_render_stats(graph, seconds):
+    """Update last graph render duration gauge"""
+    graph_render_duration.labels(graph=graph).set(seconds)
+
+
+def update_liveness_stats(device_type, online, offline):
+    """Update online/offline devices gauge"""
+    device_liveness.labels(device_type=device_type, state='online').set(online)
+    device_liveness.labels(device_type=device_type, state='offline').set(offline)
+
+
+def track_anomaly(device_type, measure_type):
+    """Record anomalous reading"""
+    anomalies_detected.labels(
+        device_type=device_type,
+        measure_type=measure_type
+    ).inc()
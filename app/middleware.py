@@ -0,0 +1,30 @@
+from django.conf import settings
+
+from .db_router import pinned_to_primary
+
+PIN_COOKIE = 'morea_primary'
+
+
+class ReplicaRoutingMiddleware:
+    """Pin a browser to the primary database for a while after it writes.
+
+    Writes go to the primary and the replica may lag; without the pin an
+    admin saving a device would be redirected to a list read from the
+    replica that does not show the change yet.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        writes = request.method not in ('GET', 'HEAD', 'OPTIONS')
+
+        if writes or PIN_COOKIE in request.COOKIES:
+            with pinned_to_primary():
+                response = self.get_response(request)
+        else:
+            response = self.get_response(request)
+
+        if writes:
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax')
+        return response
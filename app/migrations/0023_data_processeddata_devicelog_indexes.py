@@ -0,0 +1,43 @@
+# Generated by Django 5.0.1 on 2026-10-19 13:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0022_alter_devicelog_api_token_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='data',
+            name='type',
+            field=models.IntegerField(choices=[(0, 'Not Selected'), (1, 'Volume (L)'), (2, 'kWh'), (3, 'Watt'), (4, 'Ampere')], default=0),
+        ),
+        migrations.AlterField(
+            model_name='processeddata',
+            name='interval',
+            field=models.IntegerField(choices=[(0, 'Not Selected'), (1, 'Hourly')], default=0),
+        ),
+        migrations.AddIndex(
+            model_name='data',
+            index=models.Index(fields=['device', 'collect_date'], name='data_device_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='data',
+            index=models.Index(fields=['device', 'type', 'id'], name='data_device_type_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='data',
+            index=models.Index(fields=['collect_date'], name='data_collect_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='devicelog',
+            index=models.Index(fields=['device', 'created_at'], name='devicelog_device_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='processeddata',
+            index=models.Index(fields=['device', 'created_at'], name='pdata_device_created_idx'),
+        ),
+    ]
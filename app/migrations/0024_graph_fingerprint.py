@@ -0,0 +1,28 @@
+# Generated by Django 5.0.1 on 2026-10-19 13:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0023_data_processeddata_devicelog_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='graph',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='graph',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='graph',
+            name='generated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
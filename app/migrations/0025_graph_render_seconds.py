@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-19 13:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0024_graph_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='graph',
+            name='render_seconds',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.1 on 2026-10-19 13:28
+
+from django.db import migrations, models
+
+# Gráficos gerados antes do registro de GraphSpec, identificados pelo tipo
+LEGACY_KEYS = {
+    1: 'allWMoteDevices24hRaw',
+    2: 'allEMoteDevices24hRaw',
+    3: 'allGMoteDevices24hRaw',
+}
+
+
+def set_legacy_keys(apps, schema_editor):
+    Graph = apps.get_model('app', 'Graph')
+    for graph_type, key in LEGACY_KEYS.items():
+        Graph.objects.filter(type=graph_type, key='').update(key=key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0025_graph_render_seconds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='graph',
+            name='key',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=100),
+        ),
+        migrations.RunPython(set_legacy_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-19 13:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0026_graph_key'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='processeddata',
+            name='interval',
+            field=models.IntegerField(choices=[(0, 'Not Selected'), (1, 'Hourly'), (2, 'Daily')], default=0),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.0.1 on 2026-10-19 13:36
+
+from django.db import migrations, models
+
+
+def set_last_seen(apps, schema_editor):
+    Data = apps.get_model('app', 'Data')
+    Device = apps.get_model('app', 'Device')
+    for device_id in Device.objects.values_list('id', flat=True):
+        latest = Data.objects.filter(device_id=device_id).order_by('-id').values('collect_date', 'last_collection').first()
+        if latest is not None:
+            Device.objects.filter(pk=device_id).update(
+                last_seen_at=latest['collect_date'], last_value=latest['last_collection'],
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0027_processeddata_daily_interval'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='last_seen_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='device',
+            name='last_value',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='device',
+            name='is_authorized',
+            field=models.IntegerField(choices=[(0, 'Pending'), (1, 'Not Authorized'), (2, 'Authorized')], db_index=True, default=0),
+        ),
+        migrations.AlterField(
+            model_name='device',
+            name='location',
+            field=models.CharField(blank=True, db_index=True, max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name='device',
+            name='section',
+            field=models.CharField(blank=True, db_index=True, max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name='device',
+            name='type',
+            field=models.IntegerField(choices=[(0, 'Not Defined'), (1, 'Water'), (2, 'Energy'), (3, 'Gas')], db_index=True, default=0),
+        ),
+        migrations.RunPython(set_last_seen, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.1 on 2026-10-19 13:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0028_device_list_indexes_last_seen'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsumptionCube',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device_type', models.IntegerField(choices=[(0, 'Not Defined'), (1, 'Water'), (2, 'Energy'), (3, 'Gas')])),
+                ('section', models.CharField(blank=True, default='', max_length=255)),
+                ('location', models.CharField(blank=True, default='', max_length=255)),
+                ('interval', models.IntegerField(choices=[(0, 'Not Selected'), (1, 'Hourly'), (2, 'Daily')])),
+                ('period_start', models.DateTimeField()),
+                ('total', models.FloatField(default=0)),
+                ('samples', models.IntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['interval', 'device_type', 'period_start'], name='cube_type_period_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='consumptioncube',
+            constraint=models.UniqueConstraint(fields=('interval', 'period_start', 'device_type', 'section', 'location'), name='consumption_cube_cell_unique'),
+        ),
+    ]
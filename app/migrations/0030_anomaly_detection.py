@@ -0,0 +1,44 @@
+# Generated by Django 5.0.1 on 2026-10-19 13:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0029_consumptioncube'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DetectorState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.IntegerField(choices=[(0, 'Not Selected'), (1, 'Volume (L)'), (2, 'kWh'), (3, 'Watt'), (4, 'Ampere')])),
+                ('mean', models.FloatField(default=0)),
+                ('variance', models.FloatField(default=0)),
+                ('samples', models.IntegerField(default=0)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.device')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Anomaly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.IntegerField(choices=[(0, 'Not Selected'), (1, 'Volume (L)'), (2, 'kWh'), (3, 'Watt'), (4, 'Ampere')])),
+                ('value', models.FloatField()),
+                ('expected', models.FloatField()),
+                ('z_score', models.FloatField()),
+                ('detected_at', models.DateTimeField()),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.device')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['device', 'detected_at'], name='anomaly_device_date_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='detectorstate',
+            constraint=models.UniqueConstraint(fields=('device', 'type'), name='detector_state_unique'),
+        ),
+    ]
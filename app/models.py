@@ -34,6 +34,7 @@ class DataTypes(models.IntegerChoices):
 class IntervalTypes(models.IntegerChoices):
     notSelected = 0, 'Not Selected',
     hourly = 1, "Hourly"
+    daily = 2, "Daily"
 
 
 class ExtendUser(AbstractUser):
@@ -68,16 +69,19 @@ class ExtendUser(AbstractUser):
 class Device(models.Model):
     name = models.CharField(max_length=255, null=True)
     type = models.IntegerField(
-        choices=DeviceTypes.choices, default=DeviceTypes.none)
-    is_authorized = models.IntegerField(choices=AuthTypes.choices, default=AuthTypes.pending)
+        choices=DeviceTypes.choices, default=DeviceTypes.none, db_index=True)
+    is_authorized = models.IntegerField(choices=AuthTypes.choices, default=AuthTypes.pending, db_index=True)
     mac_address = models.CharField(
         max_length=255, null=True, blank=True, unique=True)
-    section = models.CharField(max_length=255, null=True, blank=True)
-    location = models.CharField(max_length=255, null=True, blank=True)
+    section = models.CharField(max_length=255, null=True, blank=True, db_index=True)
+    location = models.CharField(max_length=255, null=True, blank=True, db_index=True)
     ip_address = models.GenericIPAddressField(
         max_length=255, null=True, blank=True)
     api_token = models.CharField(
         max_length=255, null=True, blank=True, unique=True)
+    # Última leitura recebida (storeData), mantida para a listagem não consultar Data
+    last_seen_at = models.DateTimeField(null=True, blank=True)
+    last_value = models.FloatField(null=True, blank=True)
 
     def __str__(self):
         if self.name:
@@ -96,7 +100,11 @@ class DeviceLog(models.Model):
     api_token = models.CharField(
         max_length=255, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['device', 'created_at'], name='devicelog_device_created_idx'),
+        ]
 
     def __str__(self):
         if self.device.name:
@@ -114,6 +122,16 @@ class Data(models.Model):
     total = models.FloatField(default=0)  # Listros totais
     collect_date = models.DateTimeField(auto_now_add=True)  # Data de coleta
 
+    class Meta:
+        indexes = [
+            # Janelas de tempo por dispositivo (_series_by_device, processData)
+            models.Index(fields=['device', 'collect_date'], name='data_device_date_idx'),
+            # Última leitura de cada tipo do dispositivo (storeData)
+            models.Index(fields=['device', 'type', 'id'], name='data_device_type_id_idx'),
+            # Janelas de tempo de todos os dispositivos (buffer de leituras recentes)
+            models.Index(fields=['collect_date'], name='data_collect_date_idx'),
+        ]
+
 class ProcessedData(models.Model):
     device = models.ForeignKey(Device, on_delete=models.CASCADE, blank=True)
     interval = models.IntegerField(default=IntervalTypes.notSelected, choices=IntervalTypes.choices)
@@ -127,12 +145,85 @@ class ProcessedData(models.Model):
     tq = models.FloatField(blank=True, null=True) # third quartile
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['device', 'created_at'], name='pdata_device_created_idx'),
+        ]
+
 class Graph(models.Model):
     device = models.ForeignKey(
         Device, on_delete=models.CASCADE, null=True, blank=True)
+    # Chave do GraphSpec (app/graph_specs.py) que gera o arquivo
+    key = models.CharField(max_length=100, blank=True, default='', db_index=True)
     type = models.IntegerField(
         choices=GraphsTypes.choices, default=GraphsTypes.none)
     file_path = models.CharField(max_length=255, blank=True, null=True)
+    # Digest dos dados usados no último arquivo gerado e hash do HTML (ETag)
+    fingerprint = models.CharField(max_length=64, blank=True, default='')
+    content_hash = models.CharField(max_length=64, blank=True, default='')
+    generated_at = models.DateTimeField(null=True, blank=True)
+    render_seconds = models.FloatField(null=True, blank=True)
+
+
+class ConsumptionCube(models.Model):
+    """Consumption of one device type, section and location in one hour or day.
+
+    Maintained by app/consumption.py after the rollups; section and location
+    are '' for devices without them.
+    """
+    device_type = models.IntegerField(choices=DeviceTypes.choices)
+    section = models.CharField(max_length=255, blank=True, default='')
+    location = models.CharField(max_length=255, blank=True, default='')
+    interval = models.IntegerField(choices=IntervalTypes.choices)
+    period_start = models.DateTimeField()
+    total = models.FloatField(default=0)
+    samples = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['interval', 'period_start', 'device_type', 'section', 'location'],
+                name='consumption_cube_cell_unique',
+            ),
+        ]
+        indexes = [
+            # Painéis e API: um tipo de dispositivo em uma janela de tempo
+            models.Index(fields=['interval', 'device_type', 'period_start'], name='cube_type_period_idx'),
+        ]
+
+
+class DetectorState(models.Model):
+    """EWMA mean and variance of the readings of one device and data type.
+
+    The only copy of the state: app/anomalies.py locks the rows of each
+    request (SELECT ... FOR UPDATE) and writes them back after its readings
+    commit, so every worker and restart shares it.
+    """
+    device = models.ForeignKey(Device, on_delete=models.CASCADE)
+    type = models.IntegerField(choices=DataTypes.choices)
+    mean = models.FloatField(default=0)
+    variance = models.FloatField(default=0)
+    samples = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['device', 'type'], name='detector_state_unique'),
+        ]
+
+
+class Anomaly(models.Model):
+    """Reading far from the EWMA of its device and data type (app/anomalies.py)."""
+    device = models.ForeignKey(Device, on_delete=models.CASCADE)
+    type = models.IntegerField(choices=DataTypes.choices)
+    value = models.FloatField()
+    expected = models.FloatField()  # média móvel antes da leitura
+    z_score = models.FloatField()
+    detected_at = models.DateTimeField()  # collect_date da leitura
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['device', 'detected_at'], name='anomaly_device_date_idx'),
+        ]
 
 
 class New(models.Model):
@@ -0,0 +1,145 @@
+"""
+Monthly RANGE partitioning of the `Data` table on MySQL.
+
+Every hot query filters `collect_date` by range, so with one partition per
+month MySQL only opens the partitions of the requested window and expired
+months are removed with `DROP PARTITION` instead of a long DELETE.
+"""
+
+from datetime import date
+
+from django.db import connection
+
+from .models import Data
+
+MAXVALUE_PARTITION = 'pmax'
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(day, months):
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"p{month.year:04d}{month.month:02d}"
+
+
+def partition_month(name):
+    """Inverse of `partition_name`; None for `pmax`."""
+    if name == MAXVALUE_PARTITION:
+        return None
+    return date(int(name[1:5]), int(name[5:7]), 1)
+
+
+def _partition_definition(month):
+    upper = add_months(month, 1)
+    return f"PARTITION {partition_name(month)} VALUES LESS THAN (TO_DAYS('{upper.isoformat()}'))"
+
+
+def months_between(first, last):
+    months = []
+    current = month_start(first)
+    while current <= last:
+        months.append(current)
+        current = add_months(current, 1)
+    return months
+
+
+def partition_table_sql(table, months):
+    """SQL that converts `table` into a partitioned table covering `months`."""
+    definitions = [_partition_definition(month) for month in months]
+    definitions.append(f"PARTITION {MAXVALUE_PARTITION} VALUES LESS THAN MAXVALUE")
+    return f"ALTER TABLE {table} PARTITION BY RANGE (TO_DAYS(collect_date)) ({', '.join(definitions)})"
+
+
+def add_partitions_sql(table, months):
+    """Split the empty `pmax` partition to create the given future months."""
+    definitions = [_partition_definition(month) for month in months]
+    definitions.append(f"PARTITION {MAXVALUE_PARTITION} VALUES LESS THAN MAXVALUE")
+    return f"ALTER TABLE {table} REORGANIZE PARTITION {MAXVALUE_PARTITION} INTO ({', '.join(definitions)})"
+
+
+def drop_partitions_sql(table, names):
+    return f"ALTER TABLE {table} DROP PARTITION {', '.join(names)}"
+
+
+def existing_partitions(table=None):
+    """Return the partition names of `table` ordered by position."""
+    table = table or Data._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL "
+            "ORDER BY PARTITION_ORDINAL_POSITION",
+            [table],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _foreign_keys(table):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS "
+            "WHERE CONSTRAINT_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+            [table],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def setup_statements(today, ahead):
+    """Statements that partition `Data` from its oldest row up to `ahead` months.
+
+    MySQL requires the partitioning column in every unique key and does not
+    support foreign keys on partitioned tables, so the primary key becomes
+    (id, collect_date) and the device constraint is left to the ORM, which
+    already emulates `on_delete=CASCADE`.
+    """
+    table = Data._meta.db_table
+    oldest = Data.objects.order_by('collect_date').values_list('collect_date', flat=True).first()
+    first_month = month_start(oldest.date() if oldest else today)
+
+    statements = [f"ALTER TABLE {table} DROP FOREIGN KEY {name}" for name in _foreign_keys(table)]
+    statements.append(f"ALTER TABLE {table} DROP PRIMARY KEY, ADD PRIMARY KEY (id, collect_date)")
+    statements.append(partition_table_sql(table, months_between(first_month, add_months(month_start(today), ahead))))
+    return statements
+
+
+def maintenance_statements(existing, today, ahead, retention):
+    """Statements that create missing future months and drop expired ones.
+
+    `retention` is the number of whole months kept before the current one;
+    0 keeps every partition.
+    """
+    table = Data._meta.db_table
+    months = [partition_month(name) for name in existing if partition_month(name)]
+    statements = []
+
+    last_wanted = add_months(month_start(today), ahead)
+    if months and months[-1] < last_wanted:
+        statements.append(add_partitions_sql(table, months_between(add_months(months[-1], 1), last_wanted)))
+
+    if retention:
+        oldest_kept = add_months(month_start(today), -retention)
+        expired = [partition_name(month) for month in months if month < oldest_kept]
+        if expired:
+            statements.append(drop_partitions_sql(table, expired))
+
+    return statements
+
+
+def pruned_partitions(queryset):
+    """Return the partitions MySQL will read for `queryset`, from EXPLAIN."""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN {sql}", params)
+        columns = [column[0] for column in cursor.description]
+        used = set()
+        for row in cursor.fetchall():
+            partitions = dict(zip(columns, row)).get('partitions')
+            if partitions:
+                used.update(partitions.split(','))
+        return used
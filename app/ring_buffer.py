@@ -0,0 +1,328 @@
+"""
+Shared-memory ring buffer with the most recent readings of every device.
+
+All gunicorn workers of a node attach to the same POSIX shared memory
+segment, so the last day of readings is kept once per node and read
+straight from the NumPy views over the segment instead of querying `Data`.
+
+Layout of the segment (one slot per device/data type):
+    header      int64[4]               magic, capacity, slots, generation
+    coverage    float64[1]             epoch from which the buffer is complete
+    keys        int64[slots, 2]        (device_id, data type), device_id 0 = free
+    heads       int64[slots]           samples ever written to the slot
+    timestamps  float64[slots, cap]    epoch seconds (UTC)
+    values      float32[slots, cap]    last_collection
+"""
+
+import fcntl
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import timedelta
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy
+from django.conf import settings
+from django.utils import timezone
+
+_MAGIC = 0x4D4F524541  # "MOREA"
+
+_buffer = None
+
+
+@contextmanager
+def _segment_lock(name, blocking=True):
+    """Serialize writers of every process attached to the segment `name`.
+
+    Without `blocking`, raises BlockingIOError if another process holds
+    the lock. The kernel releases it when its holder dies.
+    """
+    lock_path = os.path.join(tempfile.gettempdir(), f"{name}.lock")
+    with open(lock_path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class RecentReadings:
+    """NumPy views over the shared segment plus the append/read operations."""
+
+    def __init__(self, shm, slots, capacity):
+        self.shm = shm
+        self.slots = slots
+        self.capacity = capacity
+        self._local_slots = {}
+        self._local_generation = None
+
+        offset = 0
+        self.header = numpy.ndarray((4,), dtype=numpy.int64, buffer=shm.buf, offset=offset)
+        offset += self.header.nbytes
+        self.coverage = numpy.ndarray((1,), dtype=numpy.float64, buffer=shm.buf, offset=offset)
+        offset += self.coverage.nbytes
+        self.keys = numpy.ndarray((slots, 2), dtype=numpy.int64, buffer=shm.buf, offset=offset)
+        offset += self.keys.nbytes
+        self.heads = numpy.ndarray((slots,), dtype=numpy.int64, buffer=shm.buf, offset=offset)
+        offset += self.heads.nbytes
+        self.timestamps = numpy.ndarray((slots, capacity), dtype=numpy.float64, buffer=shm.buf, offset=offset)
+        offset += self.timestamps.nbytes
+        self.values = numpy.ndarray((slots, capacity), dtype=numpy.float32, buffer=shm.buf, offset=offset)
+
+    @staticmethod
+    def size(slots, capacity):
+        return 8 * 4 + 8 + slots * (8 * 2 + 8) + slots * capacity * (8 + 4)
+
+    @property
+    def ready(self):
+        return self.header[0] == _MAGIC
+
+    def _locked(self, blocking=True):
+        return _segment_lock(self.shm.name, blocking)
+
+    def _slot(self, device_id, data_type, create=False):
+        if self._local_generation != self.header[3]:
+            self._local_slots = {}
+            self._local_generation = int(self.header[3])
+
+        key = (device_id, data_type)
+        if key in self._local_slots:
+            return self._local_slots[key]
+
+        matches = numpy.flatnonzero((self.keys[:, 0] == device_id) & (self.keys[:, 1] == data_type))
+        if matches.size:
+            slot = int(matches[0])
+        elif create:
+            free = numpy.flatnonzero(self.keys[:, 0] == 0)
+            if not free.size:
+                # Sem slot livre: a janela deixa de ser completa e as leituras voltam ao banco
+                self.coverage[0] = numpy.inf
+                return None
+            slot = int(free[0])
+            self.heads[slot] = 0
+            self.keys[slot] = key
+        else:
+            return None
+
+        self._local_slots[key] = slot
+        return slot
+
+    def _append(self, device_id, data_type, epoch, value):
+        slot = self._slot(device_id, data_type, create=True)
+        if slot is None:
+            return
+        position = self.heads[slot] % self.capacity
+        self.timestamps[slot, position] = epoch
+        self.values[slot, position] = value
+        self.heads[slot] += 1
+
+    def append(self, device_id, data_type, collected_at, value):
+        """Store one reading; called by `storeData` once its transaction commits."""
+        with self._locked():
+            self._append(device_id, data_type, collected_at.timestamp(), value)
+
+    def _reload(self, window):
+        from .models import Data
+
+        date_from = timezone.now() - window
+        samples = (
+            Data.objects.filter(collect_date__gte=date_from, device__isnull=False)
+            .order_by('collect_date')
+            .values_list('device_id', 'type', 'collect_date', 'last_collection')
+        )
+
+        self.header[0] = 0
+        self.keys[:] = 0
+        self.heads[:] = 0
+        self.header[3] += 1
+        self.coverage[0] = date_from.timestamp()
+
+        for device_id, data_type, collected_at, value in samples.iterator(chunk_size=2000):
+            if value is not None:
+                self._append(device_id, data_type, collected_at.timestamp(), value)
+
+        self.header[1] = self.capacity
+        self.header[2] = self.slots
+        self.header[0] = _MAGIC
+
+    def rebuild(self, window):
+        """Reload the last `window` of readings from the database."""
+        with self._locked():
+            self._reload(window)
+
+    def repair(self, window):
+        """Rebuild a segment that is not ready, unless another process holds the lock.
+
+        Covers a new segment and a process that died in the middle of a
+        rebuild, which would otherwise leave the segment not ready for good.
+        """
+        try:
+            with self._locked(blocking=False):
+                if not self.ready:
+                    self._reload(window)
+        except BlockingIOError:
+            # Outro processo está recarregando; leituras caem no banco até lá
+            pass
+
+    def device_window(self, device_id, date_from, data_type=None):
+        """Return (epoch seconds, values) of a device since `date_from`.
+
+        Only readings of `data_type` are returned when it is given. Returns
+        None when the buffer cannot guarantee a complete window, so the
+        caller falls back to the database.
+        """
+        since = date_from.timestamp()
+        if not self.ready or since < self.coverage[0]:
+            return None
+
+        times = []
+        values = []
+        matches = self.keys[:, 0] == device_id
+        if data_type is not None:
+            matches &= self.keys[:, 1] == data_type
+        for slot in numpy.flatnonzero(matches):
+            head = int(self.heads[slot])
+            if head > self.capacity:
+                order = numpy.roll(numpy.arange(self.capacity), -(head % self.capacity))
+                slot_times = self.timestamps[slot, order]
+                if slot_times[0] > since:
+                    return None
+                slot_values = self.values[slot, order]
+            else:
+                slot_times = self.timestamps[slot, :head]
+                slot_values = self.values[slot, :head]
+
+            selected = slot_times >= since
+            times.append(slot_times[selected])
+            values.append(slot_values[selected])
+
+        if not times:
+            return numpy.empty(0, dtype=numpy.float64), numpy.empty(0, dtype=numpy.float32)
+
+        times = numpy.concatenate(times)
+        values = numpy.concatenate(values)
+        order = numpy.argsort(times, kind='stable')
+        return times[order], values[order]
+
+    def samples_since(self, position):
+        """Readings appended by any process since `position`.
+
+        `position` is the first item returned by a previous call, or None to
+        start from the current heads. Returns (position, [(device_id,
+        data_type, epochs, values)]); after a rebuild reading restarts from
+        the new heads.
+        """
+        if not self.ready:
+            return position, []
+
+        generation = int(self.header[3])
+        heads = self.heads.copy()
+        if position is None or position[0] != generation:
+            return (generation, heads), []
+
+        samples = []
+        previous = position[1]
+        for slot in numpy.flatnonzero(heads > previous):
+            head = int(heads[slot])
+            count = min(head - int(previous[slot]), self.capacity)
+            positions = numpy.arange(head - count, head) % self.capacity
+            device_id, data_type = (int(key) for key in self.keys[slot])
+            samples.append((
+                device_id,
+                data_type,
+                self.timestamps[slot, positions].copy(),
+                self.values[slot, positions].astype(numpy.float64),
+            ))
+        return (generation, heads), samples
+
+    def close(self, unlink=False):
+        self.header = self.coverage = self.keys = self.heads = None
+        self.timestamps = self.values = None
+        self.shm.close()
+        if unlink:
+            resource_tracker.register(self.shm._name, 'shared_memory')
+            self.shm.unlink()
+
+
+def _has_layout(shm, slots, capacity):
+    if shm.size < RecentReadings.size(slots, capacity):
+        return False
+    _, stored_capacity, stored_slots, _ = numpy.frombuffer(shm.buf, dtype=numpy.int64, count=4).tolist()
+    return (stored_capacity, stored_slots) == (capacity, slots)
+
+
+def _open_segment(name, slots, capacity):
+    """Attach to the node segment, creating it when this is the first process.
+
+    The segment outlives the processes, so one left by a deploy with other
+    RING_BUFFER_SLOTS/RING_BUFFER_CAPACITY is replaced by an empty one.
+    """
+    with _segment_lock(name):
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            shm = None
+        else:
+            if not _has_layout(shm, slots, capacity):
+                # Workers antigos ainda presos ao segmento seguem com a sua cópia até sair
+                shm.close()
+                shm.unlink()
+                shm = None
+
+        if shm is None:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=RecentReadings.size(slots, capacity))
+            # Layout gravado já na criação; o segmento só fica pronto depois da recarga
+            numpy.frombuffer(shm.buf, dtype=numpy.int64, count=4)[1:3] = (capacity, slots)
+
+    # O resource_tracker removeria o segmento quando o worker que o abriu
+    # terminasse; o ciclo de vida pertence ao nó, não ao processo.
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+def get_buffer():
+    """Return the node-wide buffer, or None when it is disabled.
+
+    Only attaches: a segment that is not ready is served from the database
+    until `warm_up` rebuilds it.
+    """
+    global _buffer
+
+    if not settings.RING_BUFFER_ENABLED:
+        return None
+
+    if _buffer is None or _buffer.shm.name.lstrip('/') != settings.RING_BUFFER_NAME:
+        slots = settings.RING_BUFFER_SLOTS
+        capacity = settings.RING_BUFFER_CAPACITY
+        shm = _open_segment(settings.RING_BUFFER_NAME, slots, capacity)
+        _buffer = RecentReadings(shm, slots, capacity)
+
+    return _buffer
+
+
+def warm_up():
+    """Attach when a worker starts and rebuild the segment if it is not ready.
+
+    Run by the gunicorn `post_worker_init` hook (gunicorn.conf.py), so no
+    ingest request pays for the reload of the window.
+    """
+    buffer = get_buffer()
+    # Segmento novo (zerado) ou deixado pela metade por um processo que morreu
+    if buffer is not None and not buffer.ready:
+        buffer.repair(timedelta(hours=settings.RING_BUFFER_WINDOW_HOURS))
+    return buffer
+
+
+def record(device_id, data_type, collected_at, value):
+    """Append a reading to the buffer when it is enabled."""
+    buffer = get_buffer()
+    if buffer is not None and value is not None:
+        buffer.append(int(device_id), int(data_type), collected_at, float(value))
+
+
+def close(unlink=False):
+    global _buffer
+
+    if _buffer is not None:
+        _buffer.close(unlink=unlink)
+        _buffer = None
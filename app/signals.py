@@ -0,0 +1,36 @@
+"""
+Invalidation of the cached public pages (app/caching.py).
+
+Connected in AppConfig.ready().
+"""
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .caching import bump_versions
+from .models import Device, ExtendUser, Graph, New
+
+
+@receiver([post_save, post_delete], sender=ExtendUser)
+def member_changed(sender, update_fields=None, **kwargs):
+    # O login só atualiza last_login, que nenhuma página pública mostra
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    # Notícias mostram nome e foto do autor
+    bump_versions('members', 'news')
+
+
+@receiver([post_save, post_delete], sender=New)
+def news_changed(sender, **kwargs):
+    bump_versions('news')
+
+
+@receiver([post_save, post_delete], sender=Graph)
+def graph_changed(sender, **kwargs):
+    bump_versions('graphs')
+
+
+@receiver([post_save, post_delete], sender=Device)
+def device_changed(sender, **kwargs):
+    # Opções de filtro da device_list (localizações e seções)
+    bump_versions('devices')
@@ -0,0 +1,36 @@
+"""
+Static files storage with hashed names and pre-compressed variants.
+
+collectstatic stores every asset under a content-hashed name (served with
+a far-future Cache-Control by app.file_serving) and writes `.gz`/`.br`
+variants of the text assets next to both names.
+"""
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+from .compression import write_compressed
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # Antes do primeiro collectstatic (desenvolvimento, testes) não há manifesto
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # Arquivo ainda não coletado: usa o nome sem hash
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        collected = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                collected.update((name, hashed_name))
+            yield name, hashed_name, processed
+
+        if dry_run:
+            return
+
+        for name in sorted(collected):
+            write_compressed(self.path(name))
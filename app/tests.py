@@ -1,21 +1,84 @@
+import asyncio
+import gzip
+import hashlib
+import io
+import json
+import os
+import runpy
 import shutil
+import sqlite3
 import tempfile
+import unittest
+from unittest import mock
 from pathlib import Path
-from datetime import timedelta
+from datetime import date, timedelta
 
-from django.test import TestCase
+import numpy
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import call_command
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.http import Http404, HttpResponse
+from django.db import DatabaseError, connection, transaction
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, TransactionTestCase
 from django.utils import timezone
 
-from .graphs import generateAllMotes24hRaw
+from . import aggregation, anomalies, api, consumption, device_charts, file_serving, graphs, live, liveness, partitioning, ring_buffer
+from .caching import cache_version
+from .compression import atomic_write, write_compressed
+from .data_processing import hourlyDataProcessing, processData
+from .device_charts import device_chart
+from .finders import PlotlyBundleFinder, plotly_bundle_path
+from .db_router import PrimaryReplicaRouter, reporting_reads
+from .middleware import PIN_COOKIE, ReplicaRoutingMiddleware
+from .backends.pool import ConnectionPool, PoolExhausted
+from .backends.sqlite3.base import DatabaseWrapper as TunedSQLiteWrapper
+from .graph_specs import GRAPH_SPECS, GraphSpec, register
+from .graphs import _line_chart_figure, _series_by_device, generateAllMotes24hRaw, generateGraphs, lttb_indices
+from .views import (
+	chart_data,
+	dashboard,
+	device_detail,
+	device_list,
+	export_data,
+	live_readings,
+	members,
+	prometheus_metrics,
+	storeData,
+)
 from .models import (
+	Anomaly,
 	AuthTypes,
+	ConsumptionCube,
 	Data,
+	DataTypes,
+	DetectorState,
 	Device,
+	DeviceLog,
 	DeviceTypes,
+	ExtendUser,
 	Graph,
 	GraphsTypes,
+	IntervalTypes,
+	New,
+	ProcessedData,
 )
 
+ALL_GRAPH_KEYS = ['allWMoteDevices24hRaw', 'allEMoteDevices24hRaw', 'allGMoteDevices24hRaw']
+
+
+def store_data_request(*values, api_token='token-1', data_type=1):
+	"""POST /api/store-data with one reading of `data_type` per value."""
+	return RequestFactory().post(
+		'/api/store-data',
+		data=json.dumps({
+			'apiToken': api_token,
+			'macAddress': 'AA:BB',
+			'measure': [{'type': data_type, 'value': value} for value in values],
+		}),
+		content_type='application/json',
+	)
+
 
 class GenerateAllMotes24hRawTests(TestCase):
 	def setUp(self):
@@ -62,6 +125,82 @@ class GenerateAllMotes24hRawTests(TestCase):
 			self.assertEqual(graph_entry.file_path, relative_path)
 			self.assertTrue((Path(self.temp_media) / relative_path).is_file())
 
+	def test_series_by_device_reads_all_devices_in_one_query(self):
+		first = self._create_device_with_samples(DeviceTypes.water, "Water-1", [10.0, 15.0])
+		second = self._create_device_with_samples(DeviceTypes.water, "Water-2", [1.0])
+		empty = Device.objects.create(name="Water-3", type=DeviceTypes.water)
+		# auto_now_add ignora o collect_date passado na criação
+		Data.objects.filter(device=first, last_collection=15.0).update(collect_date=timezone.now() - timedelta(hours=1))
+
+		with self.settings(TIME_ZONE='America/Sao_Paulo'), self.assertNumQueries(2):
+			series = _series_by_device([first.id, second.id, empty.id], timezone.now() - timedelta(days=1))
+
+		times, values = series["Water-1"]
+		self.assertEqual(list(values), [15.0, 10.0])
+		latest = Data.objects.filter(device=first).latest('collect_date').collect_date
+		self.assertEqual(
+			times[-1].astype('datetime64[us]').item(),
+			(latest - timedelta(hours=3)).replace(tzinfo=None),
+		)
+		self.assertEqual(list(series["Water-2"][1]), [1.0])
+		self.assertEqual(len(series["Water-3"][0]), 0)
+
+	def test_graph_files_reference_the_shared_plotly_bundle(self):
+		with self.settings(MEDIA_ROOT=self.temp_media):
+			self._create_device_with_samples(DeviceTypes.water, "Water-1", [10.0, 15.0])
+			generateAllMotes24hRaw()
+
+		html = (Path(self.temp_media) / 'graphs/allWMoteDevices24hRaw.html').read_text()
+		self.assertIn(f'src="/static/{plotly_bundle_path()}"', html)
+		self.assertLess(len(html), 100 * 1024)
+
+		bundle = PlotlyBundleFinder().find(plotly_bundle_path())
+		self.assertTrue(Path(bundle).is_file())
+
+	def test_generate_all_motes_skips_unchanged_graphs(self):
+		with self.settings(MEDIA_ROOT=self.temp_media):
+			water = self._create_device_with_samples(DeviceTypes.water, "Water-1", [10.0, 15.0])
+			self._create_device_with_samples(DeviceTypes.gas, "Gas-1", [2.5])
+
+			self.assertEqual(generateAllMotes24hRaw(), ALL_GRAPH_KEYS)
+			self.assertEqual(generateAllMotes24hRaw(), [])
+
+			Data.objects.create(device=water, type=DeviceTypes.water, last_collection=20.0, total=45.0)
+			self.assertEqual(generateAllMotes24hRaw(), ['allWMoteDevices24hRaw'])
+
+			(Path(self.temp_media) / 'graphs/allGMoteDevices24hRaw.html').unlink()
+			self.assertEqual(generateAllMotes24hRaw(), ['allGMoteDevices24hRaw'])
+			self.assertEqual(generateAllMotes24hRaw(force=True), ALL_GRAPH_KEYS)
+
+		graph = Graph.objects.get(type=GraphsTypes.allWMoteDevices24hRaw)
+		html = (Path(self.temp_media) / graph.file_path).read_bytes()
+		self.assertEqual(graph.content_hash, hashlib.sha256(html).hexdigest())
+		self.assertIsNotNone(graph.generated_at)
+		names = sorted(path.name for path in (Path(self.temp_media) / 'graphs').iterdir())
+		self.assertEqual(
+			[name for name in names if name.endswith('.html')],
+			['allEMoteDevices24hRaw.html', 'allGMoteDevices24hRaw.html', 'allWMoteDevices24hRaw.html'],
+		)
+		self.assertFalse([name for name in names if name.startswith('.tmp-')])
+
+	def test_generate_all_motes_renders_on_a_process_pool(self):
+		with self.settings(MEDIA_ROOT=self.temp_media, GRAPH_WORKERS=3):
+			self._create_device_with_samples(DeviceTypes.water, "Water-1", [10.0, 15.0])
+			self._create_device_with_samples(DeviceTypes.energy, "Energy-1", [5.0])
+
+			self.assertEqual(generateAllMotes24hRaw(), ALL_GRAPH_KEYS)
+
+		for graph in Graph.objects.all():
+			html = (Path(self.temp_media) / graph.file_path).read_bytes()
+			self.assertEqual(graph.content_hash, hashlib.sha256(html).hexdigest())
+			self.assertGreater(graph.render_seconds, 0)
+
+		response = prometheus_metrics(RequestFactory().get('/metrics'))
+		self.assertIn(
+			b'morea_graph_render_seconds{graph="graphs/allWMoteDevices24hRaw.html"}',
+			response.content,
+		)
+
 	def test_generate_all_motes_handles_missing_devices(self):
 		with self.settings(MEDIA_ROOT=self.temp_media):
 			generateAllMotes24hRaw()
@@ -72,3 +211,1359 @@ class GenerateAllMotes24hRawTests(TestCase):
 			GraphsTypes.allGMoteDevices24hRaw,
 		):
 			self.assertTrue(Graph.objects.filter(type=graph_type).exists())
+
+
+class GraphSpecRegistryTests(TestCase):
+	def setUp(self):
+		self.temp_media = tempfile.mkdtemp(prefix="morea-media-")
+		self.device = Device.objects.create(name="Water-1", type=DeviceTypes.water, is_authorized=AuthTypes.Authorized)
+		now = timezone.now().replace(minute=0, second=0, microsecond=0)
+		for hours_ago, value in ((2, 1.0), (30, 2.0), (29.5, 3.0), (200, 4.0)):
+			reading = Data.objects.create(device=self.device, type=DataTypes.volume, last_collection=value, total=value)
+			Data.objects.filter(pk=reading.pk).update(collect_date=now - timedelta(hours=hours_ago))
+		self.specs = [
+			GraphSpec(
+				key='water24h',
+				device_filter={'type': DeviceTypes.water},
+				unit='Consumo(L)',
+				file_path='graphs/water24h.html',
+			),
+			GraphSpec(
+				key='water7dHourly',
+				device_filter={'type': DeviceTypes.water},
+				unit='Consumo(L)',
+				file_path='graphs/water7dHourly.html',
+				window=timedelta(days=7),
+				aggregation='hour',
+			),
+		]
+
+	def tearDown(self):
+		shutil.rmtree(self.temp_media, ignore_errors=True)
+
+	def test_overlapping_specs_share_one_read(self):
+		with self.settings(MEDIA_ROOT=self.temp_media, GRAPH_WORKERS=1), \
+				mock.patch('app.graphs._device_windows', wraps=graphs._device_windows) as device_windows, \
+				mock.patch('app.graphs._render_charts', wraps=graphs._render_charts) as render_charts:
+			self.assertEqual(generateGraphs(self.specs), ['water24h', 'water7dHourly'])
+
+		device_windows.assert_called_once()
+		tasks = render_charts.call_args.args[0]
+		self.assertEqual(list(tasks['water24h'][0]['Water-1'][1]), [1.0])
+		# 30h e 29.5h caem na mesma hora e são somadas; 200h fica fora dos 7 dias
+		self.assertEqual(list(tasks['water7dHourly'][0]['Water-1'][1]), [5.0, 1.0])
+		self.assertTrue(Graph.objects.filter(key='water7dHourly', file_path='graphs/water7dHourly.html').exists())
+		self.assertTrue((Path(self.temp_media) / 'graphs/water7dHourly.html').is_file())
+
+	def test_registry_rejects_duplicate_keys_and_unknown_aggregations(self):
+		with self.assertRaises(ValueError):
+			register(GRAPH_SPECS[0])
+		with self.assertRaises(ValueError):
+			GraphSpec(key='bad', device_filter={}, unit='', file_path='graphs/bad.html', aggregation='week')
+
+	def test_dashboard_links_registered_graphs(self):
+		with self.settings(MEDIA_ROOT=self.temp_media):
+			generateAllMotes24hRaw()
+
+		request = RequestFactory().get('/dashboard')
+		request.user = AnonymousUser()
+		content = dashboard(request).content.decode()
+		for key in ALL_GRAPH_KEYS:
+			graph = Graph.objects.get(key=key)
+			self.assertIn(f"{graph.file_path}?v={graph.content_hash[:12]}", content)
+
+
+class DeviceChartTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.device = Device.objects.create(name="Water-1", type=DeviceTypes.water, is_authorized=AuthTypes.Authorized)
+		for value in (1.0, 2.0, 3.0):
+			Data.objects.create(device=self.device, type=DataTypes.volume, last_collection=value, total=value)
+
+	def tearDown(self):
+		cache.clear()
+
+	def test_ranges_use_the_most_suitable_source(self):
+		self.assertEqual(device_charts._chart_source(self.device.id, '7d')[0], None)
+
+		hourlyDataProcessing()
+		rollup = ProcessedData.objects.get(device=self.device)
+		self.assertEqual(rollup.interval, IntervalTypes.hourly)
+		self.assertEqual(rollup.mean, 2.0)
+
+		interval, version = device_charts._chart_source(self.device.id, '7d')
+		self.assertEqual((interval, version), (IntervalTypes.hourly, f"p{rollup.id}"))
+		self.assertEqual(device_charts._chart_source(self.device.id, '24h')[0], None)
+		# Sem rollups diários recentes o gráfico de 30 dias cai para as leituras brutas
+		self.assertEqual(device_charts._chart_source(self.device.id, '30d')[0], None)
+
+		series = device_charts._device_series(self.device, timedelta(days=7), IntervalTypes.hourly)
+		self.assertEqual(list(series["Water-1 (hourly)"][1]), [2.0])
+
+	def test_charts_are_cached_until_the_data_version_changes(self):
+		with mock.patch('app.device_charts._render_device_chart', return_value='<div>v1</div>') as render_chart:
+			self.assertEqual(device_chart(self.device, '24h'), '<div>v1</div>')
+			self.assertEqual(device_chart(self.device, '24h'), '<div>v1</div>')
+			self.assertEqual(render_chart.call_count, 1)
+
+			Data.objects.create(device=self.device, type=DataTypes.volume, last_collection=4.0, total=10.0)
+			render_chart.return_value = '<div>v2</div>'
+			self.assertEqual(device_chart(self.device, '24h'), '<div>v2</div>')
+			self.assertEqual(render_chart.call_count, 2)
+
+	def test_concurrent_requests_get_the_previous_chart_while_one_renders(self):
+		with mock.patch('app.device_charts._render_device_chart', return_value='<div>v1</div>'):
+			device_chart(self.device, '24h')
+
+		Data.objects.create(device=self.device, type=DataTypes.volume, last_collection=4.0, total=10.0)
+		_, version = device_charts._chart_source(self.device.id, '24h')
+		cache.add(f"device-chart:{self.device.id}:24h:{version}:lock", 1)
+
+		with mock.patch('app.device_charts._render_device_chart') as render_chart:
+			self.assertEqual(device_chart(self.device, '24h'), '<div>v1</div>')
+		render_chart.assert_not_called()
+
+	def test_device_detail_renders_the_selected_range(self):
+		request = RequestFactory().get(f'/device-detail/{self.device.id}/', {'range': '1h'})
+		request.user = ExtendUser.objects.create_user(
+			username="admin", email="admin@example.com", password="x", first_name="Ada", last_name="Lovelace",
+		)
+		content = device_detail(request, self.device.id).content.decode()
+
+		self.assertIn('Plotly.newPlot', content)
+		self.assertIn('class="chart-range active">1h</a>', content)
+		self.assertIn(f'src="/static/{plotly_bundle_path()}"', content)
+
+
+class FileServingTests(TestCase):
+	def setUp(self):
+		self.temp_media = tempfile.mkdtemp(prefix="morea-media-")
+		self.temp_static = tempfile.mkdtemp(prefix="morea-static-")
+		self.html = b"<html>" + b"consumo " * 200 + b"</html>"
+		self.graph_path = os.path.join(self.temp_media, 'graphs', 'chart.html')
+		atomic_write(self.graph_path, self.html)
+		write_compressed(self.graph_path, self.html)
+
+	def tearDown(self):
+		shutil.rmtree(self.temp_media, ignore_errors=True)
+		shutil.rmtree(self.temp_static, ignore_errors=True)
+
+	def _get(self, view, path, **headers):
+		request = RequestFactory().get(f'/{path}', **headers)
+		response = view(request, path)
+		body = b''.join(response.streaming_content) if response.streaming else response.content
+		return response, body
+
+	def test_media_is_served_precompressed_with_etags(self):
+		with self.settings(MEDIA_ROOT=self.temp_media):
+			response, body = self._get(file_serving.serve_media, 'graphs/chart.html', HTTP_ACCEPT_ENCODING='gzip, deflate')
+			self.assertEqual(response['Content-Encoding'], 'gzip')
+			self.assertEqual(gzip.decompress(body), self.html)
+			self.assertEqual(response['Vary'], 'Accept-Encoding')
+			self.assertEqual(response['Cache-Control'], 'no-cache')
+
+			identity, body = self._get(file_serving.serve_media, 'graphs/chart.html')
+			self.assertNotIn('Content-Encoding', identity)
+			self.assertEqual(body, self.html)
+			self.assertNotEqual(identity['ETag'], response['ETag'])
+
+			not_modified, _ = self._get(
+				file_serving.serve_media, 'graphs/chart.html',
+				HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'],
+			)
+			self.assertEqual(not_modified.status_code, 304)
+			self.assertEqual(not_modified['ETag'], response['ETag'])
+
+	def test_variants_older_than_the_file_are_ignored(self):
+		with self.settings(MEDIA_ROOT=self.temp_media):
+			stat = os.stat(self.graph_path + '.gz')
+			os.utime(self.graph_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+			response, body = self._get(file_serving.serve_media, 'graphs/chart.html', HTTP_ACCEPT_ENCODING='gzip')
+
+		self.assertNotIn('Content-Encoding', response)
+		self.assertEqual(body, self.html)
+
+	def test_collected_static_files_are_hashed_compressed_and_immutable(self):
+		with self.settings(STATIC_ROOT=self.temp_static):
+			call_command('collectstatic', interactive=False, verbosity=0)
+			hashed = staticfiles_storage.stored_name('css/device_detail.css')
+
+			self.assertRegex(hashed, r'^css/device_detail\.[0-9a-f]{12}\.css$')
+			response, body = self._get(file_serving.serve_static, hashed, HTTP_ACCEPT_ENCODING='gzip')
+			self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+			self.assertEqual(response['Content-Encoding'], 'gzip')
+			self.assertIn(b'.device-chart', gzip.decompress(body))
+
+			response, _ = self._get(file_serving.serve_static, 'css/device_detail.css')
+			self.assertEqual(response['Cache-Control'], 'no-cache')
+
+		with self.assertRaises(Http404):
+			self._get(file_serving.serve_static, '../manage.py')
+
+	def test_byte_ranges(self):
+		with self.settings(MEDIA_ROOT=self.temp_media):
+			full, _ = self._get(file_serving.serve_media, 'graphs/chart.html')
+			self.assertEqual(full['Accept-Ranges'], 'bytes')
+
+			partial, body = self._get(file_serving.serve_media, 'graphs/chart.html', HTTP_RANGE='bytes=6-12')
+			self.assertEqual(partial.status_code, 206)
+			self.assertEqual(body, self.html[6:13])
+			self.assertEqual(partial['Content-Range'], f"bytes 6-12/{len(self.html)}")
+			self.assertEqual(partial['Content-Length'], '7')
+
+			_, body = self._get(file_serving.serve_media, 'graphs/chart.html', HTTP_RANGE='bytes=-7')
+			self.assertEqual(body, b'</html>')
+
+			unsatisfiable, _ = self._get(file_serving.serve_media, 'graphs/chart.html', HTTP_RANGE='bytes=99999-')
+			self.assertEqual(unsatisfiable.status_code, 416)
+
+			# If-Range de outra versão: o arquivo inteiro
+			stale, body = self._get(
+				file_serving.serve_media, 'graphs/chart.html', HTTP_RANGE='bytes=0-5', HTTP_IF_RANGE='"old"',
+			)
+			self.assertEqual((stale.status_code, body), (200, self.html))
+
+	def test_offload_modes(self):
+		with self.settings(MEDIA_ROOT=self.temp_media, FILE_SERVING_MODE='x-accel'):
+			response, body = self._get(file_serving.serve_media, 'graphs/chart.html', HTTP_ACCEPT_ENCODING='gzip')
+			self.assertEqual(response['X-Accel-Redirect'], '/_protected/media/graphs/chart.html')
+			self.assertEqual(response['Content-Type'], 'text/html')
+			self.assertEqual(body, b'')
+
+		with self.settings(MEDIA_ROOT=self.temp_media, FILE_SERVING_MODE='sendfile'):
+			response, body = self._get(file_serving.serve_media, 'graphs/chart.html', HTTP_ACCEPT_ENCODING='gzip')
+			self.assertEqual(response['X-Sendfile'], self.graph_path + '.gz')
+			self.assertEqual(response['Content-Encoding'], 'gzip')
+			self.assertEqual(body, b'')
+
+	def test_static_lookups_use_the_in_memory_index(self):
+		with self.settings(STATIC_ROOT=self.temp_static):
+			self._get(file_serving.serve_static, 'css/device_detail.css')
+			with mock.patch('app.file_serving._build_static_index') as build_index, \
+					mock.patch('django.contrib.staticfiles.finders.find') as find:
+				response, _ = self._get(file_serving.serve_static, plotly_bundle_path())
+				self.assertEqual(response.status_code, 200)
+				with self.assertRaises(Http404):
+					self._get(file_serving.serve_static, 'css/missing.css')
+			build_index.assert_not_called()
+			find.assert_not_called()
+
+
+class PublicPageCacheTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.advisor = ExtendUser.objects.create_user(
+			username="advisor", email="advisor@example.com", password="x",
+			first_name="Grace", last_name="Hopper", is_advisor=True,
+		)
+
+	def tearDown(self):
+		cache.clear()
+
+	def _members(self, user=None):
+		request = RequestFactory().get('/members')
+		request.user = user or AnonymousUser()
+		return members(request).content.decode()
+
+	def test_anonymous_pages_are_cached_until_members_change(self):
+		self.assertIn("Grace Hopper", self._members())
+		with self.assertNumQueries(0):
+			self.assertIn("Grace Hopper", self._members())
+
+		ExtendUser.objects.create_user(
+			username="member", email="member@example.com", password="x", first_name="Alan", last_name="Turing",
+		)
+		self.assertIn("Alan Turing", self._members())
+
+	def test_logged_in_users_get_cached_fragments(self):
+		self._members(self.advisor)
+		with self.assertNumQueries(0):
+			content = self._members(self.advisor)
+		self.assertIn("Minha Conta", content)
+		self.assertIn("Grace Hopper", content)
+
+	def test_signals_bump_only_the_affected_versions(self):
+		members_version = cache_version('members')
+		news_version = cache_version('news')
+		graphs_version = cache_version('graphs')
+
+		self.advisor.last_login = timezone.now()
+		self.advisor.save(update_fields=['last_login'])
+		self.assertEqual(cache_version('members'), members_version)
+
+		New.objects.create(user=self.advisor, message="Nova versão do dashboard")
+		self.assertEqual(cache_version('members'), members_version)
+		self.assertNotEqual(cache_version('news'), news_version)
+
+		Graph.objects.create(key='allWMoteDevices24hRaw', file_path='graphs/allWMoteDevices24hRaw.html')
+		self.assertNotEqual(cache_version('graphs'), graphs_version)
+
+
+class DeviceListTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.user = ExtendUser.objects.create_user(
+			username="admin", email="admin@example.com", password="x", first_name="Ada", last_name="Lovelace",
+		)
+		for index in range(5):
+			Device.objects.create(
+				name=f"Water-{index}",
+				type=DeviceTypes.water,
+				is_authorized=AuthTypes.Authorized if index % 2 else AuthTypes.pending,
+				section=f"Bloco {index % 2}",
+				location="Campus",
+				api_token=f"token-{index}",
+			)
+
+	def tearDown(self):
+		liveness.flush()
+		cache.clear()
+
+	def _list(self, **params):
+		request = RequestFactory().get('/device-list', params)
+		request.user = self.user
+		return device_list(request)
+
+	def test_pages_are_keyed_by_the_last_id(self):
+		with self.settings(DEVICE_LIST_PAGE_SIZE=2):
+			content = self._list(filter_location="Campus").content.decode()
+			self.assertIn("Water-1</td>", content)
+			self.assertNotIn("Water-2</td>", content)
+
+			last_id = Device.objects.get(name="Water-1").id
+			self.assertIn(f'?filter_location=Campus&amp;after={last_id}', content)
+			content = self._list(filter_location="Campus", after=last_id).content.decode()
+			self.assertIn("Water-2</td>", content)
+			self.assertIn("Water-3</td>", content)
+			self.assertNotIn("Water-1</td>", content)
+
+	def test_filters_and_last_reading(self):
+		storeData(store_data_request(4.5))
+		self.assertEqual(liveness.flush(), 1)
+		device = Device.objects.get(api_token='token-1')
+		self.assertEqual(device.last_value, 4.5)
+		self.assertEqual(device.last_seen_at, Data.objects.get(device=device).collect_date)
+
+		content = self._list(filter_authorized=str(AuthTypes.Authorized)).content.decode()
+		self.assertIn("Water-1", content)
+		self.assertIn("4,50", content)
+		self.assertNotIn("Water-0", content)
+
+	def test_online_filter_and_status(self):
+		Device.objects.filter(name="Water-1").update(last_seen_at=timezone.now())
+		Device.objects.filter(name="Water-3").update(last_seen_at=timezone.now() - timedelta(hours=1))
+
+		content = self._list(filter_online="online").content.decode()
+		self.assertIn("Water-1</td>", content)
+		self.assertIn('liveness online', content)
+		self.assertNotIn("Water-3</td>", content)
+
+		content = self._list(filter_online="offline").content.decode()
+		self.assertIn("Water-3</td>", content)
+		# Sem nenhuma leitura também é offline
+		self.assertIn("Water-0</td>", content)
+		self.assertNotIn("Water-1</td>", content)
+
+	def test_query_count_does_not_depend_on_the_page(self):
+		self._list()
+		# Opções de filtro em cache: apenas a página de dispositivos é consultada
+		with self.assertNumQueries(1):
+			self._list(filter_section="Bloco 1")
+
+		Device.objects.create(name="Gas-1", type=DeviceTypes.gas, location="Reitoria")
+		self.assertIn("Reitoria", self._list().content.decode())
+
+
+class DeviceLivenessTests(TestCase):
+	def setUp(self):
+		liveness.flush()
+		self.water = Device.objects.create(name="Water-1", type=DeviceTypes.water, is_authorized=AuthTypes.Authorized)
+		self.gas = Device.objects.create(name="Gas-1", type=DeviceTypes.gas, is_authorized=AuthTypes.Authorized)
+		Device.objects.create(name="Gas-2", type=DeviceTypes.gas, is_authorized=AuthTypes.pending)
+
+	def tearDown(self):
+		liveness.flush()
+
+	def test_readings_are_coalesced_into_one_bulk_update(self):
+		now = timezone.now()
+		with self.settings(LIVENESS_FLUSH_SECONDS=3600), self.assertNumQueries(0):
+			liveness.touch(self.water.id, now - timedelta(seconds=10), 1.0)
+			liveness.touch(self.water.id, now, 2.0)
+			# Leitura fora de ordem não volta o estado
+			liveness.touch(self.water.id, now - timedelta(seconds=5), 3.0)
+			liveness.touch(self.gas.id, now, 0.5)
+
+		# Leitura dos valores atuais e um UPDATE para os dois dispositivos
+		with self.assertNumQueries(2):
+			self.assertEqual(liveness.flush(), 2)
+
+		self.water.refresh_from_db()
+		self.assertEqual((self.water.last_seen_at, self.water.last_value), (now, 2.0))
+		self.assertEqual(liveness.flush(), 0)
+
+	def test_flush_skips_values_older_than_the_stored_ones(self):
+		now = timezone.now()
+		Device.objects.filter(id=self.water.id).update(last_seen_at=now, last_value=9.0)
+
+		with self.settings(LIVENESS_FLUSH_SECONDS=3600):
+			liveness.touch(self.water.id, now - timedelta(minutes=1), 1.0)
+		self.assertEqual(liveness.flush(), 0)
+		self.water.refresh_from_db()
+		self.assertEqual(self.water.last_value, 9.0)
+
+	def test_touch_flushes_once_the_interval_elapsed(self):
+		with self.settings(LIVENESS_FLUSH_SECONDS=0):
+			liveness.touch(self.water.id, timezone.now(), 1.0)
+
+		self.water.refresh_from_db()
+		self.assertEqual(self.water.last_value, 1.0)
+
+	def test_counts_and_gauge_of_authorized_devices(self):
+		Device.objects.filter(id=self.water.id).update(last_seen_at=timezone.now())
+		Device.objects.filter(id=self.gas.id).update(last_seen_at=timezone.now() - timedelta(days=1))
+
+		counts = liveness.liveness_counts()
+		self.assertEqual(counts[DeviceTypes.water], (1, 0))
+		self.assertEqual(counts[DeviceTypes.gas], (0, 1))
+		self.assertEqual(counts[DeviceTypes.energy], (0, 0))
+
+		content = prometheus_metrics(RequestFactory().get('/metrics')).content.decode()
+		self.assertIn('morea_devices_liveness{device_type="water",state="online"} 1.0', content)
+		self.assertIn('morea_devices_liveness{device_type="gas",state="offline"} 1.0', content)
+
+	def test_device_detail_shows_status(self):
+		user = ExtendUser.objects.create_user(
+			username="admin", email="admin@example.com", password="x", first_name="Ada", last_name="Lovelace",
+		)
+		Device.objects.filter(id=self.water.id).update(last_seen_at=timezone.now(), last_value=2.0)
+		request = RequestFactory().get(f'/device-detail/{self.water.id}/')
+		request.user = user
+
+		content = device_detail(request, self.water.id).content.decode()
+		self.assertIn("<strong>Conexão:</strong> Online", content)
+
+
+class AnomalyDetectionTests(TestCase):
+	def setUp(self):
+		self.override = self.settings(ANOMALY_WARMUP_SAMPLES=5, ANOMALY_Z_THRESHOLD=4, ANOMALY_ALPHA=0.1)
+		self.override.enable()
+		self.device = Device.objects.create(
+			name="Water-1", type=DeviceTypes.water, is_authorized=AuthTypes.Authorized, api_token="token-1",
+		)
+
+	def tearDown(self):
+		liveness.flush()
+		self.override.disable()
+
+	def _store(self, value):
+		with self.captureOnCommitCallbacks(execute=True):
+			self.assertEqual(storeData(store_data_request(value)).status_code, 200)
+
+	def test_ewma_update_is_constant_time_state(self):
+		state = [0.0, 0.0, 0]
+		self.assertEqual(anomalies.ewma_update(state, 1.0, 0.1), 0.0)
+		self.assertEqual(state, [1.0, 0.0, 1])
+
+		# Variância zero: o desvio é dividido por ANOMALY_MIN_STD
+		self.assertAlmostEqual(anomalies.ewma_update(state, 3.0, 0.1), 200.0)
+		self.assertAlmostEqual(state[0], 1.2)
+		self.assertAlmostEqual(state[1], 0.9 * 2.0 * 0.2)
+		self.assertEqual(state[2], 2)
+
+	def test_spike_after_warmup_is_recorded_and_counted(self):
+		# Picos durante o aquecimento não são anomalias
+		for value in (1.0, 30.0, 1.0, 1.1, 0.9, 1.0, 1.1, 0.9, 1.0, 1.1, 0.9, 1.0):
+			self._store(value)
+		self.assertFalse(Anomaly.objects.exists())
+
+		self._store(1.05)
+		self._store(250.0)
+
+		anomaly = Anomaly.objects.get()
+		self.assertEqual((anomaly.device_id, anomaly.type, anomaly.value), (self.device.id, 1, 250.0))
+		self.assertGreater(anomaly.z_score, 4)
+		self.assertLess(anomaly.expected, 10)
+		self.assertEqual(anomaly.detected_at, Data.objects.get(last_collection=250.0).collect_date)
+
+		content = prometheus_metrics(RequestFactory().get('/metrics')).content.decode()
+		self.assertIn('morea_anomalies_total{device_type="water",measure_type="1"}', content)
+
+	def test_empty_measure_is_stored_without_observing(self):
+		with self.captureOnCommitCallbacks(execute=True) as callbacks:
+			response = storeData(store_data_request())
+
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(callbacks, [])
+		self.assertFalse(DetectorState.objects.exists())
+
+	def test_state_is_shared_through_detector_state(self):
+		now = timezone.now()
+		anomalies.observe(self.device.id, self.device.type, [(1, now, 1.0), (1, now, 2.0), (1, now, 3.0)])
+		state = DetectorState.objects.get(device=self.device, type=1)
+		self.assertEqual((state.samples, state.mean), (3, 1.0 + 0.1 * 1.0 + 0.1 * 1.9))
+
+		# Outro worker (ou um restart) continua do estado gravado: uma leitura com lock e uma escrita
+		with self.assertNumQueries(4):
+			anomalies.observe(self.device.id, self.device.type, [(1, now, 4.0)])
+		self.assertEqual(DetectorState.objects.get(device=self.device, type=1).samples, 4)
+		self.assertEqual(DetectorState.objects.count(), 1)
+
+	def test_rolled_back_readings_do_not_move_the_baseline(self):
+		for value in (1.0, 1.1, 0.9, 1.0, 1.1, 0.9):
+			self._store(value)
+		before = DetectorState.objects.get(device=self.device, type=1)
+
+		with self.captureOnCommitCallbacks(execute=True) as callbacks:
+			with transaction.atomic():
+				storeData(store_data_request(250.0))
+				transaction.set_rollback(True)
+
+		self.assertEqual(callbacks, [])
+		after = DetectorState.objects.get(device=self.device, type=1)
+		self.assertEqual((after.mean, after.variance, after.samples), (before.mean, before.variance, before.samples))
+		self.assertFalse(Anomaly.objects.exists())
+
+
+class DataExportTests(TestCase):
+	def setUp(self):
+		self.user = ExtendUser.objects.create_user(
+			username="researcher", email="researcher@example.com", password="x", first_name="Ada", last_name="Lovelace",
+		)
+		self.water = Device.objects.create(name="Water-1", type=DeviceTypes.water, is_authorized=AuthTypes.Authorized)
+		self.energy = Device.objects.create(name="Energy-1", type=DeviceTypes.energy, is_authorized=AuthTypes.Authorized)
+		for value in (1.0, 2.0, 3.0, 4.0, 5.0):
+			Data.objects.create(device=self.water, type=DataTypes.volume, last_collection=value, total=value)
+		Data.objects.create(device=self.energy, type=DataTypes.kwh, last_collection=9.0, total=9.0)
+
+	def _export(self, user=None, **params):
+		request = RequestFactory().get('/api/export', params)
+		request.user = user or self.user
+		return export_data(request)
+
+	def test_streams_csv_in_keyset_batches(self):
+		with self.settings(EXPORT_BATCH_SIZE=2):
+			response = self._export(device=str(self.water.id))
+			self.assertTrue(response.streaming)
+			self.assertIn('attachment; filename="morea-data-', response['Content-Disposition'])
+			# 5 linhas em lotes de 2: três consultas, feitas durante o envio
+			with self.assertNumQueries(3):
+				content = b''.join(response.streaming_content).decode()
+
+		lines = content.splitlines()
+		self.assertEqual(lines[0], 'id,device_id,device_name,type,last_collection,total,collect_date')
+		self.assertEqual([line.split(',')[4] for line in lines[1:]], ['1.0', '2.0', '3.0', '4.0', '5.0'])
+
+	def test_gzip_ndjson_with_filters(self):
+		response = self._export(format='ndjson', compress='gzip', type=str(DataTypes.kwh), to=timezone.localdate().isoformat())
+		self.assertEqual(response['Content-Type'], 'application/gzip')
+
+		rows = [json.loads(line) for line in gzip.decompress(b''.join(response.streaming_content)).splitlines()]
+		self.assertEqual([(row['device_name'], row['total']) for row in rows], [("Energy-1", 9.0)])
+
+		response = self._export(**{'from': (timezone.now() + timedelta(hours=1)).isoformat()})
+		self.assertEqual(b''.join(response.streaming_content).decode().count('\n'), 1)
+
+	def test_rejects_invalid_parameters_and_anonymous_users(self):
+		self.assertEqual(self._export(type='abc').status_code, 400)
+		self.assertEqual(self._export(dataset='users').status_code, 400)
+		self.assertEqual(self._export(**{'from': '2024-13-01'}).status_code, 400)
+		self.assertEqual(self._export(user=AnonymousUser()).status_code, 302)
+
+	def test_command_exports_processed_data(self):
+		hourlyDataProcessing()
+		output = io.StringIO()
+		call_command('export_data', '--dataset', 'processed', '--format', 'ndjson', '--device', str(self.water.id), stdout=output)
+
+		rows = [json.loads(line) for line in output.getvalue().splitlines()]
+		self.assertEqual(len(rows), 1)
+		self.assertEqual((rows[0]['device_name'], rows[0]['interval'], rows[0]['mean']), ("Water-1", IntervalTypes.hourly, 3.0))
+
+
+class ReadApiTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.user = ExtendUser.objects.create_user(
+			username="tool", email="tool@example.com", password="x", first_name="Ada", last_name="Lovelace",
+		)
+		self.device = Device.objects.create(name="Water-1", type=DeviceTypes.water, is_authorized=AuthTypes.Authorized)
+		for value in (1.0, 2.0, 3.0):
+			Data.objects.create(device=self.device, type=DataTypes.volume, last_collection=value, total=value)
+
+	def tearDown(self):
+		cache.clear()
+
+	def _get(self, view, path='/api/readings', user=None, headers=None, **params):
+		request = RequestFactory().get(path, params, headers=headers or {})
+		request.user = user or self.user
+		response = view(request)
+		response.render()
+		return response
+
+	def test_readings_are_paginated_by_cursor(self):
+		response = self._get(api.readings, device=str(self.device.id), page_size='2')
+		payload = json.loads(response.content)
+		self.assertEqual([row['last_collection'] for row in payload['results']], [1.0, 2.0])
+		self.assertIsNone(payload['previous'])
+
+		cursor = payload['next'].split('cursor=')[1].split('&')[0]
+		payload = json.loads(self._get(api.readings, device=str(self.device.id), page_size='2', cursor=cursor).content)
+		self.assertEqual([row['last_collection'] for row in payload['results']], [3.0])
+		self.assertEqual(payload['results'][0]['device_name'], "Water-1")
+		self.assertIsNone(payload['next'])
+
+	def test_repeat_polls_get_304_until_new_rows(self):
+		etag = self._get(api.readings, device=str(self.device.id))['ETag']
+		with self.assertNumQueries(1):
+			response = self._get(api.readings, headers={'If-None-Match': etag}, device=str(self.device.id))
+		self.assertEqual(response.status_code, 304)
+
+		Data.objects.create(device=self.device, type=DataTypes.volume, last_collection=4.0, total=10.0)
+		response = self._get(api.readings, headers={'If-None-Match': etag}, device=str(self.device.id))
+		self.assertEqual(response.status_code, 200)
+		self.assertNotEqual(response['ETag'], etag)
+
+	def test_rollup_resolutions(self):
+		hourlyDataProcessing()
+		payload = json.loads(self._get(api.readings, resolution='hourly').content)
+		self.assertEqual([(row['device_id'], row['mean']) for row in payload['results']], [(self.device.id, 2.0)])
+		self.assertEqual(json.loads(self._get(api.readings, resolution='daily').content)['results'], [])
+
+		self.assertEqual(self._get(api.readings, resolution='hourly', type='1').status_code, 400)
+		self.assertEqual(self._get(api.readings, resolution='weekly').status_code, 400)
+
+	def test_devices_require_authentication(self):
+		self.assertEqual(self._get(api.devices, '/api/devices', user=AnonymousUser()).status_code, 403)
+
+		response = self._get(api.devices, '/api/devices', type=str(DeviceTypes.water))
+		self.assertEqual([row['name'] for row in json.loads(response.content)['results']], ["Water-1"])
+		Device.objects.filter(pk=self.device.id).update(last_seen_at=timezone.now())
+		self.assertNotEqual(self._get(api.devices, '/api/devices', type=str(DeviceTypes.water))['ETag'], response['ETag'])
+
+
+class AggregationTests(TestCase):
+	def setUp(self):
+		self.user = ExtendUser.objects.create_user(
+			username="tool", email="tool@example.com", password="x", first_name="Ada", last_name="Lovelace",
+		)
+		self.hour = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=3)
+		self.devices = []
+		for name in ("Water-1", "Water-2"):
+			device = Device.objects.create(name=name, type=DeviceTypes.water, is_authorized=AuthTypes.Authorized)
+			for minutes, value in ((0, 1.0), (20, 2.0), (40, 6.0), (70, 4.0)):
+				reading = Data.objects.create(device=device, type=DataTypes.volume, last_collection=value, total=value)
+				Data.objects.filter(pk=reading.pk).update(collect_date=self.hour + timedelta(minutes=minutes))
+			self.devices.append(device)
+
+	def test_buckets_are_grouped_by_the_database(self):
+		with self.assertNumQueries(1):
+			rows = list(aggregation.bucket_rows(aggregation.readings(device_ids=[self.devices[0].id]), 'hour'))
+
+		self.assertEqual(
+			[(row['bucket'], row['count'], row['sum'], row['avg'], row['min'], row['max']) for row in rows],
+			[(self.hour, 3, 9.0, 3.0, 1.0, 6.0), (self.hour + timedelta(hours=1), 1, 4.0, 4.0, 4.0, 4.0)],
+		)
+		days = aggregation.bucket_rows(aggregation.readings(device_ids=[self.devices[0].id]), 'day')
+		self.assertEqual(sum(row['sum'] for row in days), 13.0)
+
+	def test_rollups_take_a_constant_number_of_queries(self):
+		with self.assertNumQueries(4):
+			processData(4, IntervalTypes.hourly)
+
+		rollup = ProcessedData.objects.get(device=self.devices[1])
+		values = numpy.array([1.0, 2.0, 6.0, 4.0])
+		self.assertEqual((rollup.mean, rollup.min, rollup.max), (3.25, 1.0, 6.0))
+		self.assertAlmostEqual(rollup.std, numpy.std(values))
+		self.assertEqual((rollup.median, rollup.fq, rollup.tq), tuple(numpy.quantile(values, [0.5, 0.25, 0.75])))
+
+	def test_aggregate_api_and_export(self):
+		request = RequestFactory().get('/api/aggregate', {'device': str(self.devices[0].id), 'from': self.hour.isoformat()})
+		request.user = self.user
+		response = api.aggregate(request)
+		response.render()
+		self.assertEqual([row['sum'] for row in json.loads(response.content)['results']], [9.0, 4.0])
+		self.assertTrue(response.has_header('ETag'))
+
+		request = RequestFactory().get('/api/aggregate', {'bucket': 'week', 'from': self.hour.isoformat()})
+		request.user = self.user
+		self.assertEqual(api.aggregate(request).status_code, 400)
+
+		output = io.StringIO()
+		call_command('export_data', '--dataset', 'daily', '--device', str(self.devices[1].id), stdout=output)
+		lines = output.getvalue().splitlines()
+		self.assertEqual(lines[0], 'device_id,bucket,count,sum,avg,min,max')
+		self.assertEqual(sum(int(line.split(',')[2]) for line in lines[1:]), 4)
+
+
+class ConsumptionCubeTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.user = ExtendUser.objects.create_user(
+			username="tool", email="tool@example.com", password="x", first_name="Ada", last_name="Lovelace",
+		)
+		self.hour = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=2)
+		self.floor1 = Device.objects.create(name="Water-1", type=DeviceTypes.water, section="Bloco A", location="Piso 1")
+		self.floor2 = Device.objects.create(name="Water-2", type=DeviceTypes.water, section="Bloco A", location="Piso 2")
+		self.meter = Device.objects.create(name="Energy-1", type=DeviceTypes.energy)
+		self._reading(self.floor1, 10, 1.5)
+		self._reading(self.floor1, 70, 2.5)
+		self._reading(self.floor2, 20, 4.0)
+		self._reading(self.meter, 30, 0.5, DataTypes.kwh)
+		# Potência não é consumo
+		self._reading(self.meter, 30, 900.0, DataTypes.watt)
+
+	def tearDown(self):
+		cache.clear()
+
+	def _reading(self, device, minutes, value, data_type=DataTypes.volume):
+		reading = Data.objects.create(device=device, type=data_type, last_collection=value, total=value)
+		Data.objects.filter(pk=reading.pk).update(collect_date=self.hour + timedelta(minutes=minutes))
+
+	def _cells(self, interval):
+		return ConsumptionCube.objects.filter(interval=interval).values_list(
+			'device_type', 'section', 'location', 'total', 'samples',
+		)
+
+	def test_readings_without_device_are_left_out(self):
+		self._reading(None, 40, 3.0)
+
+		consumption.updateConsumptionCubes()
+
+		self.assertEqual(ConsumptionCube.objects.filter(interval=IntervalTypes.hourly).count(), 4)
+		self.assertFalse(ConsumptionCube.objects.filter(device_type__isnull=True).exists())
+
+	def test_cubes_are_built_and_updated_incrementally(self):
+		consumption.updateConsumptionCubes()
+		self.assertEqual(ConsumptionCube.objects.filter(interval=IntervalTypes.hourly).count(), 4)
+		# Somado por célula: as leituras podem cair em dois dias perto da meia-noite
+		daily = {}
+		for device_type, section, location, total, samples in self._cells(IntervalTypes.daily):
+			daily[(device_type, section, location)] = daily.get((device_type, section, location), 0) + total
+		self.assertEqual(daily, {
+			(DeviceTypes.water, "Bloco A", "Piso 1"): 4.0,
+			(DeviceTypes.water, "Bloco A", "Piso 2"): 4.0,
+			(DeviceTypes.energy, "", ""): 0.5,
+		})
+
+		self._reading(self.floor2, 80, 1.0)
+		self.floor2.location = "Piso 3"
+		self.floor2.save()
+		with mock.patch('app.consumption.readings', wraps=consumption.readings) as readings:
+			consumption.updateConsumptionCubes()
+		# Só as horas desde a última célula (menos a margem de atraso) são relidas
+		self.assertGreater(readings.call_args.kwargs['date_from'], self.hour - timedelta(hours=3))
+
+		places = {(row['location'], row['consumption']) for row in consumption.consumption_by_place(self.hour, device_type=DeviceTypes.water)}
+		self.assertEqual(places, {("Piso 1", 4.0), ("Piso 3", 5.0)})
+
+	def test_dashboard_and_api_read_the_cube(self):
+		hourlyDataProcessing()
+
+		request = RequestFactory().get('/dashboard')
+		request.user = AnonymousUser()
+		content = dashboard(request).content.decode()
+		self.assertIn("Piso 2", content)
+		self.assertIn("4,00", content)
+
+		request = RequestFactory().get('/api/consumption', {'type': str(DeviceTypes.water), 'group': 'section'})
+		request.user = self.user
+		response = api.consumption(request)
+		response.render()
+		self.assertEqual(json.loads(response.content)['results'], [{'section': "Bloco A", 'consumption': 8.0, 'readings': 3}])
+
+		request = RequestFactory().get('/api/consumption', {'interval': 'hourly', 'location': "Piso 1"})
+		request.user = self.user
+		response = api.consumption(request)
+		response.render()
+		self.assertEqual([row['total'] for row in json.loads(response.content)['results']], [1.5, 2.5])
+
+
+class RecentReadingsBufferTests(TestCase):
+	def setUp(self):
+		self.override = self.settings(
+			RING_BUFFER_ENABLED=True,
+			RING_BUFFER_NAME=f"morea-test-{os.getpid()}",
+			RING_BUFFER_SLOTS=8,
+			RING_BUFFER_CAPACITY=4,
+		)
+		self.override.enable()
+		self.device = Device.objects.create(
+			name="Water-1",
+			type=DeviceTypes.water,
+			is_authorized=AuthTypes.Authorized,
+			api_token="token-1",
+		)
+
+	def tearDown(self):
+		liveness.flush()
+		ring_buffer.close(unlink=True)
+		self.override.disable()
+
+	def _store(self, value):
+		with self.captureOnCommitCallbacks(execute=True):
+			return storeData(store_data_request(value))
+
+	def test_rebuild_loads_recent_window_from_database(self):
+		Data.objects.create(device=self.device, type=1, last_collection=7.0, total=7.0)
+		old = Data.objects.create(device=self.device, type=1, last_collection=1.0, total=1.0)
+		Data.objects.filter(id=old.id).update(collect_date=timezone.now() - timedelta(days=2))
+
+		times, values = ring_buffer.warm_up().device_window(
+			self.device.id, timezone.now() - timedelta(hours=1)
+		)
+
+		self.assertEqual(list(values), [7.0])
+
+	def test_store_data_fills_buffer_and_series_skip_database(self):
+		buffer = ring_buffer.warm_up()
+		for value in (1.0, 2.0, 3.0):
+			self.assertEqual(self._store(value).status_code, 200)
+
+		_, values = buffer.device_window(self.device.id, timezone.now() - timedelta(hours=1))
+		self.assertEqual(list(values), [1.0, 2.0, 3.0])
+
+		with self.assertNumQueries(1):
+			series = _series_by_device([self.device.id], timezone.now() - timedelta(hours=1))
+		self.assertEqual(list(series["Water-1"][1]), [1.0, 2.0, 3.0])
+
+	def test_rolled_back_readings_never_reach_the_buffer(self):
+		buffer = ring_buffer.warm_up()
+		with self.captureOnCommitCallbacks(execute=True) as callbacks, self.assertRaises(DatabaseError):
+			with transaction.atomic():
+				storeData(store_data_request(5.0))
+				raise DatabaseError("rollback")
+
+		self.assertEqual(callbacks, [])
+
+		_, values = buffer.device_window(self.device.id, timezone.now() - timedelta(hours=1))
+		self.assertEqual(list(values), [])
+
+	def test_buffer_failure_after_commit_does_not_fail_the_request(self):
+		with mock.patch.object(ring_buffer, 'get_buffer', side_effect=OSError("no shared memory")):
+			with self.assertLogs('django.test', 'ERROR'):
+				response = self._store(5.0)
+
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(Data.objects.get().last_collection, 5.0)
+
+	def test_ingest_only_appends_to_a_segment_not_ready(self):
+		Data.objects.create(device=self.device, type=1, last_collection=7.0, total=7.0)
+		with mock.patch.object(ring_buffer.RecentReadings, '_reload') as reload:
+			self.assertEqual(self._store(5.0).status_code, 200)
+
+		reload.assert_not_called()
+		self.assertFalse(ring_buffer.get_buffer().ready)
+		self.assertIsNone(ring_buffer.get_buffer().device_window(self.device.id, timezone.now() - timedelta(hours=1)))
+
+	def test_gunicorn_worker_start_rebuilds_the_segment(self):
+		Data.objects.create(device=self.device, type=1, last_collection=7.0, total=7.0)
+		hooks = runpy.run_path(str(Path(__file__).resolve().parent.parent / 'gunicorn.conf.py'))
+
+		with mock.patch('django.db.connections.close_all') as close_all:
+			hooks['post_worker_init'](mock.Mock())
+
+		close_all.assert_called_once()
+		buffer = ring_buffer.get_buffer()
+		self.assertTrue(buffer.ready)
+		_, values = buffer.device_window(self.device.id, timezone.now() - timedelta(hours=1))
+		self.assertEqual(list(values), [7.0])
+
+	def test_segment_left_not_ready_is_rebuilt_by_the_next_process(self):
+		Data.objects.create(device=self.device, type=1, last_collection=7.0, total=7.0)
+		# Processo que criou o segmento morreu no meio da recarga
+		ring_buffer.warm_up().header[0] = 0
+		ring_buffer.close()
+
+		buffer = ring_buffer.warm_up()
+
+		self.assertTrue(buffer.ready)
+		_, values = buffer.device_window(self.device.id, timezone.now() - timedelta(hours=1))
+		self.assertEqual(list(values), [7.0])
+
+	def test_segment_of_another_layout_is_replaced(self):
+		Data.objects.create(device=self.device, type=1, last_collection=7.0, total=7.0)
+		ring_buffer.warm_up()
+
+		for slots, capacity in ((8, 16), (4, 2)):
+			# Segmento deixado por um deploy com outro RING_BUFFER_CAPACITY/SLOTS
+			ring_buffer.close()
+			with self.subTest(slots=slots, capacity=capacity), self.settings(RING_BUFFER_SLOTS=slots, RING_BUFFER_CAPACITY=capacity):
+				buffer = ring_buffer.warm_up()
+				self.assertEqual((buffer.header[1], buffer.header[2]), (capacity, slots))
+				_, values = buffer.device_window(self.device.id, timezone.now() - timedelta(hours=1))
+				self.assertEqual(list(values), [7.0])
+
+	def test_samples_since_returns_only_new_readings(self):
+		buffer = ring_buffer.warm_up()
+		self._store(1.0)
+		position, samples = buffer.samples_since(None)
+		self.assertEqual(samples, [])
+
+		self._store(2.0)
+		self._store(3.0)
+		position, samples = buffer.samples_since(position)
+		[(device_id, data_type, _, values)] = samples
+		self.assertEqual((device_id, data_type, list(values)), (self.device.id, 1, [2.0, 3.0]))
+		self.assertEqual(buffer.samples_since(position)[1], [])
+
+	def test_wrapped_slot_falls_back_when_window_is_incomplete(self):
+		buffer = ring_buffer.warm_up()
+		for value in range(6):
+			self._store(float(value))
+
+		oldest_kept = Data.objects.get(last_collection=2.0).collect_date
+		_, values = buffer.device_window(self.device.id, oldest_kept)
+		self.assertEqual(list(values), [2.0, 3.0, 4.0, 5.0])
+		self.assertIsNone(buffer.device_window(self.device.id, timezone.now() - timedelta(hours=1)))
+
+
+class DataPartitioningSqlTests(TestCase):
+	def test_partition_table_sql_covers_months_and_maxvalue(self):
+		sql = partitioning.partition_table_sql(
+			'app_data', partitioning.months_between(date(2024, 11, 20), date(2025, 1, 1))
+		)
+
+		self.assertIn("PARTITION p202411 VALUES LESS THAN (TO_DAYS('2024-12-01'))", sql)
+		self.assertIn("PARTITION p202501 VALUES LESS THAN (TO_DAYS('2025-02-01'))", sql)
+		self.assertTrue(sql.endswith("PARTITION pmax VALUES LESS THAN MAXVALUE)"))
+
+	def test_maintenance_adds_future_months_and_drops_expired(self):
+		existing = ['p202401', 'p202402', 'p202403', 'p202404', 'pmax']
+
+		statements = partitioning.maintenance_statements(existing, date(2024, 4, 15), ahead=2, retention=2)
+
+		self.assertEqual(len(statements), 2)
+		self.assertIn("REORGANIZE PARTITION pmax INTO (PARTITION p202405", statements[0])
+		self.assertIn("PARTITION p202406", statements[0])
+		self.assertEqual(statements[1], "ALTER TABLE app_data DROP PARTITION p202401")
+
+	def test_cron_is_scheduled_with_the_connection_pool(self):
+		settings_path = Path(__file__).resolve().parent.parent / 'morea_ds' / 'settings.py'
+		environ = {'DBTYPE': 'MySQL', 'DATA_PARTITIONING': 'True', 'DB_POOL_SIZE': '4'}
+		with mock.patch.dict(os.environ, environ):
+			project_settings = runpy.run_path(str(settings_path))
+
+		self.assertEqual(project_settings['DATABASES']['default']['ENGINE'], 'app.backends.mysql')
+		self.assertIn(
+			('30 2 * * *', 'django.core.management.call_command', ['partition_data']),
+			project_settings['CRONJOBS'],
+		)
+
+	def test_maintenance_is_noop_when_partitions_are_current(self):
+		existing = ['p202404', 'p202405', 'pmax']
+
+		self.assertEqual(
+			partitioning.maintenance_statements(existing, date(2024, 4, 15), ahead=1, retention=0), []
+		)
+
+
+@unittest.skipUnless(connection.vendor == 'mysql', "Particionamento exige MySQL")
+class DataPartitionPruningTests(TransactionTestCase):
+	def setUp(self):
+		self.device = Device.objects.create(name="Water-1", type=DeviceTypes.water, is_authorized=AuthTypes.Authorized)
+		old = Data.objects.create(device=self.device, type=1, last_collection=1.0, total=1.0)
+		Data.objects.filter(id=old.id).update(collect_date=timezone.now() - timedelta(days=120))
+		Data.objects.create(device=self.device, type=1, last_collection=2.0, total=3.0)
+		call_command('partition_data', '--setup', '--ahead', '1', stdout=open(os.devnull, 'w'))
+
+	def _assert_prunes_old_months(self, queryset):
+		used = partitioning.pruned_partitions(queryset)
+		current = partitioning.partition_name(partitioning.month_start(timezone.now().date()))
+
+		self.assertIn(current, used)
+		self.assertLess(len(used), len(partitioning.existing_partitions()))
+
+	def test_process_data_queries_are_pruned(self):
+		readings = aggregation.readings(device_ids=[self.device.id], date_from=timezone.now() - timedelta(hours=1))
+		self._assert_prunes_old_months(aggregation.summary_rows(readings))
+		self._assert_prunes_old_months(aggregation.value_rows(readings))
+
+	def test_series_by_device_query_is_pruned(self):
+		self._assert_prunes_old_months(graphs.series_queryset([self.device.id], timezone.now() - timedelta(days=1)))
+
+
+@unittest.skipUnless(connection.vendor in ('sqlite', 'mysql'), "Planos capturados para SQLite e MySQL")
+class HotQueryPlanTests(TestCase):
+	def setUp(self):
+		self.device = Device.objects.create(name="Energy-1", type=DeviceTypes.energy, is_authorized=AuthTypes.Authorized)
+		for value in range(20):
+			Data.objects.create(device=self.device, type=value % 3 + 2, last_collection=value, total=value)
+			ProcessedData.objects.create(device=self.device, mean=value)
+			DeviceLog.objects.create(device=self.device)
+
+	def _hot_queries(self):
+		since = timezone.now() - timedelta(days=1)
+		return [
+			(
+				"_series_by_device",
+				graphs.series_queryset([self.device.id, self.device.id + 1], since),
+				'data_device_date_idx',
+			),
+			(
+				"storeData",
+				Data.objects.filter(device=self.device, type=2).order_by('-id').values_list('total', flat=True)[:1],
+				'data_device_type_id_idx',
+			),
+			(
+				"processData (agregados)",
+				aggregation.summary_rows(aggregation.readings(device_ids=[self.device.id], date_from=since)),
+				'data_device_date_idx',
+			),
+			(
+				"processData (quantis)",
+				aggregation.value_rows(aggregation.readings(device_ids=[self.device.id], date_from=since)),
+				'data_device_date_idx',
+			),
+			(
+				"ring_buffer.rebuild",
+				Data.objects.filter(collect_date__gte=since).order_by('collect_date'),
+				'data_collect_date_idx',
+			),
+			(
+				"ProcessedData por dispositivo",
+				ProcessedData.objects.filter(device=self.device, created_at__gte=since).order_by('created_at'),
+				'pdata_device_created_idx',
+			),
+			(
+				"DeviceLog por dispositivo",
+				DeviceLog.objects.filter(device=self.device).order_by('-created_at'),
+				'devicelog_device_created_idx',
+			),
+		]
+
+	def _mysql_plan(self, queryset):
+		sql, params = queryset.query.sql_with_params()
+		with connection.cursor() as cursor:
+			cursor.execute(f"EXPLAIN {sql}", params)
+			columns = [column[0] for column in cursor.description]
+			return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+	def test_hot_queries_use_their_index(self):
+		for label, queryset, index in self._hot_queries():
+			with self.subTest(label):
+				if connection.vendor == 'sqlite':
+					plan = queryset.explain()
+					self.assertNotIn("SCAN", plan)
+					self.assertNotIn("TEMP B-TREE", plan)
+					self.assertIn(f"USING INDEX {index}", plan)
+				else:
+					plan = self._mysql_plan(queryset)
+					self.assertNotIn('ALL', [row['type'] for row in plan])
+					self.assertIn(index, [row['key'] for row in plan])
+
+
+class TunedSQLiteBackendTests(TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp(prefix="morea-sqlite-")
+		settings_dict = {
+			**connection.settings_dict,
+			'ENGINE': 'app.backends.sqlite3',
+			'NAME': os.path.join(self.directory, 'db.sqlite3'),
+			'PRAGMAS': {'busy_timeout': 1234},
+		}
+		self.wrapper = TunedSQLiteWrapper(settings_dict, alias='tuned')
+
+	def tearDown(self):
+		self.wrapper.close()
+		shutil.rmtree(self.directory, ignore_errors=True)
+
+	def _pragma(self, name):
+		with self.wrapper.cursor() as cursor:
+			cursor.execute(f"PRAGMA {name}")
+			return cursor.fetchone()[0]
+
+	def test_every_connection_gets_the_tuned_pragmas(self):
+		self.assertEqual(self._pragma('journal_mode'), 'wal')
+		self.assertEqual(self._pragma('synchronous'), 1)  # NORMAL
+		self.assertEqual(self._pragma('busy_timeout'), 1234)
+		self.assertEqual(self._pragma('cache_size'), -16000)
+
+	def test_transactions_take_the_write_lock_immediately(self):
+		self.wrapper.ensure_connection()
+		self.wrapper._start_transaction_under_autocommit()
+
+		other = sqlite3.connect(self.wrapper.settings_dict['NAME'], timeout=0, isolation_level=None)
+		try:
+			with self.assertRaisesRegex(sqlite3.OperationalError, "locked"):
+				other.execute("BEGIN IMMEDIATE")
+		finally:
+			other.close()
+			self.wrapper.connection.execute("ROLLBACK")
+
+
+class ConnectionPoolTests(TestCase):
+	class FakeConnection:
+		def __init__(self):
+			self.closed = False
+
+		def close(self):
+			self.closed = True
+
+	def setUp(self):
+		self.pool = ConnectionPool('test', size=2, timeout=0.05)
+		self.opened = []
+
+	def _connect(self):
+		conn = self.FakeConnection()
+		self.opened.append(conn)
+		return conn
+
+	def test_released_connection_is_reused(self):
+		first = self.pool.acquire(self._connect, lambda conn: True)
+		self.pool.release(first, reusable=True)
+
+		self.assertIs(self.pool.acquire(self._connect, lambda conn: True), first)
+		self.assertEqual(len(self.opened), 1)
+
+	def test_unhealthy_idle_connection_is_replaced(self):
+		first = self.pool.acquire(self._connect, lambda conn: True)
+		self.pool.release(first, reusable=True)
+
+		second = self.pool.acquire(self._connect, lambda conn: conn is not first)
+
+		self.assertIsNot(second, first)
+		self.assertTrue(first.closed)
+
+	def test_pool_limit_makes_extra_checkouts_wait_and_fail(self):
+		self.pool.acquire(self._connect, lambda conn: True)
+		held = self.pool.acquire(self._connect, lambda conn: True)
+
+		with self.assertRaises(PoolExhausted):
+			self.pool.acquire(self._connect, lambda conn: True)
+
+		self.pool.release(held, reusable=False)
+		self.assertTrue(held.closed)
+		self.pool.acquire(self._connect, lambda conn: True)
+
+
+class PrimaryReplicaRouterTests(TestCase):
+	def setUp(self):
+		databases = {'default': connection.settings_dict}
+		databases['replica'] = {**connection.settings_dict, 'NAME': 'replica.sqlite3'}
+		self.override = self.settings(DATABASES=databases, REPLICA_PIN_SECONDS=15)
+		self.override.enable()
+		self.router = PrimaryReplicaRouter()
+
+	def tearDown(self):
+		self.override.disable()
+
+	def _read_db_during(self, request):
+		seen = {}
+
+		def view(request):
+			with reporting_reads():
+				seen['db'] = self.router.db_for_read(Data)
+			return HttpResponse()
+
+		response = ReplicaRoutingMiddleware(view)(request)
+		return seen['db'], response
+
+	def test_only_reporting_reads_go_to_the_replica(self):
+		self.assertEqual(self.router.db_for_read(Data), 'default')
+		with reporting_reads():
+			self.assertEqual(self.router.db_for_read(Data), 'replica')
+			self.assertEqual(self.router.db_for_read(ExtendUser), 'default')
+			self.assertEqual(self.router.db_for_write(Data), 'default')
+
+	def test_write_pins_the_browser_to_the_primary(self):
+		db, response = self._read_db_during(RequestFactory().post('/edit/1/'))
+		self.assertEqual(db, 'default')
+		self.assertIn(PIN_COOKIE, response.cookies)
+
+		pinned = RequestFactory().get('/device-list')
+		pinned.COOKIES[PIN_COOKIE] = '1'
+		self.assertEqual(self._read_db_during(pinned)[0], 'default')
+
+		self.assertEqual(self._read_db_during(RequestFactory().get('/device-list'))[0], 'replica')
+
+	def test_without_replica_everything_stays_on_default(self):
+		self.override.disable()
+		try:
+			with reporting_reads():
+				self.assertEqual(self.router.db_for_read(Data), 'default')
+		finally:
+			self.override.enable()
+
+
+class ChartDataApiTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.device = Device.objects.create(name="Gas-1", type=DeviceTypes.gas, is_authorized=AuthTypes.Authorized)
+		Data.objects.create(device=self.device, type=1, last_collection=2.5, total=2.5)
+		Data.objects.create(device=self.device, type=1, last_collection=None, total=2.5)
+
+	def _get(self, view, path, **params):
+		request = RequestFactory().get(path, params)
+		request.user = AnonymousUser()
+		return view(request)
+
+	def test_returns_compact_columnar_series_and_caches_them(self):
+		response = self._get(chart_data, '/api/chart-data', type='3', range='24h')
+
+		payload = json.loads(response.content)
+		self.assertEqual(payload['unit'], 'Consumo(m³)')
+		self.assertEqual(payload['series'][0]['name'], "Gas-1")
+		self.assertEqual(payload['series'][0]['id'], self.device.id)
+		# Leituras sem valor são descartadas antes do downsampling
+		self.assertEqual(payload['series'][0]['v'], [2.5])
+		self.assertEqual(len(payload['series'][0]['t']), 1)
+		self.assertFalse(payload['webgl'])
+		self.assertIn('max-age=60', response['Cache-Control'])
+
+		with self.assertNumQueries(0):
+			self._get(chart_data, '/api/chart-data', type='3', range='24h')
+
+	def test_rejects_unknown_type_or_range(self):
+		self.assertEqual(self._get(chart_data, '/api/chart-data', type='9').status_code, 400)
+		self.assertEqual(self._get(chart_data, '/api/chart-data', type='1', range='1y').status_code, 400)
+
+	def test_live_dashboard_renders_without_graph_files(self):
+		response = self._get(dashboard, '/dashboard', mode='live')
+
+		self.assertEqual(response.status_code, 200)
+		self.assertContains(response, 'data-device-type="3"')
+		self.assertContains(response, plotly_bundle_path())
+		self.assertNotContains(response, '<iframe')
+
+
+class LiveUpdatesTests(TestCase):
+	def setUp(self):
+		self.override = self.settings(LIVE_UPDATE_SECONDS=3600, RING_BUFFER_ENABLED=False)
+		self.override.enable()
+		self.broadcaster = live.Broadcaster()
+		self.patch = mock.patch.object(live, 'broadcaster', self.broadcaster)
+		self.patch.start()
+
+	def tearDown(self):
+		liveness.flush()
+		self.patch.stop()
+		self.override.disable()
+
+	async def _subscribe(self, device_types=None):
+		return self.broadcaster.subscribe(device_types)
+
+	def _event(self, subscriber):
+		message = subscriber.queue.get_nowait().decode('utf-8')
+		self.assertTrue(message.startswith('event: readings\ndata: '))
+		return json.loads(message.split('data: ', 1)[1])
+
+	def test_one_event_per_type_is_shared_by_every_subscriber(self):
+		water = asyncio.run(self._subscribe({DeviceTypes.water}))
+		everything = asyncio.run(self._subscribe())
+		now = timezone.now()
+		self.broadcaster.publish(1, DeviceTypes.water, now - timedelta(seconds=1), 1.5)
+		self.broadcaster.publish(1, DeviceTypes.water, now, 2.0)
+		self.broadcaster.publish(2, DeviceTypes.gas, now, 0.25)
+
+		self.assertEqual(asyncio.run(self.broadcaster.flush()), 2)
+
+		self.assertEqual(water.queue.qsize(), 1)
+		self.assertEqual(everything.queue.qsize(), 2)
+		event = self._event(water)
+		self.assertEqual(event['type'], DeviceTypes.water)
+		self.assertEqual(event['series'][0]['id'], 1)
+		self.assertEqual(event['series'][0]['v'], [1.5, 2.0])
+		self.assertEqual(event['series'][0]['t'][1] - event['series'][0]['t'][0], 1000)
+		# Nada pendente: o próximo tick não envia eventos
+		self.assertEqual(asyncio.run(self.broadcaster.flush()), 0)
+
+	def test_slow_subscriber_keeps_only_the_newest_events(self):
+		with self.settings(LIVE_QUEUE_SIZE=2):
+			subscriber = asyncio.run(self._subscribe())
+			for value in (1.0, 2.0, 3.0):
+				self.broadcaster.publish(1, DeviceTypes.water, timezone.now(), value)
+				asyncio.run(self.broadcaster.flush())
+
+		self.assertEqual([self._event(subscriber)['series'][0]['v'] for _ in range(2)], [[2.0], [3.0]])
+
+	def test_store_data_feeds_the_broadcaster_only_while_someone_listens(self):
+		device = Device.objects.create(
+			name="Water-1", type=DeviceTypes.water, is_authorized=AuthTypes.Authorized, api_token="token-1",
+		)
+
+		def store(value):
+			with self.captureOnCommitCallbacks(execute=True):
+				self.assertEqual(storeData(store_data_request(value)).status_code, 200)
+
+		store(1.0)
+		self.assertEqual(asyncio.run(self.broadcaster.flush()), 0)
+
+		subscriber = asyncio.run(self._subscribe())
+		# Leitura desfeita não chega aos clientes
+		with self.captureOnCommitCallbacks(execute=True), self.assertRaises(DatabaseError):
+			with transaction.atomic():
+				storeData(store_data_request(9.0))
+				raise DatabaseError("rollback")
+		store(4.5)
+		asyncio.run(self.broadcaster.flush())
+		self.assertEqual(self._event(subscriber)['series'], [
+			{'id': device.id, 't': mock.ANY, 'v': [4.5]},
+		])
+
+	def test_stream_sends_retry_events_and_unsubscribes_on_close(self):
+		async def read():
+			stream = live.event_stream()
+			first = await anext(stream)
+			self.assertEqual(self.broadcaster.subscribers, 1)
+			self.broadcaster.publish(1, DeviceTypes.energy, timezone.now(), 3.0)
+			await self.broadcaster.flush()
+			second = await anext(stream)
+			await stream.aclose()
+			return first, second
+
+		first, second = asyncio.run(read())
+
+		self.assertEqual(first, b"retry: 5000\n\n")
+		self.assertIn(b'"type":2', second)
+		self.assertEqual(self.broadcaster.subscribers, 0)
+
+	def test_view_streams_under_asgi_only(self):
+		self.assertEqual(asyncio.run(live_readings(RequestFactory().get('/api/live'))).status_code, 503)
+
+		async def get(**params):
+			return await live_readings(AsyncRequestFactory().get('/api/live', params))
+
+		self.assertEqual(asyncio.run(get(type='9')).status_code, 400)
+		response = asyncio.run(get(type='1'))
+		self.assertEqual(response['Content-Type'], 'text/event-stream')
+		self.assertEqual(response['X-Accel-Buffering'], 'no')
+
+	def test_several_workers_require_the_shared_buffer(self):
+		async def get():
+			return await live_readings(AsyncRequestFactory().get('/api/live'))
+
+		with self.settings(WEB_CONCURRENCY=3):
+			# Cada worker perderia as leituras recebidas pelos outros
+			self.assertEqual(asyncio.run(get()).status_code, 503)
+			with self.settings(RING_BUFFER_ENABLED=True):
+				self.assertEqual(asyncio.run(get())['Content-Type'], 'text/event-stream')
+
+
+class DownsamplingTests(TestCase):
+	def test_lttb_keeps_edges_and_peaks(self):
+		x = numpy.arange(10000)
+		y = numpy.sin(x / 500.0)
+		y[4321] = 50.0
+
+		kept = lttb_indices(x, y, 100)
+
+		self.assertEqual(len(kept), 100)
+		self.assertEqual(kept[0], 0)
+		self.assertEqual(kept[-1], 9999)
+		self.assertIn(4321, kept)
+		self.assertTrue(numpy.all(numpy.diff(kept) > 0))
+
+	def test_short_series_are_untouched(self):
+		self.assertEqual(list(lttb_indices(numpy.arange(5), numpy.ones(5), 100)), [0, 1, 2, 3, 4])
+
+	def test_large_charts_switch_to_webgl(self):
+		times = numpy.arange('2024-01-01T00:00', '2024-01-02T00:00', dtype='datetime64[m]').astype('datetime64[us]')
+		series = {f"Energy-{index}": (times, numpy.random.rand(len(times))) for index in range(3)}
+
+		with self.settings(GRAPH_TARGET_POINTS=500, GRAPH_WEBGL_THRESHOLD=1000):
+			figure = _line_chart_figure(series, 'Consumo(Watts)')
+		self.assertEqual({trace.type for trace in figure.data}, {'scattergl'})
+		self.assertEqual(len(figure.data[0].x), 500)
+
+		with self.settings(GRAPH_TARGET_POINTS=500, GRAPH_WEBGL_THRESHOLD=5000):
+			figure = _line_chart_figure(series, 'Consumo(Watts)')
+		self.assertEqual({trace.type for trace in figure.data}, {'scatter'})
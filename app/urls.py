@@ -15,7 +15,7 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     ## General
@@ -27,6 +27,14 @@ urlpatterns = [
     ## API related
     path('api/authenticate', views.authenticateDevice, name='Authenticate Device'),
     path('api/store-data', views.storeData, name='Receive Data'),
+    path('api/chart-data', views.chart_data, name='Chart Data'),
+    path('api/live', views.live_readings, name='Live Readings'),
+    path('api/export', views.export_data, name='Export Data'),
+    path('api/devices', api.devices, name='Devices API'),
+    path('api/readings', api.readings, name='Readings API'),
+    path('api/aggregate', api.aggregate, name='Aggregate API'),
+    path('api/consumption', api.consumption, name='Consumption API'),
+    path('metrics', views.prometheus_metrics, name='Metrics'),
     ## Devices related
     path('device-create', views.device_create, name="Create Device"),
     path('device-list', views.device_list, name='device_list'),
@@ -1,19 +1,36 @@
+from django.conf import settings
+from django.core.cache import cache
 from django.forms import ValidationError
-from .graphs import generateAllMotes24hRaw
+from django.utils.cache import patch_cache_control
+from .graphs import CHART_RANGES, COLLECTION_UNITS, chart_payload, chart_style
+from .finders import plotly_bundle_path
+from .device_charts import DEFAULT_DEVICE_CHART_RANGE, DEVICE_CHART_RANGES, device_chart
+from .exports import FORMATS, ExportError, export_filename, export_queryset, export_stream
+from .graph_specs import GRAPH_SPECS
+from .consumption import consumption_panels
 from django.contrib.auth.decorators import login_required, user_passes_test
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 import uuid
-from .models import Device, DeviceLog, Data, Graph, ExtendUser, New
+from .models import Device, DeviceLog, DeviceTypes, Data, Graph, ExtendUser, New
 import os
 from dotenv import load_dotenv
 import json
+from functools import partial, update_wrapper
 
 from .validation import validate
+from . import anomalies, live, liveness, ring_buffer
+from .caching import cache_public_page, cache_version, fragment_context
+from .db_router import reporting
+from .metrics import update_graph_render_stats, update_liveness_stats
 
 from django.contrib.auth import authenticate, login, logout
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
 
 load_dotenv()
 
@@ -25,18 +42,31 @@ from .forms import DeviceForm
 
 ## General pages
 
+@cache_public_page()
 def index(request):
     return render(request, 'home.html')
 
 
+@cache_public_page('graphs', 'consumption')
+@reporting
 def dashboard(request):
-    allWMotes24hRaw = Graph.objects.get(type=1)
-    allEMotes24hRaw = Graph.objects.get(type=2)
-    allGMotes24hRaw = Graph.objects.get(type=3)
+    if request.GET.get('mode', settings.DASHBOARD_MODE) == 'live':
+        # Gráficos desenhados no navegador a partir de /api/chart-data
+        return render(request, 'dashboard.html', {
+            'live': True,
+            'plotly_bundle': plotly_bundle_path(),
+            'chart_styles': {device_type: chart_style(unit) for device_type, unit in COLLECTION_UNITS.items()},
+            'refresh_seconds': settings.CHART_DATA_CACHE_SECONDS,
+            'consumption_panels': consumption_panels(),
+        })
 
-    return render(request, 'dashboard.html', {'wMote': allWMotes24hRaw, 'eMote': allEMotes24hRaw, 'gMote': allGMotes24hRaw})
+    graphs = {graph.key: graph for graph in Graph.objects.filter(key__in=[spec.key for spec in GRAPH_SPECS])}
 
+    return render(request, 'dashboard.html', {'graphs': graphs, 'consumption_panels': consumption_panels()})
+
+@cache_public_page('members')
 def members(request):
+    # Consultas avaliadas só dentro do fragmento em cache do template
     advisors = ExtendUser.objects.all().filter(
         is_advisor=True).order_by('username')
     activeMembers = ExtendUser.objects.all().filter(
@@ -45,14 +75,16 @@ def members(request):
         is_active=False, is_advisor=False).order_by('username')
 
     return render(request, 'members.html',
-                  {'advisors': advisors, 'activeMembers': activeMembers, 'oldMembers': oldMembers})
+                  {'advisors': advisors, 'activeMembers': activeMembers, 'oldMembers': oldMembers,
+                   **fragment_context('members')})
 
+@cache_public_page('news')
 def news(request):
     internNews = New.objects.select_related(
         'user').order_by('created_at').reverse()
     gitToken = os.getenv("GITTOKEN")
 
-    return render(request, 'news.html', {'internNews': internNews, 'gitToken': gitToken})
+    return render(request, 'news.html', {'internNews': internNews, 'gitToken': gitToken, **fragment_context('news')})
 
 ## User pages functions
 
@@ -186,34 +218,75 @@ def device_create(request):
         form = DeviceForm()
     return render(request, 'device_create.html', {'form': form})
 
+def _device_filter_options():
+    """Distinct locations and sections offered by the device_list filters."""
+    # Invalidado pelos sinais de Device (app/signals.py); storeData usa update() e não invalida
+    key = f"device-filter-options:{cache_version('devices')}"
+    options = cache.get(key)
+    if options is None:
+        options = {
+            'locations': list(Device.objects.exclude(location__isnull=True).exclude(location='').order_by('location').values_list('location', flat=True).distinct()),
+            'sections': list(Device.objects.exclude(section__isnull=True).exclude(section='').order_by('section').values_list('section', flat=True).distinct()),
+        }
+        cache.set(key, options, settings.PAGE_CACHE_SECONDS)
+    return options
+
+
+@reporting
 def device_list(request):
     filter_type = request.GET.get('filter_type', '')
     filter_location = request.GET.get('filter_location', '')
     filter_section = request.GET.get('filter_section', '')
     filter_authorized = request.GET.get('filter_authorized', '')
+    filter_online = request.GET.get('filter_online', '')
+    after = request.GET.get('after', '')
 
     devices = Device.objects.all()
 
-    if filter_type:
-        devices = devices.filter(type=filter_type)
+    if filter_type.isdigit():
+        devices = devices.filter(type=int(filter_type))
     if filter_location:
         devices = devices.filter(location=filter_location)
     if filter_section:
         devices = devices.filter(section=filter_section)
-    if filter_authorized:
-        devices = devices.filter(is_authorized=(filter_authorized == 'true'))
-
-    locations = Device.objects.values_list('location', flat=True).distinct()
-    sections = Device.objects.values_list('section', flat=True).distinct()
+    if filter_authorized.isdigit():
+        devices = devices.filter(is_authorized=int(filter_authorized))
+    offline_cutoff = liveness.offline_cutoff()
+    if filter_online == 'online':
+        devices = devices.filter(liveness.online_q())
+    elif filter_online == 'offline':
+        devices = devices.exclude(liveness.online_q())
+
+    # Paginação por chave (id > último da página anterior): custo constante em qualquer página
+    if after.isdigit():
+        devices = devices.filter(id__gt=int(after))
+    page_size = settings.DEVICE_LIST_PAGE_SIZE
+    page = list(devices.order_by('id')[:page_size + 1])
+
+    next_query = None
+    if len(page) > page_size:
+        page = page[:page_size]
+        query = request.GET.copy()
+        query['after'] = page[-1].id
+        next_query = query.urlencode()
+
+    first_query = None
+    if after:
+        query = request.GET.copy()
+        query.pop('after')
+        first_query = query.urlencode()
 
     context = {
-        'devices': devices,
-        'locations': locations,
-        'sections': sections,
+        'devices': page,
+        'next_query': next_query,
+        'first_query': first_query,
         'filter_type': filter_type,
         'filter_location': filter_location,
         'filter_section': filter_section,
         'filter_authorized': filter_authorized,
+        'filter_online': filter_online,
+        'offline_cutoff': offline_cutoff,
+        **_device_filter_options(),
     }
     return render(request, 'device_list.html', context)
 
@@ -231,9 +304,22 @@ def edit_device(request, device_id):
     return render(request, 'edit_device.html', context)
         
 
+@reporting
 def device_detail(request, device_id):
     device = get_object_or_404(Device, id=device_id)
-    return render(request, 'device_detail.html', {'device': device})
+
+    range_key = request.GET.get('range', DEFAULT_DEVICE_CHART_RANGE)
+    if range_key not in DEVICE_CHART_RANGES:
+        range_key = DEFAULT_DEVICE_CHART_RANGE
+
+    return render(request, 'device_detail.html', {
+        'device': device,
+        'online': liveness.is_online(device),
+        'chart': device_chart(device, range_key),
+        'chart_ranges': list(DEVICE_CHART_RANGES),
+        'chart_range': range_key,
+        'plotly_bundle': plotly_bundle_path(),
+    })
   
 # API
 
@@ -285,6 +371,11 @@ def authenticateDevice(request):
 
             return Response({'message': 'device registered, await authorization'}, status=status.HTTP_201_CREATED)
 
+def _after_commit(func, *args):
+    """Run `func(*args)` once the reading commits; errors are logged, never sent to the device."""
+    # O Django registra a falha pelo __qualname__, que um partial sozinho não tem
+    transaction.on_commit(update_wrapper(partial(func, *args), func), robust=True)
+
 @api_view(['POST'])
 def storeData(request):
     if request.method == "POST":
@@ -301,21 +392,42 @@ def storeData(request):
         return Response({'message': 'device not authorized.'}, status=status.HTTP_401_UNAUTHORIZED)
     
     if apiToken and measure is not None:
-        for i in measure:
-            device = Device.objects.get(api_token=apiToken)
+        # Uma transação por requisição: a leitura do último total e a inserção
+        # ficam sob o mesmo lock de escrita (BEGIN IMMEDIATE no SQLite ajustado)
+        with transaction.atomic():
+            last_reading = None
+            observed = []
+            for i in measure:
+                device = Device.objects.get(api_token=apiToken)
         
-            try:
-                total = Data.objects.all().filter(device=device, type=i["type"]).order_by('id').reverse()
+                try:
+                    # Só a última linha do tipo é lida, pelo índice (device, type, id)
+                    total = Data.objects.filter(device=device, type=i["type"]).order_by('-id').values_list('total', flat=True).first()
                 
-                if total:
-                    storeData = Data(device=device, type=i["type"], last_collection=float(i["value"]), total=(float(total[0].total) + float(i["value"])))
-                    storeData.save()
-                else: 
-                    storeData = Data(device=device, type=i["type"], last_collection=float(i["value"]), total=float(i["value"]))
-                    storeData.save()
+                    if total is not None:
+                        storeData = Data(device=device, type=i["type"], last_collection=float(i["value"]), total=(float(total) + float(i["value"])))
+                        storeData.save()
+                    else: 
+                        storeData = Data(device=device, type=i["type"], last_collection=float(i["value"]), total=float(i["value"]))
+                        storeData.save()
                 
-            except:
-                return Response({'message': 'something went wrong.'}, status=status.HTTP_400_BAD_REQUEST)
+                except:
+                    return Response({'message': 'something went wrong.'}, status=status.HTTP_400_BAD_REQUEST)
+
+                # Outros workers e os clientes de /api/live só veem a leitura depois que ela estiver no banco;
+                # uma falha depois do commit não pode virar erro para o dispositivo, que reenviaria a leitura
+                _after_commit(ring_buffer.record, device.id, storeData.type, storeData.collect_date, storeData.last_collection)
+                _after_commit(live.publish, device.id, device.type, storeData.collect_date, storeData.last_collection)
+                observed.append((int(storeData.type), storeData.collect_date, storeData.last_collection))
+                last_reading = storeData
+
+            if observed:
+                # Só leituras gravadas alimentam o detector
+                _after_commit(anomalies.observe, last_reading.device_id, device.type, observed)
+
+        if last_reading is not None:
+            # Estado exibido pela device_list: gravado em lote a cada LIVENESS_FLUSH_SECONDS
+            liveness.touch(last_reading.device_id, last_reading.collect_date, last_reading.last_collection)
         
         return Response({'message': 'data stored.'}, status=status.HTTP_200_OK)
 
@@ -324,6 +436,88 @@ def storeData(request):
 
 
 
+@reporting
+def chart_data(request):
+    device_type = request.GET.get('type', '')
+    range_key = request.GET.get('range', '24h')
+
+    if not device_type.isdigit() or int(device_type) not in COLLECTION_UNITS or range_key not in CHART_RANGES:
+        return JsonResponse({'message': 'invalid type or range.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    cache_key = f"chart-data:{device_type}:{range_key}"
+    payload = cache.get(cache_key)
+    if payload is None:
+        payload = chart_payload(int(device_type), range_key)
+        cache.set(cache_key, payload, settings.CHART_DATA_CACHE_SECONDS)
+
+    response = JsonResponse(payload)
+    patch_cache_control(response, public=True, max_age=settings.CHART_DATA_CACHE_SECONDS)
+    return response
+
+
+async def live_readings(request):
+    if not isinstance(request, ASGIRequest):
+        # Sob WSGI cada conexão aberta prenderia um worker
+        return JsonResponse({'message': 'live updates require the ASGI server.'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    if settings.WEB_CONCURRENCY > 1 and not settings.RING_BUFFER_ENABLED:
+        # O broadcaster de cada worker só veria as leituras recebidas por ele
+        return JsonResponse(
+            {'message': 'live updates with several workers require RING_BUFFER_ENABLED=True.'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+
+    device_types = request.GET.getlist('type')
+    if any(not device_type.isdigit() or int(device_type) not in COLLECTION_UNITS for device_type in device_types):
+        return JsonResponse({'message': 'invalid type.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    response = StreamingHttpResponse(
+        live.event_stream({int(device_type) for device_type in device_types}),
+        content_type='text/event-stream',
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@login_required(login_url='/login')
+def export_data(request):
+    dataset = request.GET.get('dataset', 'data')
+    file_format = request.GET.get('format', 'csv')
+    compress = request.GET.get('compress') == 'gzip'
+
+    try:
+        queryset = export_queryset(
+            dataset,
+            devices=request.GET.getlist('device'),
+            types=request.GET.getlist('type'),
+            intervals=request.GET.getlist('interval'),
+            date_from=request.GET.get('from'),
+            date_to=request.GET.get('to'),
+        )
+        chunks = export_stream(dataset, queryset, file_format, compress)
+    except ExportError as error:
+        return JsonResponse({'message': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+    response = StreamingHttpResponse(chunks, content_type='application/gzip' if compress else FORMATS[file_format][0])
+    response.headers['Content-Disposition'] = f'attachment; filename="{export_filename(dataset, file_format, compress)}"'
+    # O nginx repassa cada lote assim que é gerado, sem acumular a resposta
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def prometheus_metrics(request):
+    # Os gráficos são gerados pelo cron, em outro processo; a duração fica no banco
+    for file_path, seconds in Graph.objects.filter(render_seconds__isnull=False).values_list('file_path', 'render_seconds'):
+        update_graph_render_stats(file_path, seconds)
+
+    # Leituras acumuladas neste worker entram na contagem
+    liveness.flush()
+    for device_type, (online, offline) in liveness.liveness_counts().items():
+        update_liveness_stats(DeviceTypes(device_type).name, online, offline)
+
+    return HttpResponse(generate_latest(), content_type=CONTENT_TYPE_LATEST)
+
+
 ## Exceptions
 def page_in_erro403(request, exception):
     return render(request, 'error_403.html', status=403)
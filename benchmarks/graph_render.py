@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""
+Benchmark de renderização dos gráficos em função da quantidade de pontos.
+
+Mede tempo de geração e tamanho do HTML de _write_line_chart com e sem o
+downsampling LTTB (GRAPH_TARGET_POINTS) e indica quando o gráfico passa a
+usar WebGL (Scattergl).
+
+Execute com: python3 benchmarks/graph_render.py --devices 10
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'morea_ds.settings')
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+import django
+
+django.setup()
+
+import numpy
+from django.test.utils import override_settings
+
+from app.graphs import _downsample_series, _use_webgl, _write_line_chart
+
+
+def build_series(devices, points):
+    start = numpy.datetime64('2024-01-01T00:00:00', 'us')
+    step = numpy.timedelta64(int(86400e6 / points), 'us')
+    times = start + numpy.arange(points) * step
+    rng = numpy.random.default_rng(42)
+    return {
+        f"Mote-{index}": (times, numpy.abs(numpy.cumsum(rng.normal(size=points))))
+        for index in range(devices)
+    }
+
+
+def render(series, target_points, path, repeat=5):
+    """Best of `repeat` runs, so plotly's lazy imports do not count."""
+    with override_settings(GRAPH_TARGET_POINTS=target_points):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            _write_line_chart(series, 'Consumo(L)', path)
+            timings.append(time.perf_counter() - started)
+        webgl = _use_webgl(_downsample_series(series))
+    return min(timings), os.path.getsize(path), webgl
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--devices', type=int, default=10)
+    parser.add_argument('--target', type=int, default=1000)
+    parser.add_argument('--points', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="morea-graph-bench-"), 'graph.html')
+    print(f"{args.devices} dispositivos, alvo LTTB {args.target} pontos por série")
+    print(f"{'pontos/série':>12} | {'sem LTTB':>22} | {'com LTTB':>22} | WebGL")
+
+    for points in args.points:
+        series = build_series(args.devices, points)
+        raw_time, raw_size, raw_webgl = render(series, None, path)
+        lttb_time, lttb_size, lttb_webgl = render(series, args.target, path)
+        print(
+            f"{points:>12} | {raw_time * 1000:8.0f} ms {raw_size / 1024:8.0f} KiB | "
+            f"{lttb_time * 1000:8.0f} ms {lttb_size / 1024:8.0f} KiB | "
+            f"{'sim' if raw_webgl else 'não'} -> {'sim' if lttb_webgl else 'não'}"
+        )
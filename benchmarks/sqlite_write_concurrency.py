@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+"""
+Benchmark de escrita concorrente no SQLite, imitando o caminho do storeData.
+
+Cada processo simula um worker do gunicorn: lê o último total do
+dispositivo/tipo e insere uma nova leitura, em uma transação por requisição.
+Compara o SQLite padrão (journal DELETE, BEGIN adiado) com o perfil de
+app/backends/sqlite3 (WAL, synchronous=NORMAL, busy_timeout, BEGIN IMMEDIATE).
+
+Execute com: python3 benchmarks/sqlite_write_concurrency.py --workers 4 --requests 300
+"""
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.backends.sqlite3.base import DEFAULT_PRAGMAS
+
+SCHEMA = """
+CREATE TABLE app_data (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    device_id INTEGER,
+    type INTEGER,
+    last_collection REAL,
+    total REAL,
+    collect_date TEXT
+);
+CREATE INDEX data_device_type_id_idx ON app_data (device_id, type, id);
+"""
+
+
+def connect(path, tuned):
+    # isolation_level=None: autocommit, como o Django faz no SQLite
+    conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+    if tuned:
+        for name, value in DEFAULT_PRAGMAS.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+def worker(path, tuned, device_id, requests, results):
+    conn = connect(path, tuned)
+    begin = "BEGIN IMMEDIATE" if tuned else "BEGIN"
+    latencies = []
+    errors = 0
+
+    for _ in range(requests):
+        started = time.perf_counter()
+        try:
+            conn.execute(begin)
+            row = conn.execute(
+                "SELECT total FROM app_data WHERE device_id = ? AND type = ? ORDER BY id DESC LIMIT 1",
+                (device_id, 1),
+            ).fetchone()
+            total = (row[0] if row else 0) + 1.0
+            conn.execute(
+                "INSERT INTO app_data (device_id, type, last_collection, total, collect_date) "
+                "VALUES (?, ?, ?, ?, datetime('now'))",
+                (device_id, 1, 1.0, total),
+            )
+            conn.execute("COMMIT")
+            latencies.append(time.perf_counter() - started)
+        except sqlite3.OperationalError:
+            # "database is locked": o sensor receberia 400 e perderia a leitura
+            errors += 1
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+
+    conn.close()
+    results.put((latencies, errors))
+
+
+def run(tuned, workers, requests):
+    directory = tempfile.mkdtemp(prefix="morea-sqlite-bench-")
+    path = os.path.join(directory, "db.sqlite3")
+    conn = connect(path, tuned)
+    conn.executescript(SCHEMA)
+    conn.close()
+
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=worker, args=(path, tuned, device_id, requests, results))
+        for device_id in range(1, workers + 1)
+    ]
+
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for worker_latencies, _ in collected for latency in worker_latencies)
+    errors = sum(worker_errors for _, worker_errors in collected)
+    p99 = latencies[int(len(latencies) * 0.99) - 1] if latencies else 0
+
+    print(
+        f"{'ajustado' if tuned else 'padrão':>9}: "
+        f"{len(latencies) / elapsed:8.1f} escritas/s | "
+        f"p99 {p99 * 1000:7.1f} ms | "
+        f"{errors} 'database is locked' de {workers * requests}"
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=300)
+    args = parser.parse_args()
+
+    run(False, args.workers, args.requests)
+    run(True, args.workers, args.requests)
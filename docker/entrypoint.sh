@@ -18,5 +18,14 @@ python manage.py collectstatic --noinput --clear || {
     echo "Attempting to continue anyway..."
 }
 
+# Número de workers; exportado para o Django saber se /api/live tem o buffer compartilhado
+export WEB_CONCURRENCY="${WEB_CONCURRENCY:-3}"
+
+# SERVER_INTERFACE=asgi serve o app ASGI (necessário para /api/live, atualizações ao vivo por SSE)
+if [ "$SERVER_INTERFACE" = "asgi" ]; then
+    echo "Starting Gunicorn (ASGI, uvicorn workers)..."
+    exec gunicorn morea_ds.asgi:application --bind 0.0.0.0:8000 --workers "$WEB_CONCURRENCY" --worker-class uvicorn.workers.UvicornWorker
+fi
+
 echo "Starting Gunicorn..."
-exec gunicorn morea_ds.wsgi:application --bind 0.0.0.0:8000 --workers 3
+exec gunicorn morea_ds.wsgi:application --bind 0.0.0.0:8000 --workers "$WEB_CONCURRENCY"
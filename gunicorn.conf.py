@@ -0,0 +1,21 @@
+"""
+Gunicorn settings shared by the WSGI and ASGI commands of docker/entrypoint.sh.
+
+Gunicorn reads ./gunicorn.conf.py from the working directory, so the flags
+of the command line keep working and only the hooks live here.
+"""
+
+
+def post_worker_init(worker):
+    # Recarga do buffer compartilhado ao subir o worker, fora das requisições de ingestão
+    from django.db import connections
+
+    from app import ring_buffer
+
+    try:
+        ring_buffer.warm_up()
+    except Exception:
+        # Sem o buffer pronto as leituras continuam vindo do banco
+        worker.log.exception("Could not warm up the ring buffer")
+    finally:
+        connections.close_all()
@@ -2,6 +2,8 @@
 ASGI config for morea_ds project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Served with SERVER_INTERFACE=asgi (docker/entrypoint.sh); required by the
+Server-Sent Events of /api/live (app/live.py).
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
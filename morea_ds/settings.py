@@ -53,13 +53,18 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.locale.LocaleMiddleware',
+    'app.middleware.ReplicaRoutingMiddleware',
 ]
 
 ROOT_URLCONF = 'morea_ds.urls'
 
+# Os gráficos só são regravados quando os dados mudam, então a geração pode ser frequente
+GRAPHS_CRON = os.getenv("GRAPHS_CRON", "0 * * * *")
+
 CRONJOBS = [
-        ('0 3 * * *', 'app.graphs.generateAllMotes24hRaw'),
-        ('0 * * * *', 'app.data_processing.hourlyDataProcessing')
+        (GRAPHS_CRON, 'app.graphs.generateGraphs'),
+        ('0 * * * *', 'app.data_processing.hourlyDataProcessing'),
+        ('5 0 * * *', 'app.data_processing.dailyDataProcessing'),
 ]
 
 TEMPLATES = [
@@ -97,6 +102,14 @@ if (os.getenv("DBTYPE") == "MySQL"):
         }
     }
 
+    # Pool de conexões por worker (app/backends/mysql); DB_POOL_SIZE=0 desativa
+    if int(os.getenv("DB_POOL_SIZE", "4")) > 0:
+        DATABASES['default']['ENGINE'] = 'app.backends.mysql'
+        DATABASES['default']['POOL'] = {
+            'SIZE': int(os.getenv("DB_POOL_SIZE", "4")),
+            'TIMEOUT': float(os.getenv("DB_POOL_TIMEOUT", "10")),
+        }
+
 elif (os.getenv("DBTYPE") == "SQLite3"):
     DATABASES = {
         'default': {
@@ -104,6 +117,17 @@ elif (os.getenv("DBTYPE") == "SQLite3"):
             'NAME': os.path.join(BASE_DIR / 'db.sqlite3'),
         }
     }
+
+    # Perfil para um único nó (Raspberry Pi): WAL, synchronous=NORMAL,
+    # busy_timeout e transações BEGIN IMMEDIATE (app/backends/sqlite3)
+    if (os.getenv("SQLITE_TUNED") == "True"):
+        DATABASES['default']['ENGINE'] = 'app.backends.sqlite3'
+        DATABASES['default']['PRAGMAS'] = {
+            'busy_timeout': int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+            'mmap_size': int(os.getenv("SQLITE_MMAP_SIZE", str(64 * 1024 * 1024))),
+            'cache_size': -int(os.getenv("SQLITE_CACHE_SIZE_KB", "16000")),
+        }
+        CRONJOBS.append(('*/15 * * * *', 'app.db_maintenance.sqliteMaintenance'))
 else:
     DATABASES = {
         'default': {
@@ -113,6 +137,132 @@ else:
     }
 
 
+# Réplica de leitura opcional para dashboards, listagens e cron jobs (app/db_router.py).
+# MySQL: DBREPLICA_HOST/DBREPLICA_PORT. SQLite (teste local): DBREPLICA_NAME com o
+# caminho de um segundo arquivo (ex.: cópia do db.sqlite3).
+if os.getenv("DBREPLICA_HOST") or os.getenv("DBREPLICA_NAME"):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.getenv("DBREPLICA_HOST", DATABASES['default'].get('HOST')),
+        'PORT': os.getenv("DBREPLICA_PORT", DATABASES['default'].get('PORT')),
+        'NAME': os.getenv("DBREPLICA_NAME", DATABASES['default']['NAME']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['app.db_router.PrimaryReplicaRouter']
+
+# Segundos em que o navegador continua lendo do primário depois de uma escrita
+REPLICA_PIN_SECONDS = int(os.getenv("REPLICA_PIN_SECONDS", "15"))
+
+
+# Conexões persistentes: reaproveitadas entre requisições por DB_CONN_MAX_AGE
+# segundos e verificadas antes do uso para não falhar com conexão derrubada
+for database in DATABASES.values():
+    database['CONN_MAX_AGE'] = int(os.getenv("DB_CONN_MAX_AGE", "60"))
+    database['CONN_HEALTH_CHECKS'] = os.getenv("DB_CONN_HEALTH_CHECKS", "True") == "True"
+
+
+# Buffer circular em memória compartilhada com as leituras recentes (app/ring_buffer.py)
+# Todos os workers do nó leem a janela recente sem consultar o banco. O segmento é
+# recarregado do banco quando um worker do gunicorn sobe (gunicorn.conf.py).
+RING_BUFFER_ENABLED = os.getenv("RING_BUFFER_ENABLED") == "True"
+RING_BUFFER_NAME = os.getenv("RING_BUFFER_NAME", "morea-recent-readings")
+RING_BUFFER_SLOTS = int(os.getenv("RING_BUFFER_SLOTS", "512"))
+RING_BUFFER_CAPACITY = int(os.getenv("RING_BUFFER_CAPACITY", "2048"))
+RING_BUFFER_WINDOW_HOURS = int(os.getenv("RING_BUFFER_WINDOW_HOURS", "24"))
+
+
+# Cache: 'locmem' (padrão, um por processo), 'file' (CACHE_LOCATION: diretório, pode ser
+# um volume compartilhado), 'redis' ou 'memcached' (CACHE_LOCATION: endereço do servidor).
+# Com backends compartilhados a invalidação por signals (app/signals.py) alcança todos
+# os workers e nós do swarm.
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "locmem")
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'morea'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', '/var/tmp/morea_cache'),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379'),
+    'memcached': ('django.core.cache.backends.memcached.PyMemcacheCache', '127.0.0.1:11211'),
+}
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND][0],
+        'LOCATION': os.getenv("CACHE_LOCATION", CACHE_BACKENDS[CACHE_BACKEND][1]),
+        'KEY_PREFIX': 'morea',
+    }
+}
+
+# Páginas públicas em cache para visitantes anônimos (app/caching.py)
+PAGE_CACHE_SECONDS = int(os.getenv("PAGE_CACHE_SECONDS", "600"))
+
+# Cubos de consumo (app/consumption.py): dias calculados na primeira execução e
+# horas recalculadas a cada execução para incluir leituras atrasadas
+CONSUMPTION_CUBE_BACKFILL_DAYS = int(os.getenv("CONSUMPTION_CUBE_BACKFILL_DAYS", "30"))
+CONSUMPTION_CUBE_LATE_HOURS = int(os.getenv("CONSUMPTION_CUBE_LATE_HOURS", "2"))
+
+# Dispositivos por página na device_list
+DEVICE_LIST_PAGE_SIZE = int(os.getenv("DEVICE_LIST_PAGE_SIZE", "50"))
+
+# Última leitura dos dispositivos (app/liveness.py): gravada em lote a cada
+# LIVENESS_FLUSH_SECONDS; sem leituras há LIVENESS_OFFLINE_MINUTES o dispositivo está offline
+LIVENESS_FLUSH_SECONDS = float(os.getenv("LIVENESS_FLUSH_SECONDS", "30"))
+LIVENESS_OFFLINE_MINUTES = int(os.getenv("LIVENESS_OFFLINE_MINUTES", "15"))
+
+# Detecção de anomalias nas leituras recebidas (app/anomalies.py): média e variância
+# móveis (EWMA) por dispositivo e tipo, em DetectorState; leituras com |z| >= ANOMALY_Z_THRESHOLD viram Anomaly
+ANOMALY_DETECTION = os.getenv("ANOMALY_DETECTION", "True") == "True"
+ANOMALY_ALPHA = float(os.getenv("ANOMALY_ALPHA", "0.05"))
+ANOMALY_Z_THRESHOLD = float(os.getenv("ANOMALY_Z_THRESHOLD", "4"))
+ANOMALY_WARMUP_SAMPLES = int(os.getenv("ANOMALY_WARMUP_SAMPLES", "30"))
+ANOMALY_MIN_STD = float(os.getenv("ANOMALY_MIN_STD", "0.01"))
+
+# Exportação de Data/ProcessedData (app/exports.py): linhas lidas por consulta
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))
+
+# API de leitura (app/api.py): itens por página e limite do parâmetro page_size
+API_PAGE_SIZE = int(os.getenv("API_PAGE_SIZE", "500"))
+API_MAX_PAGE_SIZE = int(os.getenv("API_MAX_PAGE_SIZE", "5000"))
+
+
+# Dashboard: 'static' usa os HTML gerados pelo cron; 'live' desenha no navegador
+# a partir de /api/chart-data, com dados em cache por CHART_DATA_CACHE_SECONDS
+DASHBOARD_MODE = os.getenv("DASHBOARD_MODE", "static")
+CHART_DATA_CACHE_SECONDS = int(os.getenv("CHART_DATA_CACHE_SECONDS", "60"))
+
+# Atualizações ao vivo do dashboard por SSE (/api/live, app/live.py; requer o app ASGI):
+# um evento por tipo de dispositivo a cada LIVE_UPDATE_SECONDS, com no máximo
+# LIVE_MAX_POINTS pontos por dispositivo; clientes lentos guardam LIVE_QUEUE_SIZE eventos
+LIVE_UPDATE_SECONDS = float(os.getenv("LIVE_UPDATE_SECONDS", "5"))
+LIVE_MAX_POINTS = int(os.getenv("LIVE_MAX_POINTS", "60"))
+LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", "32"))
+# Workers do servidor (o gunicorn lê a mesma variável). Cada worker tem o seu broadcaster:
+# com mais de um, /api/live só responde com RING_BUFFER_ENABLED=True
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+# Gráficos por dispositivo (device_detail): validade no cache e tempo máximo que
+# uma requisição espera enquanto outra renderiza o mesmo gráfico
+DEVICE_CHART_CACHE_SECONDS = int(os.getenv("DEVICE_CHART_CACHE_SECONDS", "300"))
+DEVICE_CHART_LOCK_SECONDS = int(os.getenv("DEVICE_CHART_LOCK_SECONDS", "30"))
+
+# Cada série é reduzida a GRAPH_TARGET_POINTS pontos (LTTB); gráficos com mais de
+# GRAPH_WEBGL_THRESHOLD pontos no total são desenhados com WebGL (Scattergl)
+GRAPH_TARGET_POINTS = int(os.getenv("GRAPH_TARGET_POINTS", "1000"))
+GRAPH_WEBGL_THRESHOLD = int(os.getenv("GRAPH_WEBGL_THRESHOLD", "10000"))
+
+# Processos usados para renderizar os gráficos em paralelo (1 = no próprio processo)
+GRAPH_WORKERS = int(os.getenv("GRAPH_WORKERS", str(os.cpu_count() or 1)))
+
+
+# Particionamento mensal da tabela Data (somente MySQL, ver app/partitioning.py)
+# Ative com DATA_PARTITIONING=True e execute `python manage.py partition_data --setup` uma vez.
+DATA_PARTITIONING = os.getenv("DATA_PARTITIONING") == "True"
+DATA_PARTITION_AHEAD_MONTHS = int(os.getenv("DATA_PARTITION_AHEAD_MONTHS", "3"))
+DATA_RETENTION_MONTHS = int(os.getenv("DATA_RETENTION_MONTHS", "0"))
+
+# Pelo DBTYPE: com o pool de conexões o ENGINE é app.backends.mysql
+if DATA_PARTITIONING and os.getenv("DBTYPE") == "MySQL":
+    CRONJOBS.append(('30 2 * * *', 'django.core.management.call_command', ['partition_data']))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -180,8 +330,23 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
 STATICFILES_FINDERS = [
     'django.contrib.staticfiles.finders.FileSystemFinder',
     'django.contrib.staticfiles.finders.AppDirectoriesFinder',
+    # plotly.js versionado, compartilhado por todos os gráficos (app/finders.py)
+    'app.finders.PlotlyBundleFinder',
 ]
 
+# collectstatic grava nomes com hash do conteúdo (cache de um ano) e variantes .gz/.br
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "app.storage.CompressedManifestStaticFilesStorage"},
+}
+
+# Entrega de estáticos e media (app/file_serving.py): 'django' envia pelo próprio
+# worker; 'x-accel' delega ao nginx via X-Accel-Redirect (locations internas em
+# config/morea.conf); 'sendfile' usa X-Sendfile (Apache mod_xsendfile, lighttpd)
+FILE_SERVING_MODE = os.getenv("FILE_SERVING_MODE", "django")
+FILE_SERVING_ACCEL_PREFIX = os.getenv("FILE_SERVING_ACCEL_PREFIX", "/_protected/")
+FILE_STAT_CACHE_SECONDS = float(os.getenv("FILE_STAT_CACHE_SECONDS", "2"))
+
 if (os.getenv("ENVIRONMENT") == 'PROD'):
     MEDIA_ROOT = '/var/www/html/Morea/media/'
     STATIC_ROOT = '/var/www/html/Morea/static'
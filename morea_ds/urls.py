@@ -14,36 +14,23 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
-import os
+
+from app import file_serving
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('app.urls'))
 ]
 
-# Servir arquivos estáticos e media
-# Garantir que arquivos estáticos sejam sempre servidos, mesmo sem collectstatic
-from django.contrib.staticfiles.urls import staticfiles_urlpatterns
-
-# Adicionar padrões do Django que procuram em STATICFILES_DIRS
-urlpatterns += staticfiles_urlpatterns()
-
-# Servir diretamente de STATICFILES_DIRS (para desenvolvimento)
-# Isso garante que funcione mesmo sem collectstatic
-for static_dir in settings.STATICFILES_DIRS:
-    if os.path.exists(static_dir):
-        urlpatterns += static(settings.STATIC_URL, document_root=static_dir)
-        break  # Usar apenas o primeiro diretório que existir
-
-# Também servir de STATIC_ROOT se existir (após collectstatic)
-if os.path.exists(settings.STATIC_ROOT):
-    urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
-
-# Sempre servir arquivos de media
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Servir arquivos estáticos e media (app/file_serving.py): variantes .br/.gz
+# pré-comprimidas, ETag e 304. Estáticos vêm de STATIC_ROOT (após collectstatic)
+# e, sem ele, de STATICFILES_DIRS e dos finders.
+urlpatterns += [
+    re_path(r'^%s(?P<path>.*)$' % settings.STATIC_URL.lstrip('/'), file_serving.serve_static),
+    re_path(r'^%s(?P<path>.*)$' % settings.MEDIA_URL.lstrip('/'), file_serving.serve_media),
+]
 
 handler403 = 'app.views.page_in_erro403'
 handler404 = 'app.views.page_in_erro404'